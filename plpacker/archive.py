@@ -0,0 +1,135 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import namedtuple
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import time
+import zlib
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+
+from plpacker.fileset import file_stat
+
+LOGGER = logging.getLogger(__name__)
+
+# A fully compressed archive member, ready to be appended to a `ZipFile` as
+# is.
+Member = namedtuple('Member', ['arcname', 'data', 'crc', 'file_size',
+                               'compress_type', 'date_time',
+                               'external_attr'])
+
+
+def compress_file(source, arcname, compress_type=ZIP_DEFLATED,
+                  level=zlib.Z_DEFAULT_COMPRESSION, cache=None, stat=None,
+                  data=None):
+    # pylint: disable=too-many-arguments
+    # `zlib` releases the GIL while compressing, so this is safe and fast to
+    # call from a pool of threads.  `stat`, anything with the `mtime` and
+    # `mode` of the file such as a `FileStat`, saves stat'ing it again, and
+    # `data`, its content, reading it again.
+    if stat is None:
+        stat = file_stat(os.stat(source))
+    if data is None:
+        with open(source, 'rb') as handle:
+            data = handle.read()
+
+    key = None
+    cached = None
+    if cache:
+        key = cache.key(hashlib.sha256(data).hexdigest(), compress_type,
+                        level)
+        cached = cache.get(key)
+
+    if cached:
+        (compressed, crc, file_size) = cached
+    else:
+        if compress_type == ZIP_DEFLATED:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            compressed = compressor.compress(data) + compressor.flush()
+        else:
+            compressed = data
+        crc = zlib.crc32(data) & 0xffffffff
+        file_size = len(data)
+        if cache:
+            cache.put(key, compressed, crc, file_size)
+
+    return Member(arcname=arcname,
+                  data=compressed,
+                  crc=crc,
+                  file_size=file_size,
+                  compress_type=compress_type,
+                  date_time=time.localtime(stat.mtime)[0:6],
+                  external_attr=(stat.mode & 0xFFFF) << 16)
+
+
+def write_member(archive, member):
+    # pylint: disable=protected-access
+    zinfo = ZipInfo(member.arcname, member.date_time)
+    zinfo.external_attr = member.external_attr
+    zinfo.compress_type = member.compress_type
+    zinfo.file_size = member.file_size
+    zinfo.compress_size = len(member.data)
+    zinfo.CRC = member.crc
+    zinfo.header_offset = archive.fp.tell()
+
+    archive.fp.write(zinfo.FileHeader())
+    archive.fp.write(member.data)
+
+    archive.filelist.append(zinfo)
+    archive.NameToInfo[zinfo.filename] = zinfo
+    # Where `ZipFile.close()` writes the central directory from.
+    archive.start_dir = archive.fp.tell()
+    archive._didModify = True
+
+
+def read_members(path):
+    """
+    Yields the members of an existing archive still compressed, so they can
+    be copied into another archive without being inflated and deflated
+    again.
+    """
+    with ZipFile(path, 'r') as archive:
+        for zinfo in archive.infolist():
+            # Skip over the local file header, its name and extra fields may
+            # differ from the ones in the central directory.
+            archive.fp.seek(zinfo.header_offset)
+            header = archive.fp.read(30)
+            (name_length, extra_length) = struct.unpack(str('<HH'),
+                                                        header[26:30])
+            archive.fp.seek(name_length + extra_length, os.SEEK_CUR)
+            yield Member(arcname=zinfo.filename,
+                         data=archive.fp.read(zinfo.compress_size),
+                         crc=zinfo.CRC,
+                         file_size=zinfo.file_size,
+                         compress_type=zinfo.compress_type,
+                         date_time=zinfo.date_time,
+                         external_attr=zinfo.external_attr)
+
+
+def copy_archive(source, path, select=None, prefix=''):
+    """
+    Writes the members of the `source` archive, those whose name `select`
+    accepts when given, to a new archive at `path` with their names
+    prefixed by `prefix`.  Members are copied as they are, without being
+    compressed again.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Written next to its final location and renamed into place, so readers
+    # never see a partial archive.
+    (handle, tmp_path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(handle)
+    try:
+        with ZipFile(tmp_path, 'w', ZIP_DEFLATED) as archive:
+            for member in read_members(source):
+                if select is None or select(member.arcname):
+                    write_member(archive, member._replace(
+                        arcname=prefix + member.arcname))
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,205 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import OrderedDict
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from plpacker.archive import copy_archive
+from plpacker.layers import layer_name, plan_layers, read_distributions
+from plpacker.pylambdapacker import LAYER_PREFIX
+from plpacker.utils import cpu_count, ordered_map
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BatchBuilder(object):
+    """
+    Builds the archives of several `functions`, configuration data as made
+    by `Configuration.functions()`.  Functions installing the same
+    dependencies share a single environment and dependencies archive, made
+    once, then all the archives are written concurrently, `jobs` at a time.
+
+    `make_virtual_env(data)` makes the `VirtualEnv` of a function and
+    `make_packer(data, virtual_env)` its `PyLambdaPacker`.  Each archive is
+    written holding `lock(target)`.
+
+    With a `shared_layer_dir`, distributions installed by several functions
+    go in layers shared between them, written to that directory, and each
+    archive only gets the rest of its dependencies, see `plan_layers()`.
+    """
+    # Which layers each function uses, in `shared_layer_dir`.
+    LAYERS_FILE = 'layers.json'
+
+    def __init__(self, functions, make_virtual_env, make_packer, jobs=None,
+                 lock=None, shared_layer_dir=None):
+        # pylint: disable=too-many-arguments
+        self.functions = functions
+        self.make_virtual_env = make_virtual_env
+        self.make_packer = make_packer
+        self.jobs = jobs or cpu_count()
+        self.lock = lock or (lambda target: threading.Lock())
+        self.shared_layer_dir = shared_layer_dir
+
+    def groups(self):
+        """
+        The functions grouped by the dependencies they install.
+        """
+        groups = OrderedDict()
+        for data in self.functions:
+            groups.setdefault(dependencies_key(data), []).append(data)
+        return list(groups.values())
+
+    def build(self):
+        groups = self.groups()
+        LOGGER.info('Building %d function(s) with %d set(s) of dependencies.',
+                    len(self.functions), len(groups))
+        tmp_dir = tempfile.mkdtemp(prefix='{}-'.format(__name__))
+        environments = []
+        try:
+            for group in groups:
+                environments.append(self.make_virtual_env(group[0]))
+            packers = list(ordered_map(
+                self._prepare,
+                ((group[0], virtual_env, tempfile.mkdtemp(dir=tmp_dir))
+                 for (group, virtual_env) in zip(groups, environments)),
+                self.jobs))
+            dependencies = [packer.dependencies for packer in packers]
+            if self.shared_layer_dir:
+                dependencies = self._share_layers(groups, dependencies,
+                                                  tmp_dir)
+            builds = [(data, virtual_env, path,
+                       packer if data is group[0] else None)
+                      for (group, virtual_env, path, packer)
+                      in zip(groups, environments, dependencies, packers)
+                      for data in group]
+            for _ in ordered_map(self._build, builds, self.jobs):
+                pass
+        finally:
+            for virtual_env in environments:
+                virtual_env.__exit__(None, None, None)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _prepare(self, data, virtual_env, tmp_dir):
+        # The packer of the first function of a group, with the dependencies
+        # of the group ready, then used to build that function.  Making
+        # another would stage its files to the same place again.
+        packer = self.make_packer(data, virtual_env)
+        packer.prepare_dependencies(tmp_dir)
+        return packer
+
+    def _share_layers(self, groups, dependencies, tmp_dir):
+        # Returns what is left of the dependencies of each group, once the
+        # shared layers are taken out.
+        distributions = [read_distributions(path, _content_key(group[0]))
+                         for (group, path) in zip(groups, dependencies)]
+        functions = OrderedDict(
+            (data['name'], group_distributions)
+            for (group, group_distributions) in zip(groups, distributions)
+            for data in group)
+        layers = plan_layers(functions)
+
+        for layer in layers:
+            index = next(index for (index, group) in enumerate(groups)
+                         if group[0]['name'] in layer.functions)
+            arcnames = _arcnames(distributions[index], layer.keys)
+            path = os.path.join(self.shared_layer_dir, layer_name(layer))
+            LOGGER.info('Layer "%s": %d distribution(s), %d byte(s) '
+                        'compressed, shared by %d function(s).', path,
+                        len(layer.keys), layer.compress_size,
+                        len(layer.functions))
+            if not os.path.isfile(path):
+                copy_archive(dependencies[index], path,
+                             arcnames.__contains__, LAYER_PREFIX)
+
+        residuals = [
+            _residual(group, [layer for layer in layers
+                              if group[0]['name'] in layer.functions],
+                      distributions[index], dependencies[index],
+                      os.path.join(tmp_dir, 'residual-{}.zip'.format(index)))
+            for (index, group) in enumerate(groups)]
+
+        if not os.path.isdir(self.shared_layer_dir):
+            os.makedirs(self.shared_layer_dir)
+        with open(os.path.join(self.shared_layer_dir, self.LAYERS_FILE),
+                  'w') as handle:
+            json.dump(OrderedDict(
+                (name, [layer_name(layer) for layer in layers
+                        if name in layer.functions])
+                for name in functions), handle, indent=2)
+        return residuals
+
+    def _build(self, data, virtual_env, dependencies, packer=None):
+        # pylint: disable=too-many-arguments
+        packer = packer or self.make_packer(data, virtual_env)
+        packer.dependencies = dependencies
+        if self.shared_layer_dir:
+            # What is left of the dependencies depends on every function,
+            # so the archive is always written, from them.
+            packer.layer_dir = None
+            packer.index = None
+        try:
+            with self.lock(data['packager']['target']), packer.packager:
+                packer.build()
+        except Exception:
+            LOGGER.error('Failed to build function "%s".', data['name'])
+            raise
+        LOGGER.info('Built function "%s": %s', data['name'],
+                    packer.packager.zip_file)
+
+
+def _residual(group, layers, distributions, dependencies, path):
+    # Writes to `path` what is left of the `dependencies` of a group of
+    # functions once the distributions in their `layers` are taken out.
+    layered = set()
+    for layer in layers:
+        layered.update(_arcnames(distributions, layer.keys))
+    copy_archive(dependencies, path,
+                 lambda arcname: arcname not in layered)
+    for data in group:
+        LOGGER.info('Function "%s" uses %d shared layer(s), no longer '
+                    'uploading %d byte(s) compressed.', data['name'],
+                    len(layers), sum(layer.compress_size for layer in layers))
+    return path
+
+
+def _arcnames(distributions, keys):
+    arcnames = set()
+    for key in keys:
+        arcnames.update(distributions[key].arcnames)
+    return arcnames
+
+
+def _content_key(data):
+    # Whatever changes the archived files of installed distributions, which
+    # or how, so their distributions are not the same, see
+    # `read_distributions()`.
+    (virtualenv, packager) = (data['virtualenv'], data['packager'])
+    bytecode = None
+    if packager['compile']:
+        bytecode = [virtualenv['python'], packager['optimize'],
+                    packager['invalidation_mode'], packager['drop_sources']]
+    return json.dumps([bytecode, packager['strip'], packager['compression'],
+                       virtualenv['default_excludes'], virtualenv['slimming'],
+                       virtualenv['tree_shaking']])
+
+
+def dependencies_key(data):
+    """
+    What the dependencies of a function are made from, functions with the
+    same key share them.
+    """
+    virtualenv = data['virtualenv']
+    return json.dumps([virtualenv['python'],
+                       virtualenv['installer'],
+                       virtualenv['pip']['requirements'],
+                       virtualenv['pip']['packages'],
+                       virtualenv['pip']['wheelhouse'],
+                       virtualenv['runtime_provided'],
+                       data['packager']['sort'],
+                       _content_key(data),
+                       data['cache']['path']])
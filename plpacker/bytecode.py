@@ -0,0 +1,140 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from plpacker.utils import ordered_map, sanitized_env
+
+LOGGER = logging.getLogger(__name__)
+
+# Run by the target interpreter, so the byte code and the `__pycache__` tag
+# are its own.  Reads `[index, source, arcname]` items as JSON and writes
+# back `[index, pyc arcname, error]` ones.
+_SCRIPT = r'''
+import json, os, py_compile, sys
+try:
+    from importlib.util import cache_from_source
+except ImportError:
+    cache_from_source = None
+(optimize, mode, legacy, tmp_dir) = sys.argv[1:5]
+optimize = int(optimize)
+kwargs = {}
+if sys.version_info[0] >= 3:
+    kwargs['optimize'] = optimize
+if hasattr(py_compile, 'PycInvalidationMode'):
+    kwargs['invalidation_mode'] = getattr(
+        py_compile.PycInvalidationMode, mode.upper().replace('-', '_'))
+results = []
+for (index, source, arcname) in json.load(sys.stdin):
+    if legacy == '1' or cache_from_source is None:
+        target = arcname + 'c'
+    else:
+        target = cache_from_source(arcname, optimization=optimize or '')
+    try:
+        py_compile.compile(source, cfile=os.path.join(tmp_dir, str(index)),
+                           dfile=arcname, doraise=True, **kwargs)
+        results.append([index, target, None])
+    except Exception as exception:
+        results.append([index, None, str(exception)])
+json.dump(results, sys.stdout)
+'''
+
+
+class Compiler(object):
+    """
+    Compiles Python sources to byte code with the target interpreter,
+    `python`, so it need not be done on every cold start, where the file
+    system is read only anyway.
+
+    Byte code is checked against its source by `invalidation_mode`, one of
+    `timestamp`, `checked-hash` or `unchecked-hash`, the latter needing
+    neither the source nor its modification time, which archives do not
+    keep to the second.  Interpreters before 3.7 only do `timestamp`.  With
+    `drop_sources` the byte code takes the place of the sources, where
+    imports find it without them.
+    """
+    INVALIDATION_MODES = ('timestamp', 'checked-hash', 'unchecked-hash')
+
+    def __init__(self, python=None, optimize=0,
+                 invalidation_mode='unchecked-hash', drop_sources=False,
+                 jobs=1):
+        # pylint: disable=too-many-arguments
+        if invalidation_mode not in self.INVALIDATION_MODES:
+            raise ValueError('Unknown invalidation mode "{}", expected one '
+                             'of: {}'.format(invalidation_mode,
+                                             ', '.join(
+                                                 self.INVALIDATION_MODES)))
+        self.python = python or sys.executable
+        self.optimize = optimize
+        self.invalidation_mode = invalidation_mode
+        self.drop_sources = drop_sources
+        self.jobs = jobs
+
+    def key(self):
+        """
+        Identifies the byte code made, see `PyLambdaPacker`.
+        """
+        return '{}\0{}\0{}\0{}'.format(self.python, self.optimize,
+                                       self.invalidation_mode,
+                                       self.drop_sources)
+
+    @staticmethod
+    def is_source(arcname):
+        return arcname.endswith('.py')
+
+    @staticmethod
+    def is_bytecode(arcname):
+        return arcname.endswith(('.pyc', '.pyo'))
+
+    def compile(self, entries, tmp_dir):
+        """
+        Compiles the `(source, arcname, stat)` `entries` into `tmp_dir`.
+        Returns the entries of the byte code, and those of the sources that
+        failed to compile.
+        """
+        entries = list(entries)
+        if not entries:
+            return ([], [])
+        LOGGER.info('Compiling %d source(s) with "%s".', len(entries),
+                    self.python)
+        items = [[index, source, arcname]
+                 for (index, (source, arcname, _)) in enumerate(entries)]
+        chunks = [(items[offset::self.jobs], tmp_dir)
+                  for offset in range(min(self.jobs, len(items)))]
+
+        compiled = []
+        failed = []
+        for results in ordered_map(self._run, chunks, self.jobs):
+            for (index, target, error) in results:
+                (source, arcname, stat) = entries[index]
+                if error:
+                    LOGGER.warning('Unable to compile "%s": %s', source,
+                                   error)
+                    failed.append(entries[index])
+                    continue
+                path = os.path.join(tmp_dir, str(index))
+                compiled.append((path, target,
+                                 stat._replace(size=os.path.getsize(path))))
+        compiled.sort(key=lambda entry: entry[1])
+        LOGGER.info('Compiled %d source(s), %d failed.', len(compiled),
+                    len(failed))
+        return (compiled, failed)
+
+    def _run(self, items, tmp_dir):
+        process = subprocess.Popen(
+            [self.python, '-c', _SCRIPT, str(self.optimize),
+             self.invalidation_mode, '1' if self.drop_sources else '0',
+             tmp_dir],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, env=sanitized_env())
+        (stdoutdata, stderrdata) = process.communicate(
+            json.dumps(items).encode('utf-8'))
+        if process.returncode != 0:
+            LOGGER.error(stderrdata)
+            raise RuntimeError('Compiling with "{}" failed.'
+                               .format(self.python))
+        return json.loads(stdoutdata.decode('utf-8'))
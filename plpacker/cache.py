@@ -0,0 +1,406 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import errno
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from plpacker.utils import clone_tree, expand_path, tree_size
+
+LOGGER = logging.getLogger(__name__)
+
+
+class MemberCache(object):
+    """
+    Persistent store of compressed archive members, keyed by the content of
+    the file and the compression settings used.  The least recently used
+    entries are evicted once the cache grows beyond `max_size` bytes.
+
+    Up to `memory_max_size` bytes of the most recently used entries are also
+    kept in memory, which only pays off in a long running process such as
+    `plp serve`.
+    """
+    # pylint: disable=too-many-instance-attributes
+    _HEADER = struct.Struct(str('<IQ'))  # CRC32, uncompressed size
+
+    def __init__(self, path, max_size=1024 ** 3, memory_max_size=0):
+        self.path = expand_path(path, True)
+        self.max_size = max_size
+        self.memory_max_size = memory_max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    @staticmethod
+    def key(digest, compress_type, level):
+        return '{}-{}-{}'.format(digest, compress_type, level)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry:
+                self._memory[key] = entry
+                self.hits += 1
+                return entry
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as handle:
+                (crc, file_size) = self._HEADER.unpack(
+                    handle.read(self._HEADER.size))
+                data = handle.read()
+            # Bump the modification time, eviction is least recently used.
+            os.utime(path, None)
+        except (IOError, OSError, struct.error):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        self._remember(key, (data, crc, file_size))
+        return (data, crc, file_size)
+
+    def put(self, key, data, crc, file_size):
+        self._remember(key, (data, crc, file_size))
+        path = self._entry_path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as exception:
+            if exception.errno != errno.EEXIST:
+                raise
+
+        # Write then rename, so concurrent readers never see partial entries.
+        (handle, tmp_path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as stream:
+                stream.write(self._HEADER.pack(crc, file_size))
+                stream.write(data)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _remember(self, key, entry):
+        size = len(entry[0])
+        if size > self.memory_max_size:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = entry
+            self._memory_size += size
+            while self._memory_size > self.memory_max_size:
+                (_, evicted) = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted[0])
+
+    def prune(self):
+        (total, evictions) = prune_files(self.path, self.max_size)
+        self.evictions += evictions
+        return total
+
+    def session(self):
+        """
+        A `MemberCacheSession` counting the lookups of a single build.
+        """
+        return MemberCacheSession(self)
+
+    def report(self):
+        _report_lookups(self.hits, self.misses, self.evictions)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[0:2], key)
+
+
+class MemberCacheSession(object):
+    """
+    Looks members up in a `MemberCache` shared by several builds, counting
+    the hits and misses of one build alone.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, digest, compress_type, level):
+        return self.cache.key(digest, compress_type, level)
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def put(self, key, data, crc, file_size):
+        self.cache.put(key, data, crc, file_size)
+
+    def prune(self):
+        """
+        Prunes the cache, then logs the lookups of this build and the
+        entries pruning evicted.
+        """
+        evictions = self.cache.evictions
+        total = self.cache.prune()
+        _report_lookups(self.hits, self.misses,
+                        self.cache.evictions - evictions)
+        return total
+
+
+def _report_lookups(hits, misses, evictions):
+    lookups = hits + misses
+    LOGGER.info('Member cache: %d hit(s), %d miss(es) (%.0f%% hit rate), '
+                '%d eviction(s).', hits, misses,
+                100.0 * hits / lookups if lookups else 0.0, evictions)
+
+
+class FileCache(object):
+    """
+    Persistent store of whole files, keyed by whatever they were made from,
+    such as stripped shared objects by the content of the original.  The
+    least recently used entries are evicted once the cache grows beyond
+    `max_size` bytes.
+    """
+    def __init__(self, path, max_size=1024 ** 3):
+        self.path = expand_path(path, True)
+        self.max_size = max_size
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def get(self, key):
+        """
+        Path of the entry for `key`, `None` when there is none.
+        """
+        path = self._entry_path(key)
+        try:
+            # Bump the modification time, eviction is least recently used.
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, source):
+        """
+        Moves the `source` file into the cache, returns its new path.
+        """
+        path = self._entry_path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as exception:
+            if exception.errno != errno.EEXIST:
+                raise
+        # Copied next to the entry then renamed, so concurrent readers
+        # never see partial entries.
+        (handle, tmp_path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(handle)
+        try:
+            shutil.move(source, tmp_path)
+            os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def prune(self):
+        return prune_files(self.path, self.max_size)[0]
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[0:2], key)
+
+
+def prune_files(path, max_size, keep=()):
+    """
+    Removes the least recently used files below `path`, but for those in
+    `keep`, until they take no more than `max_size` bytes.  Returns their
+    size and the number of files removed.
+    """
+    entries = sorted(_list_entries(path))
+    total = sum(size for (_, size, _) in entries)
+    evictions = 0
+    for (_, size, entry) in entries:
+        if total <= max_size:
+            break
+        if entry in keep:
+            continue
+        try:
+            os.remove(entry)
+        except OSError:
+            continue
+        total -= size
+        evictions += 1
+    return (total, evictions)
+
+
+def _list_entries(path):
+    # Yields the modification time, size and path of the files below `path`,
+    # those being written aside.
+    for (dirpath, _, filenames) in os.walk(path):
+        for filename in filenames:
+            if filename.endswith('.tmp'):
+                continue
+            entry = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            yield (stat.st_mtime, stat.st_size, entry)
+
+
+class Caches(object):
+    """
+    Cache objects shared by the builds of a long running process, so what
+    they keep in memory stays warm from one build to the next.  With `keep`
+    unset, for a single build, nothing is shared.
+    """
+
+    def __init__(self, keep=True, member_memory_size=0):
+        self.keep = keep
+        self.member_memory_size = member_memory_size
+        self._caches = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, cls, *args):
+        """
+        The `cls(*args)` cache, made only once when kept.
+        """
+        if cls is MemberCache:
+            args += (self.member_memory_size,)
+        if not self.keep:
+            return cls(*args)
+        with self._lock:
+            key = (cls, args)
+            if key not in self._caches:
+                self._caches[key] = cls(*args)
+            return self._caches[key]
+
+    def lock(self, key):
+        """
+        Lock serializing the builds of `key`, such as an output archive.
+        """
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+
+class EnvironmentCache(object):
+    """
+    Persistent store of ready made environments, keyed by a fingerprint of
+    what is installed in them.  Entries are cloned with hard links, and the
+    least recently used ones are evicted once the cache grows beyond
+    `max_size` bytes.  Entries are locked so concurrent builds can share the
+    cache.
+    """
+
+    def __init__(self, path, max_size=4 * 1024 ** 3):
+        self.path = expand_path(path, True)
+        self.max_size = max_size
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    @contextmanager
+    def lock(self, key, blocking=True):
+        # Yields whether the lock was acquired, always true when blocking.
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.join(self.path, key + '.lock'), 'a') as handle:
+            flags = fcntl.LOCK_EX if blocking else \
+                fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(handle, flags)
+            except (IOError, OSError):
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def lookup(self, key):
+        path = os.path.join(self.path, key)
+        if not os.path.isdir(path):
+            return None
+        # Bump the modification time, eviction is least recently used.
+        os.utime(path, None)
+        return path
+
+    def store(self, key, directory):
+        path = os.path.join(self.path, key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        LOGGER.info('Caching environment "%s" as: %s', directory, path)
+        try:
+            clone_tree(directory, tmp_path)
+            # Sized once here, so pruning does not walk every entry.
+            self._write_size(key, tree_size(tmp_path))
+            os.rename(tmp_path, path)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        return path
+
+    def prune(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name.endswith(('.lock', '.tmp')) or not os.path.isdir(path):
+                continue
+            size = self._read_size(name)
+            entries.append((os.stat(path).st_mtime, size, name))
+            total += size
+
+        entries.sort()
+        for (_, size, name) in entries:
+            if total <= self.max_size:
+                break
+            with self.lock(name, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                LOGGER.info('Evicting cached environment: %s', name)
+                shutil.rmtree(os.path.join(self.path, name))
+                try:
+                    os.remove(self._size_path(name))
+                except OSError:
+                    pass
+            total -= size
+        return total
+
+    def _read_size(self, key):
+        # The size `store()` recorded, measured again for entries without.
+        try:
+            with open(self._size_path(key)) as handle:
+                return int(handle.read())
+        except (IOError, OSError, ValueError):
+            size = tree_size(os.path.join(self.path, key))
+            self._write_size(key, size)
+            return size
+
+    def _write_size(self, key, size):
+        path = self._size_path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as handle:
+            handle.write(str(size))
+        os.rename(tmp_path, path)
+
+    def _size_path(self, key):
+        return os.path.join(self.path, key + '.size')
@@ -2,6 +2,7 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import argparse
+import hashlib
 import logging
 import logging.config
 import os
@@ -10,14 +11,25 @@ import sys
 import pkg_resources
 import yaml
 
+from plpacker.batch import BatchBuilder
+from plpacker.bytecode import Compiler
+from plpacker.cache import Caches, EnvironmentCache, FileCache, MemberCache
+from plpacker.compression import CompressionPolicy
 from plpacker.config import Configuration
 from plpacker.virtualenv import VirtualEnv
 from plpacker.packager import Packager
 from plpacker.fileset import FileSet
+from plpacker.index import FileIndex
 from plpacker.pylambdapacker import PyLambdaPacker
+from plpacker.runtime import RuntimeProvided
+from plpacker.shaking import TreeShaker
+from plpacker.slimming import PROFILES, Slimming
+from plpacker.strip import Stripper
+from plpacker.utils import cpu_count, expand_path
+from plpacker.wheelhouse import Wheelhouse
 
 
-LOGGER = logging.getLogger()
+LOGGER = logging.getLogger(__name__)
 
 
 def setup_logging():
@@ -27,8 +39,8 @@ def setup_logging():
     LOGGER.info('Logging configuration read from "%s".', file_path)
 
 
-def parse_args(*argv):
-    parser = argparse.ArgumentParser(description='TODO')
+def parse_args(argv=None, parser_class=argparse.ArgumentParser):
+    parser = parser_class(description='TODO')
 
     parser.add_argument('--config-file',
                         dest='config_file',
@@ -75,6 +87,15 @@ def parse_args(*argv):
                         help=('version of python to build virtualenv with '
                               '(default is python2.7)'))
 
+    parser.add_argument('--installer',
+                        dest='installer',
+                        choices=VirtualEnv.INSTALLERS,
+                        default=None,
+                        help=('how dependencies are installed, "pip-target" '
+                              'skips creating a virtualenv, "wheelhouse" '
+                              'unpacks the wheelhouse without pip (default '
+                              'is virtualenv)'))
+
     parser.add_argument('--requirement', '-r',
                         dest='requirements',
                         action='append',
@@ -89,6 +110,54 @@ def parse_args(*argv):
                         help=('pip package index options, multiple '
                               'allowed (default is empty)'))
 
+    parser.add_argument('--wheelhouse',
+                        dest='wheelhouse',
+                        default=None,
+                        help=('directory of wheels to install from without '
+                              'network access, filled by the "wheelhouse" '
+                              'command (default is to install from the '
+                              'index)'))
+
+    parser.add_argument('--slim',
+                        dest='slimming',
+                        choices=sorted(PROFILES),
+                        default=None,
+                        help=('slimming profile leaving out of the '
+                              'dependencies what the runtime never reads '
+                              '(default is none)'))
+
+    parser.add_argument('--exclude-runtime-provided',
+                        dest='exclude_runtime_provided',
+                        default=None,
+                        action='store_true',
+                        help=('leave out of the dependencies what the Lambda '
+                              'runtime of --python already provides, such as '
+                              'boto3 (default=False)'))
+
+    parser.add_argument('--tree-shake',
+                        dest='tree_shake',
+                        default=None,
+                        action='store_true',
+                        help=('leave out of the dependencies the '
+                              'distributions the handlers never import '
+                              '(default=False)'))
+
+    parser.add_argument('--handler',
+                        dest='handlers',
+                        action='append',
+                        default=None,
+                        help=('Lambda handler, "module.function", imports '
+                              'are traced from with --tree-shake, multiple '
+                              'allowed (default is empty)'))
+
+    parser.add_argument('--tree-shake-keep',
+                        dest='tree_shake_keep',
+                        action='append',
+                        default=None,
+                        help=('glob pattern of dependencies kept by '
+                              '--tree-shake whatever the imports, multiple '
+                              'allowed (default is empty)'))
+
     parser.add_argument('--output', '-o',
                         dest='output',
                         default=None,
@@ -98,15 +167,109 @@ def parse_args(*argv):
     parser.add_argument('--archive-dir',
                         dest='archive_dir',
                         default=None,
-                        help=('directory to build the archive in '
-                              '(default is a tmp dir)'))
+                        help=('directory to stage the archive contents in '
+                              'when --keep-archive is set (default is a tmp '
+                              'dir)'))
 
     parser.add_argument('--keep-archive',
                         dest='keep_archive',
                         default=None,
                         action='store_true',
-                        help=('do not delete archive build directory when '
-                              'set (default=False)'))
+                        help=('stage a copy of the archive contents and do '
+                              'not delete it when set (default=False)'))
+
+    parser.add_argument('--jobs', '-j',
+                        dest='jobs',
+                        type=int,
+                        default=None,
+                        help=('number of files to compress in parallel '
+                              '(default is the number of CPUs)'))
+
+    parser.add_argument('--sort',
+                        dest='sort',
+                        default=None,
+                        action='store_true',
+                        help=('archive files in sorted order for repeatable '
+                              'builds, otherwise in the order they are found '
+                              '(default=False)'))
+
+    parser.add_argument('--compile',
+                        dest='compile',
+                        default=None,
+                        action='store_true',
+                        help=('archive byte code compiled by the --python '
+                              'interpreter (default=False)'))
+
+    parser.add_argument('--optimize',
+                        dest='optimize',
+                        type=int,
+                        choices=(0, 1, 2),
+                        default=None,
+                        help='byte code optimization level (default is 0)')
+
+    parser.add_argument('--invalidation-mode',
+                        dest='invalidation_mode',
+                        choices=Compiler.INVALIDATION_MODES,
+                        default=None,
+                        help=('how byte code is checked against its source '
+                              '(default is unchecked-hash)'))
+
+    parser.add_argument('--drop-sources',
+                        dest='drop_sources',
+                        default=None,
+                        action='store_true',
+                        help=('archive only the byte code of compiled '
+                              'sources (default=False)'))
+
+    parser.add_argument('--strip',
+                        dest='strip',
+                        default=None,
+                        action='store_true',
+                        help=('strip the symbols of native extensions and '
+                              'other shared objects (default=False)'))
+
+    parser.add_argument('--compress-level',
+                        dest='compress_level',
+                        default=None,
+                        type=int,
+                        choices=range(10),
+                        help=('deflate level of the files no compression '
+                              'rule matches nor looking compressed already '
+                              '(default is 6)'))
+
+    parser.add_argument('--cache-dir',
+                        dest='cache_dir',
+                        default=None,
+                        help=('directory to keep build caches in across runs '
+                              '(default is no caching)'))
+
+    parser.add_argument('--layer-dir',
+                        dest='layer_dir',
+                        default=None,
+                        help=('write the dependencies as a Lambda layer in '
+                              'this directory, leaving only the project files '
+                              'in the output zip (default is a single zip)'))
+
+    parser.add_argument('--shared-layers',
+                        dest='shared_layers',
+                        default=None,
+                        action='store_true',
+                        help=('share layers of common dependencies between '
+                              'the functions, in --layer-dir (default=False)'))
+
+    parser.add_argument('--watch',
+                        dest='watch',
+                        action='store_true',
+                        help=('keep running and update the archive whenever '
+                              'project files change, not with --compile or '
+                              '--strip'))
+
+    parser.add_argument('--server',
+                        dest='server',
+                        default=None,
+                        help=('send the build to the "plp serve" daemon '
+                              'listening on this socket (default is '
+                              '$PLP_SERVER, or building in this process)'))
 
     parser.add_argument('--generate-config',
                         dest='generate_config',
@@ -114,7 +277,7 @@ def parse_args(*argv):
                         help=('prints thedefault configuration to help create '
                               'one'))
 
-    namespace = parser.parse_args(*argv)
+    namespace = parser.parse_args(argv)
     LOGGER.debug('Command line arguments: %s', namespace)
     return namespace
 
@@ -126,36 +289,226 @@ def entry_point():
         Configuration.print_default_config()
         sys.exit(0)
 
-    # General configuration
+    # `plp wheelhouse ...` fills the wheelhouse instead of building.
+    argv = sys.argv[1:]
+    command = argv.pop(0) if argv[:1] == ['wheelhouse'] else None
+
     setup_logging()
-    cli_args = parse_args(sys.argv[1:])
-    config = Configuration(vars(cli_args))
-    cwd = os.getcwd()
+    sys.exit(run(parse_args(argv), os.getcwd(), command))
+
+
+def run(cli_args, cwd, command=None, caches=None, default_cache_dir=None):
+    """
+    Builds as asked by `cli_args`, from `parse_args()`, for the project in
+    `cwd`.  Nothing depends on the working directory of the process, so a
+    long running process can run several at once, sharing `caches`, a
+    `Caches`.  Returns the exit status.
+    """
+    # General configuration
+    config_args = dict(vars(cli_args))
+    config_args['config_file_path'] = cli_args.config_file
+    config = Configuration(config_args, cwd)
+    functions = config.functions()
+    for data in [config.data] + functions:
+        if default_cache_dir and not data['cache']['path']:
+            data['cache']['path'] = default_cache_dir
+        _resolve_paths(data, cwd)
+
+    if command == 'wheelhouse':
+        return _fill_wheelhouses(functions or [config.data])
+
+    caches = caches or Caches(keep=False)
+    if functions:
+        if cli_args.watch:
+            LOGGER.error('Only a single function can be watched.')
+            return 2
+        _build_functions(functions, cwd, caches)
+        return 0
+
+    # Build!  One build at a time per output archive.
+    data = config.data
+    if cli_args.watch and any(data['packager'][key] for key
+                              in ('compile', 'drop_sources', 'strip')):
+        # Project files are updated as they are, only the dependencies
+        # would be compiled and stripped.
+        LOGGER.error('--compile, --drop-sources and --strip do not work '
+                     'with --watch.')
+        return 2
+    with caches.lock(data['packager']['target']), \
+            _virtual_env(data, cwd, caches) as virtual_env:
+        packer = _packer(data, cwd, caches, virtual_env)
+        with packer.packager:
+            if cli_args.watch:
+                try:
+                    packer.watch()
+                except KeyboardInterrupt:
+                    LOGGER.info('Stopped watching.')
+            else:
+                packer.build()
+    return 0
+
+
+def _fill_wheelhouses(functions):
+    filled = False
+    for data in functions:
+        wheelhouse = _wheelhouse(data)
+        if wheelhouse:
+            wheelhouse.fill(data['virtualenv']['pip']['packages'],
+                            data['virtualenv']['pip']['requirements'])
+            filled = True
+    if not filled:
+        LOGGER.error('No wheelhouse directory configured, see --wheelhouse.')
+        return 1
+    return 0
 
-    # Information for the VirtualEnv
-    pip_requirements = config.data['virtualenv']['pip']['requirements']
-    fileset_excludes = config.data['virtualenv']['default_excludes']
 
-    # Information for the PyLambdaPacker
+def _build_functions(functions, cwd, caches):
+    # Several environments and staging directories can not share one path.
+    for data in functions:
+        for (section, key) in (('virtualenv', 'path'),
+                               ('packager', 'build_path')):
+            if data[section][key]:
+                data[section][key] = '{}-{}'.format(data[section][key],
+                                                    data['name'])
+
+    BatchBuilder(
+        functions,
+        lambda data: _virtual_env(data, cwd, caches),
+        lambda data, virtual_env: _packer(data, cwd, caches, virtual_env),
+        jobs=functions[0]['packager']['jobs'],
+        lock=caches.lock,
+        shared_layer_dir=(functions[0]['packager']['layer_dir']
+                          if functions[0]['packager']['shared_layers']
+                          else None)).build()
+
+
+def _wheelhouse(data):
+    if not data['virtualenv']['pip']['wheelhouse']:
+        return None
+    return Wheelhouse(data['virtualenv']['pip']['wheelhouse'],
+                      python=data['virtualenv']['python'])
+
+
+def _virtual_env(data, cwd, caches):
+    virtualenv_cache = None
+    if data['cache']['path']:
+        virtualenv_cache = caches.get(
+            EnvironmentCache,
+            os.path.join(data['cache']['path'], 'virtualenvs'),
+            data['cache']['virtualenvs_max_size'])
+
+    return VirtualEnv(python=data['virtualenv']['python'],
+                      path=data['virtualenv']['path'],
+                      keep=data['virtualenv']['keep'],
+                      packages=data['virtualenv']['pip']['packages'],
+                      requirements=data['virtualenv']['pip']['requirements'],
+                      fileset_excludes=data['virtualenv']['default_excludes'],
+                      fileset_sort=data['packager']['sort'],
+                      cache=virtualenv_cache,
+                      installer=data['virtualenv']['installer'],
+                      wheelhouse=_wheelhouse(data),
+                      cwd=cwd,
+                      slimming=Slimming.from_config(
+                          data['virtualenv']['slimming']),
+                      runtime_provided=_runtime_provided(data),
+                      tree_shaker=_tree_shaker(data, cwd))
+
+
+def _tree_shaker(data, cwd):
+    tree_shaking = data['virtualenv']['tree_shaking']
+    if not tree_shaking['enabled']:
+        return None
+    return TreeShaker(tree_shaking['handlers'], keep=tree_shaking['keep'],
+                      python=data['virtualenv']['python'],
+                      project_dirs=[cwd])
+
+
+def _runtime_provided(data):
+    runtime_provided = data['virtualenv']['runtime_provided']
+    if not runtime_provided['exclude']:
+        return None
+    return RuntimeProvided(runtime_provided['runtimes'],
+                           python=data['virtualenv']['python'])
+
+
+def _packer(data, cwd, caches, virtual_env):
     filesets = []
-    if config.data['packager']['includes']:
+    if data['packager']['includes']:
         filesets = [
             FileSet(cwd,
-                    includes=config.data['packager']['includes'],
-                    excludes=config.data['packager']['excludes']
-                    + config.data['packager']['default_excludes'])]
-
-    # Build!
-    with VirtualEnv(python=config.data['virtualenv']['python'],
-                    path=config.data['virtualenv']['path'],
-                    keep=config.data['virtualenv']['keep'],
-                    packages=config.data['virtualenv']['pip']['packages'],
-                    requirements=pip_requirements,
-                    fileset_excludes=fileset_excludes) as virtual_env, \
-            Packager(
-                zip_file=config.data['packager']['target'],
-                build_path=config.data['packager']['build_path'],
-                keep=config.data['packager']['keep']) as packager:
-
-        packer = PyLambdaPacker(virtual_env, packager, filesets)
-        packer.build()
+                    includes=data['packager']['includes'],
+                    excludes=data['packager']['excludes']
+                    + data['packager']['default_excludes'],
+                    lazy=True,
+                    sort=data['packager']['sort'])]
+
+    # Caches kept across builds
+    member_cache = None
+    base_archive_dir = None
+    file_index = None
+    target = data['packager']['target']
+    if data['cache']['path']:
+        member_cache = caches.get(
+            MemberCache,
+            os.path.join(data['cache']['path'], 'members'),
+            data['cache']['members_max_size'])
+        base_archive_dir = os.path.join(data['cache']['path'], 'bases')
+        # One index per output archive.
+        file_index = caches.get(FileIndex, os.path.join(
+            data['cache']['path'], 'index',
+            '{}.json'.format(hashlib.sha256(
+                target.encode('utf-8')).hexdigest())))
+
+    packager = Packager(zip_file=target,
+                        build_path=data['packager']['build_path'],
+                        keep=data['packager']['keep'],
+                        jobs=data['packager']['jobs'],
+                        cache=member_cache,
+                        compiler=_compiler(data),
+                        stripper=_stripper(data, caches),
+                        compression=CompressionPolicy.from_config(
+                            data['packager']['compression']))
+    return PyLambdaPacker(
+        virtual_env, packager, filesets, base_archive_dir, file_index,
+        layer_dir=data['packager']['layer_dir'],
+        base_archive_max_size=data['cache']['bases_max_size'])
+
+
+def _compiler(data):
+    if not data['packager']['compile']:
+        return None
+    return Compiler(python=data['virtualenv']['python'],
+                    optimize=data['packager']['optimize'],
+                    invalidation_mode=data['packager']['invalidation_mode'],
+                    drop_sources=data['packager']['drop_sources'],
+                    jobs=data['packager']['jobs'] or cpu_count())
+
+
+def _stripper(data, caches):
+    if not data['packager']['strip']:
+        return None
+    cache = None
+    if data['cache']['path']:
+        cache = caches.get(FileCache,
+                           os.path.join(data['cache']['path'], 'stripped'),
+                           data['cache']['stripped_max_size'])
+    return Stripper(cache=cache, jobs=data['packager']['jobs'] or cpu_count())
+
+
+def _resolve_paths(data, cwd):
+    # Relative paths are relative to the project, not to the process.
+    def resolve(path):
+        return expand_path(os.path.join(cwd, path)) if path else path
+
+    data['cache']['path'] = resolve(data['cache']['path'])
+    data['packager']['target'] = resolve(data['packager']['target'])
+    data['packager']['build_path'] = resolve(data['packager']['build_path'])
+    data['packager']['layer_dir'] = resolve(data['packager']['layer_dir'])
+    data['virtualenv']['path'] = resolve(data['virtualenv']['path'])
+    pip = data['virtualenv']['pip']
+    pip['wheelhouse'] = resolve(pip['wheelhouse'])
+    pip['requirements'] = [resolve(item) for item in pip['requirements']]
+    # Packages may be local paths as well as requirement specifiers.
+    pip['packages'] = [resolve(item)
+                       if os.path.exists(os.path.join(cwd, item)) else item
+                       for item in pip['packages']]
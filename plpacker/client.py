@@ -0,0 +1,84 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+import socket
+import sys
+import tempfile
+
+SERVER_ENV = 'PLP_SERVER'
+
+# Never sent to the daemon.
+_LOCAL_ONLY = frozenset(['-h', '--help', '--generate-config', '--watch'])
+
+
+def entry_point():
+    # The `py-lambda-packer` and `plp` commands.  Builds are handed to the
+    # `plp serve` daemon given with `--server` or `$PLP_SERVER`, and run in
+    # this process otherwise.  Kept light, the rest of `plpacker` is only
+    # imported when needed.
+    (argv, server) = _pop_server(sys.argv[1:], os.environ.get(SERVER_ENV))
+
+    if argv[:1] == ['serve']:
+        from plpacker.server import main
+        sys.exit(main(argv[1:]))
+
+    if server and argv[:1] != ['wheelhouse'] \
+            and not _LOCAL_ONLY.intersection(argv):
+        status = request_build(server, argv, os.getcwd())
+        if status is not None:
+            sys.exit(status)
+        sys.stderr.write('Unable to reach the build server on "{}", '
+                         'building here.\n'.format(server))
+
+    from plpacker.cli import entry_point as build_here
+    sys.argv[1:] = argv
+    build_here()
+
+
+def default_socket():
+    directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(directory, 'py-lambda-packer-{}.sock'.format(
+        os.getuid() if hasattr(os, 'getuid') else 0))
+
+
+def request_build(path, argv, cwd, stream=None):
+    """
+    Has the daemon listening on `path` build as `plp argv` would in `cwd`,
+    writing its log to `stream`.  Returns the exit status of the build, or
+    `None` when the daemon could not be reached.
+    """
+    stream = stream or sys.stdout
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            connection.connect(path)
+        except socket.error:
+            return None
+        request = json.dumps({'argv': argv, 'cwd': cwd}) + '\n'
+        connection.sendall(request.encode('utf-8'))
+        for line in connection.makefile('rb'):
+            message = json.loads(line.decode('utf-8'))
+            if 'status' in message:
+                return message['status']
+            stream.write(message['log'] + '\n')
+            stream.flush()
+    finally:
+        connection.close()
+    stream.write('The build server closed the connection.\n')
+    return 1
+
+
+def _pop_server(argv, server=None):
+    # `--server` is the client's own, the daemon never sees it.
+    remaining = []
+    items = iter(argv)
+    for item in items:
+        if item == '--server':
+            server = next(items, None)
+        elif item.startswith('--server='):
+            server = item[len('--server='):]
+        else:
+            remaining.append(item)
+    return (remaining, server)
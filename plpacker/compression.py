@@ -0,0 +1,171 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import Counter, OrderedDict
+import json
+import logging
+import math
+import threading
+import time
+import zlib
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+from plpacker.archive import compress_file
+from plpacker.pattern import compile_patterns
+
+LOGGER = logging.getLogger(__name__)
+
+# Level of the members stored as they are.
+STORE = 'store'
+# How much of the start of a file its entropy is measured on.
+_SAMPLE_SIZE = 4 * 1024
+# How much of a file is deflated at the default level to estimate what its
+# rule saved.
+_ESTIMATE_SIZE = 16 * 1024
+
+
+def entropy(data):
+    """
+    Shannon entropy of `data` in bits per byte, close to 8 for random or
+    compressed data.
+    """
+    size = len(data)
+    if not size:
+        return 0.0
+    return -sum(count / size * math.log(count / size, 2)
+                for count in Counter(bytearray(data)).values())
+
+
+class CompressionPolicy(object):
+    """
+    How each archive member is compressed: at the level of the first of the
+    `rules` whose globs match its archive name, otherwise stored as is when
+    its first `sample_size` bytes look random, past `entropy` bits per byte,
+    and deflated at `level` otherwise.  Levels are deflate levels, 0 to 9,
+    or `store`.
+
+    `rules` map names to `{'globs': [...], 'level': ...}`, tried in order.
+    Without an `entropy` threshold file content is never sampled.  With
+    `estimate` set, what the rules other than the default saved is
+    estimated for the report, which costs deflating part of each file again.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, rules=None, level=6, entropy=None,
+                 sample_size=_SAMPLE_SIZE, estimate=False):
+        # pylint: disable=redefined-outer-name,too-many-arguments
+        self.rules = rules or OrderedDict()
+        self.level = level
+        self.entropy = entropy
+        self.sample_size = sample_size
+        self.estimate = estimate
+        self._default = _settings('default', level)
+        self._patterns = [
+            (name, _settings(name, rule.get('level')),
+             compile_patterns(rule.get('globs') or ()))
+            for (name, rule) in self.rules.items()]
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+
+    @classmethod
+    def from_config(cls, value):
+        """
+        The policy of the `packager.compression` configuration, `None`
+        without any.
+        """
+        if not value:
+            return None
+        return cls(rules=value.get('rules'),
+                   level=value.get('level', 6),
+                   entropy=value.get('entropy'),
+                   sample_size=value.get('sample_size') or _SAMPLE_SIZE,
+                   estimate=bool(value.get('estimate')))
+
+    def key(self):
+        """
+        Identifies how members are compressed, see `PyLambdaPacker`.
+        """
+        return json.dumps([self.rules, self.level, self.entropy,
+                           self.sample_size], sort_keys=True)
+
+    def choose(self, arcname, data):
+        """
+        The rule, compression type and level for the file to be archived as
+        `arcname`, `data` being its content, or at least the start of it.
+        """
+        for (name, (compress_type, level), patterns) in self._patterns:
+            if patterns.match(arcname):
+                return (name, compress_type, level)
+        if self.entropy is not None \
+                and entropy(data[:self.sample_size]) > self.entropy:
+            return ('entropy', ZIP_STORED, 0)
+        return ('default',) + self._default
+
+    def compress(self, source, arcname, cache=None, stat=None):
+        """
+        Compresses a file like `compress_file()` does, as the policy
+        chooses, and records what it took.  The file is only read once.
+        """
+        with open(source, 'rb') as handle:
+            data = handle.read()
+        (rule, compress_type, level) = self.choose(arcname, data)
+        start = time.time()
+        member = compress_file(source, arcname, compress_type, level,
+                               cache=cache, stat=stat, data=data)
+        elapsed = time.time() - start
+        estimate = (0, 0.0)
+        if self.estimate and rule != 'default':
+            estimate = self._estimate(data)
+        with self._lock:
+            stats = self._stats.setdefault(rule, [0, 0, 0, 0.0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += member.file_size
+            stats[2] += len(member.data)
+            stats[3] += elapsed
+            stats[4] += estimate[0]
+            stats[5] += estimate[1]
+        return member
+
+    def report(self):
+        """
+        Logs the files, bytes and time of each rule since the last report,
+        and, with `estimate` set, what the rules other than the default saved
+        over deflating at the default level, estimated from the start of
+        each file.
+        """
+        with self._lock:
+            (stats, self._stats) = (self._stats, OrderedDict())
+        for (rule, (files, size, compressed, elapsed, estimated_size,
+                    estimated_time)) in stats.items():
+            LOGGER.info('Compression rule "%s": %d file(s), %d byte(s) '
+                        'archived as %d in %.3fs.', rule, files, size,
+                        compressed, elapsed)
+            if self.estimate and rule != 'default':
+                LOGGER.info('Compression rule "%s" saved about %.3fs and %d '
+                            'byte(s) over level %s.', rule,
+                            estimated_time - elapsed,
+                            estimated_size - compressed, self.level)
+
+    def _estimate(self, data):
+        # The size and time deflating at the default level would have taken,
+        # scaled up from the start of the file.
+        (compress_type, level) = self._default
+        sample = data[:_ESTIMATE_SIZE]
+        if compress_type == ZIP_STORED or not sample:
+            return (len(data), 0.0)
+        start = time.time()
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        compressed = len(compressor.compress(sample) + compressor.flush())
+        elapsed = time.time() - start
+        scale = len(data) / len(sample)
+        return (int(compressed * scale), elapsed * scale)
+
+
+def _settings(name, level):
+    # The compression type and level for a level of the configuration.
+    if level == STORE:
+        return (ZIP_STORED, 0)
+    if isinstance(level, int) and not isinstance(level, bool) \
+            and 0 <= level <= 9:
+        return (ZIP_DEFLATED, level)
+    raise ValueError('Invalid compression level "{}" for "{}", expected '
+                     '"{}" or 0 to 9.'.format(level, name, STORE))
@@ -2,6 +2,7 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 from builtins import str  # noqa pylint: disable=redefined-builtin
 
+import copy
 import logging
 import os
 
@@ -19,11 +20,13 @@ class Configuration(object):
     DEFAULT_CONFIG = pkg_resources.resource_filename(
         __name__, 'conf/DEFAULT_CONFIG.yaml')
 
-    def __init__(self, cli_args):
+    def __init__(self, cli_args, cwd=None):
+        # The configuration file is looked for in `cwd`, the project
+        # directory, by default the working directory of the process.
         self.cli_args = cli_args
         self.defaults_file_path = Configuration.DEFAULT_CONFIG
         self.config_file_path = self._find_config_file(
-            cli_args.get('config_file_path', None))
+            cli_args.get('config_file_path', None), cwd)
 
         # Remember `work_data` will get mutated, a lot, before saving.
         work_data = self._load_file(self.defaults_file_path)
@@ -34,6 +37,33 @@ class Configuration(object):
         self._merge(work_data, file_data, cli_args)
         self.data = work_data
 
+    def functions(self):
+        """
+        The configuration of each entry of `functions`, merged over the rest
+        of the configuration, their shared defaults.  Each also gets a
+        `name`, by default the name of its target.
+        """
+        functions = []
+        targets = set()
+        for entry in self.data.get('functions') or ():
+            data = copy.deepcopy(self.data)
+            del data['functions']
+            entry = dict(entry)
+            name = entry.pop('name', None)
+            self._merge_dicts(data, entry)
+            data['name'] = name or os.path.splitext(
+                os.path.basename(data['packager']['target']))[0]
+            if data['packager']['target'] in targets:
+                raise ValueError('Functions share the same target: {}'
+                                 .format(data['packager']['target']))
+            targets.add(data['packager']['target'])
+            functions.append(data)
+        if functions and functions[0]['packager']['shared_layers'] \
+                and not functions[0]['packager']['layer_dir']:
+            raise ValueError('Shared layers need a layer directory, see '
+                             '--layer-dir.')
+        return functions
+
     def _merge(self, work_data, file_data, cli_args):
         if file_data:
             self._merge_dicts(work_data, file_data)
@@ -43,17 +73,36 @@ class Configuration(object):
     @staticmethod
     def _merge_cli_args(ori_dict, cli_args):
         injector = CliArgInjector(ori_dict, cli_args)
+        injector.map('cache.path', 'cache_dir')
         injector.map('packager.build_path', 'archive_dir')
+        injector.map('packager.compile', 'compile')
+        injector.map('packager.compression.level', 'compress_level')
+        injector.map('packager.drop_sources', 'drop_sources')
         injector.map('packager.excludes', 'excludes')
         injector.map('packager.followlinks', 'followlinks')
         injector.map('packager.includes', 'includes')
+        injector.map('packager.invalidation_mode', 'invalidation_mode')
+        injector.map('packager.jobs', 'jobs')
         injector.map('packager.keep', 'keep_archive')
+        injector.map('packager.layer_dir', 'layer_dir')
+        injector.map('packager.optimize', 'optimize')
+        injector.map('packager.shared_layers', 'shared_layers')
+        injector.map('packager.sort', 'sort')
+        injector.map('packager.strip', 'strip')
         injector.map('packager.target', 'output')
+        injector.map('virtualenv.installer', 'installer')
         injector.map('virtualenv.keep', 'keep_virtualenv')
         injector.map('virtualenv.path', 'virtualenv_dir')
         injector.map('virtualenv.pip.packages', 'packages')
         injector.map('virtualenv.pip.requirements', 'requirements')
+        injector.map('virtualenv.pip.wheelhouse', 'wheelhouse')
         injector.map('virtualenv.python', 'python')
+        injector.map('virtualenv.runtime_provided.exclude',
+                     'exclude_runtime_provided')
+        injector.map('virtualenv.tree_shaking.enabled', 'tree_shake')
+        injector.map('virtualenv.tree_shaking.handlers', 'handlers')
+        injector.map('virtualenv.tree_shaking.keep', 'tree_shake_keep')
+        injector.map('virtualenv.slimming', 'slimming')
 
     def _merge_dicts(self, left, right, path=None):
         """
@@ -70,6 +119,9 @@ class Configuration(object):
                 elif left[key] == right[key]:
                     # same leaf value
                     pass
+                elif left[key] is None or right[key] is None:
+                    # Unset (`!!null`) values can be overridden either way.
+                    left[key] = right[key]
                 elif (isinstance(left[key], (list, tuple))
                       and isinstance(right[key], (list, tuple))):
                     # TODO - Add unit tests
@@ -86,10 +138,12 @@ class Configuration(object):
                 left[key] = right[key]
 
     @staticmethod
-    def _find_config_file(config_file_path):
+    def _find_config_file(config_file_path, cwd=None):
         if config_file_path:
+            if cwd:
+                config_file_path = os.path.join(cwd, config_file_path)
             return expand_path(config_file_path, True)
-        local_file = os.path.join(os.getcwd(), 'py-lambda-packer.yaml')
+        local_file = os.path.join(cwd or os.getcwd(), 'py-lambda-packer.yaml')
         if os.path.exists(local_file):
             return local_file
         return None
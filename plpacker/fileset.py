@@ -1,19 +1,42 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-import fnmatch
-from glob import glob
+from collections import namedtuple
+import hashlib
 import os
 import logging
 
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+from plpacker.index import hash_file
+from plpacker.pattern import compile_patterns
 import plpacker.utils
 
 LOGGER = logging.getLogger(__name__)
 
+# What is known of a file from scanning it, so it need not be stat'ed again.
+FileStat = namedtuple('FileStat', ['size', 'mtime', 'mode', 'mtime_ns',
+                                   'inode'])
+
 
 class FileSet(object):
-    # pylint: disable=too-few-public-methods
-    def __init__(self, directory, includes, excludes=(), followlinks=False):
+    """
+    Files of `directory` matched by the `includes` globs and none of the
+    `excludes` globs.
+
+    By default the tree is scanned once, up front.  A `lazy` file set scans
+    it every time it is iterated, yielding files as they are found instead.
+    When `sort` is set files come in sorted order, otherwise in directory
+    listing order.  Each file is stat'ed once, while scanning, see
+    `entries()`.  Relative paths in `skip` are left out whatever the globs.
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, directory, includes, excludes=(), followlinks=False,
+                 lazy=False, sort=True, skip=()):
+        # pylint: disable=too-many-arguments
         # Validate
         if directory is None:
             raise ValueError('"None" is not an acceptable "directory" value.')
@@ -33,33 +56,80 @@ class FileSet(object):
         self.excludes = (excludes
                          if isinstance(excludes, tuple) else tuple(excludes))
         self.followlinks = followlinks
-        self.fileset = self._expand_fileset()
+        self.lazy = lazy
+        self.sort = sort
+        self.skip = frozenset(skip or ())
+        for expression in self.includes + self.excludes:
+            self._validate(expression)
+        self._stats = None
+        self.fileset = None if lazy else self._expand_fileset()
 
     def __len__(self):
+        if self.lazy:
+            raise TypeError('A lazy FileSet has no length.')
         return len(self.fileset)
 
     def __getitem__(self, index):
+        if self.lazy:
+            raise TypeError('A lazy FileSet can not be indexed.')
         return self.fileset[index]
 
     def __iter__(self):
+        if self.lazy:
+            return self._iter_fileset()
         return iter(self.fileset)
 
     def pairs(self):
         return ((os.path.join(self.directory, item),
-                 item) for item in self.fileset)
+                 item) for item in self)
+
+    def entries(self):
+        """
+        Yields `(source, arcname, stat)` for every file, `stat` being the
+        `FileStat` recorded while scanning.
+        """
+        if self.lazy:
+            items = self._iter_entries()
+        else:
+            items = zip(self.fileset, self._stats)
+        return ((os.path.join(self.directory, item), item, stat)
+                for (item, stat) in items)
+
+    def fingerprint(self, index=None):
+        """
+        Hash of the archive names, modes and content of the files.  Content
+        hashes come from `index`, a `FileIndex`, so only files that changed
+        are read.  Without one every file is read.
+        """
+        digest = hashlib.sha256()
+        for (source, arcname, stat) in sorted(self.entries()):
+            content = (index.digest(source, stat) if index
+                       else hash_file(source))
+            digest.update('\0{}\0{:o}\0{}'.format(arcname, stat.mode, content)
+                          .encode('utf-8'))
+        return digest.hexdigest()
 
     def _expand_fileset(self):
-        files = set()
-        for include in self.includes:
-            files.update(self._expand_glob(include, self.followlinks))
+        entries = tuple(self._iter_entries())
+        self._stats = tuple(stat for (_, stat) in entries)
+        return tuple(item for (item, _) in entries)
 
-        for exclude in self.excludes:
-            files = files.difference(
-                self._expand_glob(exclude, self.followlinks))
+    def _iter_fileset(self):
+        return (item for (item, _) in self._iter_entries())
 
-        return tuple(sorted(item for item in files))
+    def _iter_entries(self):
+        return self._scan(compile_patterns(self.includes),
+                          compile_patterns(self.excludes),
+                          self.followlinks,
+                          self.sort)
 
     def _expand_glob(self, expression, followlinks=False):
+        self._validate(expression)
+        return tuple(item for (item, _) in self._scan(
+            compile_patterns((expression,)), compile_patterns(()),
+            followlinks, sort=True))
+
+    def _validate(self, expression):
         if os.path.isabs(expression):
             raise ValueError('Absolute paths in globs are not supported: {}'
                              .format(expression))
@@ -73,35 +143,72 @@ class FileSet(object):
             raise ValueError('Dots (".." or ".") are not permitted: {}'
                              .format(expression))
 
-        if '**' in expression:
-            result = _find_files_recursively(full_glob, followlinks)
-        else:
-            result = _find_files(full_glob)
-        directory_len = len(self.directory) + 1
-        return tuple(sorted(item[directory_len:] for item in result))
-
-
-def _find_files_recursively(expression, followlinks=False):
-    if '**' not in expression:
-        raise ValueError('Glob is missing "**": {}'.format(expression))
-    (directories, glob_part) = expression.rsplit('**', 1)
-    if not glob_part:
-        glob_part = '*'
-    elif glob_part.startswith(os.path.sep):
-        glob_part = glob_part[len(os.path.sep):]
-
-    result = []
-    for directory in glob(directories):
-        for (dirpath, _, filenames) in os.walk(
-                directory, followlinks=followlinks):
-            for filename in fnmatch.filter(filenames, glob_part):
-                result.append(os.path.join(dirpath, filename))
-    return result
-
-
-def _find_files(expression):
-    items = []
-    for item in glob(expression):
-        if os.path.isfile(item):
-            items.append(item)
-    return items
+    def _scan(self, includes, excludes, followlinks=False, sort=False):
+        # A single, depth first, walk of the tree whatever the number of
+        # patterns, relying on the file types `scandir()` already has from
+        # the listing.  Directories no include can match anything below, or
+        # entirely matched by an exclude, are not listed at all.
+        pending = [_list_directory(self.directory, [], sort)]
+        while pending:
+            for (entry, child, is_dir) in pending[-1]:
+                if is_dir:
+                    if not followlinks and entry.is_symlink():
+                        continue
+                    if includes.could_match_below(child) \
+                            and not excludes.covers_below(child):
+                        pending.append(_list_directory(entry.path, child,
+                                                       sort))
+                        break
+                    continue
+                relative = '/'.join(child)
+                if includes.match(relative) and not excludes.match(relative) \
+                        and relative not in self.skip:
+                    yield (os.sep.join(child), _stat(entry))
+            else:
+                pending.pop()
+
+
+def _list_directory(directory, segments, sort):
+    try:
+        entries = list(scandir(directory))
+    except OSError:
+        # Like `os.walk()`, unreadable directories are skipped.
+        LOGGER.debug('Unable to list directory: %s', directory)
+        return iter(())
+
+    items = [(entry, segments + [entry.name], _is_dir(entry))
+             for entry in entries]
+    if sort:
+        # Directories sort as if their name ended with a separator, making
+        # the walk yield paths in plain `sorted()` order.
+        items.sort(key=lambda item: item[0].name + os.sep
+                   if item[2] else item[0].name)
+    return iter(items)
+
+
+def _stat(entry):
+    try:
+        stat = entry.stat()
+    except OSError:
+        # A dangling link, which is still listed like `os.walk()` would.
+        LOGGER.debug('Broken link: %s', entry.path)
+        stat = entry.stat(follow_symlinks=False)
+    return file_stat(stat)
+
+
+def file_stat(stat):
+    """
+    Makes a `FileStat` from an `os.stat()` result.
+    """
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return FileStat(stat.st_size, stat.st_mtime, stat.st_mode, mtime_ns,
+                    stat.st_ino)
+
+
+def _is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
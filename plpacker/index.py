@@ -0,0 +1,107 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from plpacker.utils import expand_path
+
+LOGGER = logging.getLogger(__name__)
+
+# Files modified this close to being hashed may have been modified again
+# without their modification time changing, some file systems only keep it
+# to the second or two.
+RACY_NS = 2 * 10 ** 9
+
+
+class FileIndex(object):
+    """
+    Persistent record of the content hash of files, in the spirit of the
+    git index.  A file is only hashed again when its size, modification time
+    or inode changed since it was recorded.  The last archive built is also
+    recorded, so an unchanged build can be skipped altogether.
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = expand_path(path, True)
+        self.hashed = 0
+        self.reused = 0
+        # What the last archive was built from, see `PyLambdaPacker`.
+        self.archive = None
+        self._entries = {}
+        self._seen = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as handle:
+                data = json.load(handle)
+        except (IOError, OSError, ValueError):
+            LOGGER.debug('No usable file index in: %s', self.path)
+            return
+        if data.get('version') != self.VERSION:
+            LOGGER.debug('Ignoring file index version: %s',
+                         data.get('version'))
+            return
+        self._entries = data['entries']
+        self.archive = data['archive']
+
+    def digest(self, source, stat):
+        """
+        The sha256 hex digest of `source`, hashing it only when `stat`, a
+        `FileStat`, differs from what was recorded.
+        """
+        key = [stat.size, stat.mtime_ns, stat.inode]
+        entry = self._seen.get(source) or self._entries.get(source)
+        if entry and entry[:3] == key \
+                and stat.mtime_ns + RACY_NS < entry[4]:
+            self.reused += 1
+        else:
+            self.hashed += 1
+            entry = key + [hash_file(source), _now_ns()]
+        self._seen[source] = entry
+        return entry[3]
+
+    def save(self):
+        # Only what was looked at in this run is kept.
+        data = {'version': self.VERSION,
+                'entries': self._seen,
+                'archive': self.archive}
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        (handle, tmp_path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as stream:
+                json.dump(data, stream)
+            os.rename(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        LOGGER.info('File index: %d file(s) hashed, %d unchanged.',
+                    self.hashed, self.reused)
+        # Ready for the next run, when kept in memory.
+        self._entries = self._seen
+        self._seen = {}
+        self.hashed = 0
+        self.reused = 0
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _now_ns():
+    try:
+        return time.time_ns()
+    except AttributeError:
+        return int(time.time() * 1e9)
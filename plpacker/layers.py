@@ -0,0 +1,186 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import defaultdict, namedtuple, Counter
+import csv
+import hashlib
+import logging
+import posixpath
+from zipfile import ZipFile
+
+from plpacker.packager import MAX_UNZIPPED_SIZE
+
+LOGGER = logging.getLogger(__name__)
+
+# Layers a single AWS Lambda function can use.
+MAX_LAYERS = 5
+
+# The files of an installed distribution, as found in a dependencies
+# archive, with their total unzipped and compressed sizes.
+Distribution = namedtuple('Distribution', ['name', 'arcnames', 'size',
+                                           'compress_size'])
+
+# Distributions, by key, shared by several functions, by name.
+Layer = namedtuple('Layer', ['keys', 'functions', 'size', 'compress_size'])
+
+
+def read_distributions(zip_file, salt=''):
+    """
+    Splits the members of a dependencies archive by the distribution that
+    installed them, from the `RECORD` of their `.dist-info`.  Returns the
+    distributions by key, which is the same for identical installs.  Members
+    no `RECORD` lists belong to none, but for byte code compiled from a
+    source it does.  Whatever else makes the members differ, such as how
+    they were compiled, goes in the `salt` of the keys.
+    """
+    records = {}
+    owners = {}
+    with ZipFile(zip_file, 'r') as archive:
+        infos = dict((zinfo.filename, zinfo) for zinfo in archive.infolist())
+        for record in sorted(infos):
+            if _is_record(record):
+                records[record] = _read_record(archive, record, salt, owners)
+
+        for arcname in sorted(infos):
+            owner = owners.get(arcname) \
+                or owners.get(_source_of(arcname) or '')
+            if owner:
+                records[owner][2].append(arcname)
+
+    distributions = {}
+    for (name, key, arcnames) in records.values():
+        distributions[key] = Distribution(
+            name=name,
+            arcnames=frozenset(arcnames),
+            size=sum(infos[item].file_size for item in arcnames),
+            compress_size=sum(infos[item].compress_size for item in arcnames))
+    return distributions
+
+
+def _read_record(archive, record, salt, owners):
+    # The name and key of the distribution of a `RECORD`, along with an
+    # empty list for its members.  Maps the paths it lists to it in
+    # `owners`, unless already listed by another.
+    name = record.split('/')[0]
+    digest = hashlib.sha256('{}\0{}'.format(salt, name).encode('utf-8'))
+    lines = archive.read(record).decode('utf-8').splitlines()
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        path = posixpath.normpath(row[0])
+        owners.setdefault(path, record)
+        # Only what has a hash is the same from one install to the next,
+        # `INSTALLER`, `REQUESTED` and the like are not.
+        if len(row) > 1 and row[1]:
+            digest.update('\0{}\0{}'.format(path, row[1]).encode('utf-8'))
+    return (name, digest.hexdigest(), [])
+
+
+def plan_layers(functions, max_layers=MAX_LAYERS,
+                max_size=MAX_UNZIPPED_SIZE):
+    """
+    Works out the layers sharing distributions between `functions`, their
+    distributions by name, as returned by `read_distributions()`.
+
+    Distributions used by the same functions go in the same layer.  Layers
+    are picked greedily, those saving the most bytes across all functions
+    first, as long as no function ends up with more than `max_layers` and no
+    layer is bigger than `max_size` unzipped.  Lambda limits a function and
+    its layers to `max_size` together: a layer goes only to functions whose
+    layers, plus what is left in their own archive, stay within it.
+    """
+    users = defaultdict(set)
+    residuals = {}
+    for (name, distributions) in functions.items():
+        residuals[name] = sum(item.size for item in distributions.values())
+        for key in distributions:
+            users[key].add(name)
+
+    candidates = defaultdict(list)
+    for (key, names) in users.items():
+        if len(names) > 1:
+            candidates[frozenset(names)].append(key)
+
+    layers = [_fill_layer(functions, names, keys, max_size)
+              for (names, keys) in candidates.items()]
+    layers.sort(key=lambda layer: (-layer.compress_size
+                                   * (len(layer.functions) - 1),
+                                   layer.functions))
+
+    return _pick_layers(layers, residuals, max_layers, max_size)
+
+
+def layer_name(layer):
+    digest = hashlib.sha256()
+    for key in layer.keys:
+        digest.update(key.encode('utf-8'))
+    return 'layer-{}.zip'.format(digest.hexdigest())
+
+
+def _pick_layers(layers, residuals, max_layers, max_size):
+    # Greedily, `residuals` being the size of each function's
+    # distributions left in its own archive.
+    planned = []
+    counts = Counter()
+    layered = Counter()
+    for layer in layers:
+        if not layer.keys \
+                or any(counts[name] >= max_layers
+                       for name in layer.functions):
+            continue
+        # What the layer takes out of their archives it adds back on top,
+        # sharing cannot bring a function back within the limit.
+        over = [name for name in layer.functions
+                if layered[name] + residuals[name] > max_size]
+        if over:
+            LOGGER.warning('Not sharing a layer with %s, over %d bytes '
+                           'unzipped with it.', ', '.join(over), max_size)
+            continue
+        counts.update(layer.functions)
+        for name in layer.functions:
+            layered[name] += layer.size
+            residuals[name] -= layer.size
+        planned.append(layer)
+    return planned
+
+
+def _fill_layer(functions, names, keys, max_size):
+    # The biggest distributions first, leaving out those no longer fitting.
+    distributions = sorted(((_find(functions, names, key), key)
+                            for key in keys),
+                           key=lambda item: (-item[0].size, item[1]))
+    (kept, size, compress_size) = ([], 0, 0)
+    for (distribution, key) in distributions:
+        if size + distribution.size > max_size:
+            LOGGER.info('Not sharing "%s" between %s, too big for a layer.',
+                        distribution.name, ', '.join(sorted(names)))
+            continue
+        kept.append(key)
+        size += distribution.size
+        compress_size += distribution.compress_size
+    return Layer(keys=tuple(sorted(kept)), functions=tuple(sorted(names)),
+                 size=size, compress_size=compress_size)
+
+
+def _find(functions, names, key):
+    for name in sorted(names):
+        if key in functions[name]:
+            return functions[name][key]
+    raise KeyError(key)
+
+
+def _source_of(arcname):
+    # The source byte code is compiled from, see `plpacker.bytecode`.
+    if not arcname.endswith(('.pyc', '.pyo')):
+        return None
+    (directory, filename) = posixpath.split(arcname)
+    if posixpath.basename(directory) == '__pycache__':
+        return posixpath.join(posixpath.dirname(directory),
+                              filename.split('.')[0] + '.py')
+    return arcname[:-1]
+
+
+def _is_record(arcname):
+    parts = arcname.split('/')
+    return (len(parts) == 2 and parts[0].endswith('.dist-info')
+            and parts[1] == 'RECORD')
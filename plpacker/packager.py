@@ -1,21 +1,62 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+from collections import OrderedDict
 import os
 import shutil
 import tempfile
 import logging
+import zlib
 from zipfile import ZipFile, ZIP_DEFLATED
 
-from plpacker.utils import expand_path
+from plpacker.archive import compress_file, read_members, write_member
+from plpacker.utils import cpu_count, expand_path, ordered_map
 
 LOGGER = logging.getLogger(__name__)
 
+# Largest a deployment package may be once unzipped.
+# https://docs.aws.amazon.com/lambda/latest/dg/limits.html
+MAX_UNZIPPED_SIZE = 250 * 1024 ** 2
+
 
 class Packager(object):
-    def __init__(self, zip_file, build_path=None, keep=False):
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, zip_file, build_path=None, keep=False, jobs=None,
+                 cache=None, compiler=None, stripper=None, compression=None):
+        # pylint: disable=too-many-arguments
         self.zip_file = expand_path(zip_file, True)
         self.keep = keep
+        self.jobs = jobs or cpu_count()
+        self.cache = cache
+        # A `Compiler` when archiving byte code along with, or instead of,
+        # the sources.
+        self.compiler = compiler
+        # A `Stripper` when stripping shared objects.
+        self.stripper = stripper
+        # A `CompressionPolicy` choosing how each member is compressed,
+        # otherwise all are deflated at the default level.
+        self.compression = compression
+        # Maps archive names to the source file they are read from.  The
+        # first file added for an archive name wins.
+        self.manifest = OrderedDict()
+        # The `FileStat` of every file in the manifest, by archive name, as
+        # recorded while scanning.
+        self.stats = {}
+        # Lazy file sets, only scanned while packaging so compression starts
+        # with the first files found.
+        self.filesets = []
+        # Existing archives whose members are copied in as is, after the
+        # manifest.
+        self.archives = []
+
+        # Files are streamed straight from their source into the archive.  A
+        # staging copy is only made when asked to keep one around.
+        self.build_path = None
+        if not keep:
+            if build_path:
+                LOGGER.debug('Not staging files, ignoring build path: %s',
+                             build_path)
+            return
 
         if not build_path:
             prefix = '{}-'.format(__name__)
@@ -37,26 +78,151 @@ class Packager(object):
         return self
 
     def add_fileset_items(self, fileset):
-        for (source, target) in fileset.pairs():
-            target = os.path.join(self.build_path, target)
-            target_dir = os.path.dirname(target)
-            if not os.path.isdir(target_dir):
-                os.makedirs(target_dir)
-            LOGGER.debug('Copying "%s" to "%s".', source, target)
-            shutil.copy(source, target)
+        if getattr(fileset, 'lazy', False):
+            self.filesets.append(fileset)
+            return
+        for _ in self._add_entries(fileset.entries()):
+            pass
+
+    def _add_entries(self, entries):
+        # Yields the entries actually added to the manifest.
+        for (source, target, stat) in entries:
+            if os.path.abspath(source) == self.zip_file:
+                # Scanning lazily, the archive being written may be found.
+                LOGGER.debug('Skipping the archive itself: %s', source)
+                continue
+            if target in self.manifest:
+                LOGGER.warning('Skipping "%s", "%s" is already archived '
+                               'from "%s".', source, target,
+                               self.manifest[target])
+                continue
+            if self.build_path:
+                source = self._stage(source, target, stat)
+            self.manifest[target] = source
+            self.stats[target] = stat
+            yield (source, target, stat)
+
+    def add_archive(self, zip_file):
+        self.archives.append(zip_file)
+
+    def _stage(self, source, target, stat):
+        staged = os.path.join(self.build_path, target)
+        staged_dir = os.path.dirname(staged)
+        if not os.path.isdir(staged_dir):
+            os.makedirs(staged_dir)
+        LOGGER.debug('Copying "%s" to "%s".', source, staged)
+        shutil.copyfile(source, staged)
+        os.chmod(staged, stat.mode & 0o7777)
+        return staged
 
     def package(self):
-        LOGGER.info('Packaging files to "%s".', self.zip_file)
-        build_path_len = len(self.build_path) + 1
-        archive = ZipFile(self.zip_file, 'w', ZIP_DEFLATED)
+        LOGGER.info('Packaging files to "%s" using %d job(s).',
+                    self.zip_file, self.jobs)
+        # Members are compressed concurrently, but written by this thread
+        # alone and in manifest order.
+        tmp_dir = None
+        entries = self._iter_manifest()
+        if self.compiler or self.stripper:
+            tmp_dir = tempfile.mkdtemp(prefix='{}-'.format(__name__))
+        if self.stripper:
+            entries = self.stripper.strip_entries(entries, tmp_dir)
+        if self.compiler:
+            entries = self._iter_compiled(entries, tmp_dir)
+        # Lookups are counted for this archive alone, the cache may be
+        # shared with other builds.
+        cache = self.cache.session() if self.cache else None
         try:
-            for (dirpath, _, filenames) in os.walk(self.build_path):
-                for filename in filenames:
-                    file_path = os.path.join(dirpath, filename)
-                    arcname = file_path[build_path_len:]
-                    archive.write(file_path, arcname)
+            members = ordered_map(self._compress,
+                                  ((source, arcname, stat, cache)
+                                   for (source, arcname, stat) in entries),
+                                  self.jobs)
+            archive = ZipFile(self.zip_file, 'w', ZIP_DEFLATED)
+            try:
+                for member in members:
+                    write_member(archive, member)
+                for zip_file in self.archives:
+                    self._copy_archive(archive, zip_file)
+            finally:
+                archive.close()
         finally:
-            archive.close()
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self._report(archive, cache)
+
+    def _report(self, archive, cache):
+        unzipped_size = sum(item.file_size for item in archive.infolist())
+        LOGGER.info('Archived %d file(s), %d byte(s) unzipped.',
+                    len(archive.infolist()), unzipped_size)
+        if unzipped_size > MAX_UNZIPPED_SIZE:
+            LOGGER.warning('Archive is over the %d byte(s) unzipped AWS '
+                           'Lambda limit.', MAX_UNZIPPED_SIZE)
+        if self.compression:
+            self.compression.report()
+
+        if cache:
+            cache.prune()
+
+    def _compress(self, source, arcname, stat, cache):
+        if self.compression:
+            return self.compression.compress(source, arcname, cache=cache,
+                                             stat=stat)
+        return compress_file(source, arcname, cache=cache, stat=stat)
+
+    def _iter_manifest(self):
+        for (arcname, source) in list(self.manifest.items()):
+            yield (source, arcname, self.stats[arcname])
+        # Lazy file sets are scanned as their files are compressed.
+        for fileset in self.filesets:
+            for entry in self._add_entries(fileset.entries()):
+                yield entry
+
+    def _iter_compiled(self, entries, tmp_dir):
+        # Sources are compiled once all are known, byte code already there
+        # was made by whatever interpreter installed it and is left out.
+        sources = []
+        for entry in entries:
+            if self.compiler.is_bytecode(entry[1]):
+                del self.manifest[entry[1]]
+                del self.stats[entry[1]]
+                continue
+            if self.compiler.is_source(entry[1]):
+                sources.append(entry)
+                if self.compiler.drop_sources:
+                    continue
+            yield entry
+        (compiled, failed) = self.compiler.compile(sources, tmp_dir)
+        for entry in self._add_entries(compiled):
+            yield entry
+        if self.compiler.drop_sources:
+            for entry in failed:
+                yield entry
+
+    def _copy_archive(self, archive, zip_file):
+        LOGGER.info('Copying members of "%s".', zip_file)
+        for member in read_members(zip_file):
+            if member.arcname in archive.NameToInfo:
+                LOGGER.debug('Skipping "%s" from "%s", already archived.',
+                             member.arcname, zip_file)
+                continue
+            write_member(archive, member)
+            if self.build_path:
+                self._stage_member(member)
+
+    def _stage_member(self, member):
+        # Members copied as they are still show up in the staged copy.
+        staged = os.path.join(self.build_path, member.arcname)
+        staged_dir = os.path.dirname(staged)
+        if not os.path.isdir(staged_dir):
+            os.makedirs(staged_dir)
+        data = member.data
+        if member.compress_type == ZIP_DEFLATED:
+            data = zlib.decompress(data, -15)
+        with open(staged, 'wb') as handle:
+            handle.write(data)
+        mode = (member.external_attr >> 16) & 0o7777
+        if mode:
+            os.chmod(staged, mode)
 
     def clean(self):
         if not (self.build_path and os.path.isdir(self.build_path)):
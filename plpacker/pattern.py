@@ -0,0 +1,229 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import logging
+import re
+
+LOGGER = logging.getLogger(__name__)
+
+_NEVER = '(?!)'
+_DOUBLE_SPLAT = '**'
+
+# Compiled patterns, shared by every `FileSet`.
+_PATTERNS = {}
+_PATTERN_SETS = {}
+
+
+class Pattern(object):
+    """
+    A `FileSet` glob compiled once into a regular expression matched against
+    relative, `/` separated, file paths.  Patterns are anchored at both ends.
+
+    A `**` path segment matches any number of directories, anywhere in the
+    glob, and a trailing `**` matches every file below.  Elsewhere `**` is a
+    plain `*`.  Like `glob.glob()`, wildcards do not match names starting
+    with a dot, except below a `**`, which matches those as well.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self._segments = _split(expression)
+        self.recursive = _DOUBLE_SPLAT in self._segments
+
+        self._segment_regexes = []
+        hidden = True
+        for segment in self._segments:
+            if segment == _DOUBLE_SPLAT:
+                hidden = False
+                self._segment_regexes.append(None)
+            else:
+                self._segment_regexes.append(_translate(segment, hidden))
+
+        if self._segments:
+            regex = self._join(self._segments, self._segment_regexes)
+        else:
+            regex = _NEVER
+        self.regex = '^{}$'.format(regex)
+        self._compiled = re.compile(self.regex)
+        self._compiled_segments = [re.compile('^{}$'.format(item))
+                                   if item is not None else None
+                                   for item in self._segment_regexes]
+
+    @staticmethod
+    def _join(segments, segment_regexes):
+        regex = []
+        last = len(segments) - 1
+        for (index, segment) in enumerate(segments):
+            if segment == _DOUBLE_SPLAT:
+                regex.append('(?:[^/]+/)*')
+            else:
+                regex.append(segment_regexes[index])
+                if index < last:
+                    regex.append('/')
+        return ''.join(regex)
+
+    def match(self, path):
+        return bool(self._compiled.match(path))
+
+    def could_match_below(self, directory):
+        """
+        Whether any file below `directory`, a list of path segments, could
+        be matched.
+        """
+        # A file adds at least one segment, so some of the glob must be left.
+        return any(state < len(self._segments)
+                   for state in self._walk(directory))
+
+    def covers_below(self, directory):
+        """
+        Whether every file below `directory`, a list of path segments, is
+        matched, so that it need not be listed at all.
+        """
+        return any(self._matches_all_from(state)
+                   for state in self._walk(directory))
+
+    def _matches_all_from(self, state):
+        # `**/*` where `*` also matches dot files.
+        return (len(self._segments) - state == 2
+                and self._segments[state] == _DOUBLE_SPLAT
+                and self._segment_regexes[state + 1] == '[^/]*')
+
+    def _walk(self, directory):
+        # Runs the directory segments through the glob segments as a
+        # non-deterministic automaton, returning the glob positions reached.
+        states = self._closure(set([0]))
+        for name in directory:
+            reached = set()
+            for state in states:
+                if state >= len(self._segments):
+                    continue
+                if self._segments[state] == _DOUBLE_SPLAT:
+                    reached.add(state)
+                elif self._compiled_segments[state].match(name):
+                    reached.add(state + 1)
+            states = self._closure(reached)
+            if not states:
+                break
+        return states
+
+    def _closure(self, states):
+        # `**` also matches no directory at all.
+        pending = list(states)
+        while pending:
+            state = pending.pop()
+            if state < len(self._segments) \
+                    and self._segments[state] == _DOUBLE_SPLAT \
+                    and state + 1 not in states:
+                states.add(state + 1)
+                pending.append(state + 1)
+        return states
+
+
+class PatternSet(object):
+    """
+    Several patterns compiled into a single regular expression, so a path
+    is tested against all of them at once.
+    """
+
+    def __init__(self, expressions):
+        self.patterns = tuple(compile_pattern(item) for item in expressions)
+        regex = '|'.join('(?:{})'.format(item.regex)
+                         for item in self.patterns)
+        self._compiled = re.compile(regex or _NEVER)
+
+    def match(self, path):
+        return bool(self._compiled.match(path))
+
+    def could_match_below(self, directory):
+        return any(item.could_match_below(directory)
+                   for item in self.patterns)
+
+    def covers_below(self, directory):
+        return any(item.covers_below(directory) for item in self.patterns)
+
+
+def compile_pattern(expression):
+    try:
+        return _PATTERNS[expression]
+    except KeyError:
+        pattern = _PATTERNS[expression] = Pattern(expression)
+        return pattern
+
+
+def compile_patterns(expressions):
+    expressions = tuple(expressions)
+    try:
+        return _PATTERN_SETS[expressions]
+    except KeyError:
+        patterns = _PATTERN_SETS[expressions] = PatternSet(expressions)
+        return patterns
+
+
+def _split(expression):
+    if not expression:
+        return []
+    segments = expression.split('/')
+    if len(segments) > 1 and segments[-1] == '' \
+            and segments[-2] == _DOUBLE_SPLAT:
+        # `dir/**/` is `dir/**`.
+        segments.pop()
+    if segments[-1] == _DOUBLE_SPLAT:
+        # A trailing `**` is every file below, dot files included.
+        segments.append('*')
+    return [segment if segment == _DOUBLE_SPLAT
+            else segment.replace(_DOUBLE_SPLAT, '*')
+            for segment in segments]
+
+
+def _translate(segment, hidden=True):
+    """
+    Translates a single path segment glob to a regular expression.  Like
+    `glob.glob()`, wildcards do not match a leading dot unless `hidden` is
+    false or the glob itself starts with one.
+    """
+    regex = []
+    index = 0
+    length = len(segment)
+    while index < length:
+        char = segment[index]
+        index += 1
+        if char == '*':
+            regex.append('[^/]*')
+        elif char == '?':
+            regex.append('[^/]')
+        elif char == '[':
+            (chars, index) = _translate_class(segment, index)
+            regex.append(chars)
+        else:
+            regex.append(re.escape(char))
+
+    if hidden and not segment.startswith('.') and _is_magic(segment):
+        regex.insert(0, '(?!\\.)')
+    return ''.join(regex)
+
+
+def _translate_class(segment, index):
+    # Returns the regular expression for the character class opened right
+    # before `index`, and the index following it.
+    length = len(segment)
+    end = index
+    if end < length and segment[end] == '!':
+        end += 1
+    if end < length and segment[end] == ']':
+        end += 1
+    while end < length and segment[end] != ']':
+        end += 1
+    if end >= length:
+        return ('\\[', index)
+
+    chars = segment[index:end].replace('\\', '\\\\')
+    if chars.startswith('!'):
+        # Negated classes must not match across segments.
+        chars = '^' + chars[1:] + '/'
+    elif chars.startswith('^'):
+        chars = '\\' + chars
+    return ('[{}]'.format(chars), end + 1)
+
+
+def _is_magic(segment):
+    return any(char in segment for char in '*?[')
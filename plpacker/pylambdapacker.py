@@ -1,30 +1,289 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import hashlib
 import logging
 import logging.config
+import os
+import shutil
+import tempfile
+from zipfile import ZipFile
 
+from plpacker.archive import copy_archive
+from plpacker.cache import prune_files
+from plpacker.fileset import file_stat
+from plpacker.packager import Packager
+from plpacker.watch import IncrementalArchive, Watcher
 
-LOGGER = logging.getLogger()
+
+LOGGER = logging.getLogger(__name__)
+
+# Where Lambda looks for Python packages in a layer.
+LAYER_PREFIX = 'python/'
 
 
 class PyLambdaPacker(object):
-    # pylint: disable=too-few-public-methods
-    def __init__(self, virtual_env, packager, filesets):
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, virtual_env, packager, filesets, base_archive_dir=None,
+                 index=None, dependencies=None, layer_dir=None,
+                 base_archive_max_size=None):
+        # pylint: disable=too-many-arguments
         super(PyLambdaPacker, self).__init__()
         self.virtual_env = virtual_env
         self.packager = packager
         self.filesets = filesets
+        self.base_archive_dir = base_archive_dir
+        # Least recently used dependencies archives are evicted beyond this
+        # many bytes, none without it.
+        self.base_archive_max_size = base_archive_max_size
+        self.index = index
+        # Archive of the dependencies alone, used as is when set, see
+        # `prepare_dependencies()`.
+        self.dependencies = dependencies
+        # With a `layer_dir` the dependencies go in a separate layer archive,
+        # see `build_layer()`, and the output archive only has the project
+        # files.
+        self.layer_dir = layer_dir
+        self.layer = None
+        self._dependencies = None
 
     def build(self):
-        # Create virtualenv
-        self.virtual_env.create()
+        if self.layer_dir:
+            self.build_layer()
+
+        # Nothing is rebuilt when neither the dependencies nor the project
+        # files changed since the last build.
+        fingerprint = self._fingerprint() if self.index else None
+        if fingerprint and self._is_unchanged(fingerprint):
+            LOGGER.info('No changes, reusing archive: %s',
+                        self.packager.zip_file)
+            self.index.save()
+            return
+
+        self._build()
+
+        if fingerprint:
+            stat = file_stat(os.stat(self.packager.zip_file))
+            self.index.archive = {'fingerprint': fingerprint,
+                                  'path': self.packager.zip_file,
+                                  'size': stat.size,
+                                  'mtime_ns': stat.mtime_ns}
+            self.index.save()
+
+    def watch(self):
+        """
+        Builds the archive, then updates its project files whenever they
+        change, until interrupted.  Dependencies are only installed once.
+        """
+        dependencies = None
+        if self.layer_dir:
+            self.build_layer()
+        else:
+            dependencies = self._base_archive()
+        tmp_path = None
+        if not dependencies:
+            (handle, tmp_path) = tempfile.mkstemp(
+                suffix='.zip', prefix='{}-'.format(__name__))
+            os.close(handle)
+            if self.layer_dir:
+                # Nothing but the project files.
+                ZipFile(tmp_path, 'w').close()
+            else:
+                self.virtual_env.create()
+                self._package_dependencies(tmp_path)
+            dependencies = tmp_path
+        try:
+            # Keeps its own link to the dependencies.
+            archive = IncrementalArchive(self.packager.zip_file, dependencies,
+                                         jobs=self.packager.jobs,
+                                         cache=self.packager.cache,
+                                         compression=self.packager.compression)
+        finally:
+            if tmp_path:
+                os.remove(tmp_path)
+        try:
+            Watcher(self.filesets or (), archive).run()
+        finally:
+            archive.close()
+
+    def build_layer(self):
+        """
+        Writes the dependencies, below `python/`, to a layer archive in
+        `layer_dir` named after their fingerprint, unless it is already
+        there.  Returns its path, also kept as `layer`.
+        """
+        fingerprint = self._dependencies_fingerprint()
+        if fingerprint and os.path.isfile(self._layer_path(fingerprint)):
+            self.layer = self._layer_path(fingerprint)
+            LOGGER.info('Reusing dependencies layer: %s', self.layer)
+            return self.layer
+
+        tmp_dir = tempfile.mkdtemp(prefix='{}-'.format(__name__))
+        try:
+            dependencies = self.prepare_dependencies(tmp_dir)
+            if not fingerprint:
+                # Only known from what was installed.
+                digest = hashlib.sha256()
+                for fileset in self.virtual_env.filesets:
+                    digest.update(fileset.fingerprint().encode('utf-8'))
+                fingerprint = digest.hexdigest()
+            self.layer = self._layer_path(fingerprint)
+            if os.path.isfile(self.layer):
+                LOGGER.info('Reusing dependencies layer: %s', self.layer)
+            else:
+                LOGGER.info('Writing dependencies layer: %s', self.layer)
+                copy_archive(dependencies, self.layer, prefix=LAYER_PREFIX)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return self.layer
+
+    def _layer_path(self, fingerprint):
+        return os.path.join(self.layer_dir, 'layer-{}.zip'.format(fingerprint))
+
+    def prepare_dependencies(self, tmp_dir):
+        """
+        Sets `dependencies` to the cached base archive, or to one written in
+        `tmp_dir` when there is no cache, so builds sharing the same
+        dependencies can all be given it.
+        """
+        path = self._base_archive()
+        if not path:
+            path = os.path.join(tmp_dir, 'dependencies.zip')
+            self.virtual_env.create()
+            self._package_dependencies(path)
+        self.dependencies = path
+        return path
+
+    def _build(self):
+        # The dependencies come from a cached dependencies only archive when
+        # possible, leaving just the project files to be compressed.
+        base_archive = None if self.layer_dir else self._base_archive()
+
         filesets = []
         if self.filesets:
             filesets += self.filesets
-        if self.virtual_env.filesets:
-            filesets += self.virtual_env.filesets
+        if not (base_archive or self.layer_dir):
+            # Create virtualenv
+            self.virtual_env.create()
+            if self.virtual_env.filesets:
+                filesets += self.virtual_env.filesets
 
         for fileset in filesets:
             self.packager.add_fileset_items(fileset)
+        if base_archive:
+            self.packager.add_archive(base_archive)
         self.packager.package()
+
+    def _fingerprint(self):
+        # In a layer the dependencies are none of the output archive's
+        # business.
+        dependencies = ('layer' if self.layer_dir
+                        else self._dependencies_fingerprint())
+        if not dependencies:
+            return None
+        digest = hashlib.sha256(dependencies.encode('utf-8'))
+        # The project files are compiled and compressed too.
+        _update_settings(digest, self._packager_settings())
+        for fileset in self.filesets or ():
+            digest.update(b'\0fileset\0'
+                          + fileset.fingerprint(self.index).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _is_unchanged(self, fingerprint):
+        archive = self.index.archive
+        if not archive or archive['fingerprint'] != fingerprint \
+                or archive['path'] != self.packager.zip_file:
+            return False
+        try:
+            stat = file_stat(os.stat(self.packager.zip_file))
+        except OSError:
+            return False
+        return (archive['size'], archive['mtime_ns']) \
+            == (stat.size, stat.mtime_ns)
+
+    def _dependencies_fingerprint(self):
+        # What goes in the archive from the virtualenv, `None` when that is
+        # not known without installing it.
+        if self._dependencies is None:
+            fingerprint = self.virtual_env.fingerprint()
+            if not fingerprint:
+                LOGGER.info('Dependencies can not be cached.')
+                self._dependencies = ''
+                return None
+            digest = hashlib.sha256(fingerprint.encode('utf-8'))
+            for exclude in self.virtual_env.fileset_excludes or ():
+                digest.update(b'\0exclude\0' + exclude.encode('utf-8'))
+            # Whatever changes what is archived of the dependencies, or how.
+            _update_settings(digest, (
+                (b'slimming', self.virtual_env.slimming),
+                (b'runtime', self.virtual_env.runtime_provided),
+                (b'shaking', self.virtual_env.tree_shaker),
+            ) + self._packager_settings())
+            if self.virtual_env.tree_shaker:
+                # What is imported depends on the project files too.
+                for fileset in self.filesets or ():
+                    digest.update(b'\0fileset\0' + fileset.fingerprint(
+                        self.index).encode('utf-8'))
+            self._dependencies = digest.hexdigest()
+        return self._dependencies or None
+
+    def _packager_settings(self):
+        # Whatever changes how the packager archives files, by name.
+        return ((b'compile', self.packager.compiler),
+                (b'strip', self.packager.stripper),
+                (b'compression', self.packager.compression))
+
+    def _base_archive(self):
+        if self.dependencies:
+            return self.dependencies
+        if not self.base_archive_dir:
+            return None
+
+        dependencies = self._dependencies_fingerprint()
+        if not dependencies:
+            return None
+
+        path = os.path.join(self.base_archive_dir,
+                            'base-{}.zip'.format(dependencies))
+        if os.path.isfile(path):
+            LOGGER.info('Reusing dependencies archive: %s', path)
+            # Bump the modification time, eviction is least recently used.
+            os.utime(path, None)
+            return path
+
+        LOGGER.info('Building dependencies archive: %s', path)
+        if not os.path.isdir(self.base_archive_dir):
+            os.makedirs(self.base_archive_dir)
+        self.virtual_env.create()
+        # Written next to its final location and renamed into place, so
+        # concurrent builds never pick up a partial archive.
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            self._package_dependencies(tmp_path)
+            os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.base_archive_max_size is not None:
+            prune_files(self.base_archive_dir, self.base_archive_max_size,
+                        keep=(path,))
+        return path
+
+    def _package_dependencies(self, path):
+        base = Packager(path, jobs=self.packager.jobs,
+                        cache=self.packager.cache,
+                        compiler=self.packager.compiler,
+                        stripper=self.packager.stripper,
+                        compression=self.packager.compression)
+        for fileset in self.virtual_env.filesets:
+            base.add_fileset_items(fileset)
+        base.package()
+
+
+def _update_settings(digest, settings):
+    # Hashes the key of each setting in use.
+    for (name, setting) in settings:
+        if setting:
+            digest.update(b'\0' + name + b'\0'
+                          + setting.key().encode('utf-8'))
@@ -0,0 +1,146 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import csv
+import json
+import logging
+import os
+import posixpath
+import subprocess
+import sys
+import threading
+
+from plpacker.utils import canonical_name, sanitized_env
+
+LOGGER = logging.getLogger(__name__)
+
+_RUNTIME_SCRIPT = 'import sys; print("python%d.%d" % sys.version_info[:2])'
+
+
+class RuntimeProvided(object):
+    """
+    Distributions the AWS Lambda runtime already provides, left out of the
+    dependencies.  `runtimes` lists them by runtime, `python3.8` and the
+    like, the runtime being that of the `python` interpreter.
+
+    Distributions are left out whole, every file their `RECORD` lists and
+    their `.dist-info` directory, whatever their names.
+    """
+    def __init__(self, runtimes, python=None):
+        self.runtimes = runtimes or {}
+        self.python = python or sys.executable
+        self._runtime = None
+        self._distributions = None
+        self._lock = threading.Lock()
+
+    @property
+    def runtime(self):
+        with self._lock:
+            if self._runtime is None:
+                output = subprocess.check_output(
+                    [self.python, '-c', _RUNTIME_SCRIPT], env=sanitized_env())
+                self._runtime = output.decode('utf-8').strip()
+        return self._runtime
+
+    def distributions(self):
+        """
+        Canonical names of the distributions provided by the runtime.
+        """
+        if self._distributions is None:
+            runtime = self.runtime
+            if runtime not in self.runtimes:
+                raise ValueError(
+                    'Unknown runtime "{}", expected one of: {}.  List what '
+                    'it provides in virtualenv.runtime_provided.runtimes.'
+                    .format(runtime, ', '.join(sorted(self.runtimes))))
+            self._distributions = frozenset(
+                canonical_name(name)
+                for name in self.runtimes[runtime] or ())
+        return self._distributions
+
+    def key(self):
+        """
+        Identifies what is left out, see `PyLambdaPacker`.
+        """
+        return json.dumps([self.runtime, sorted(self.distributions())])
+
+    def files(self, directory):
+        """
+        Paths, relative to a `site-packages` `directory`, of the files of the
+        distributions provided by the runtime installed there.
+        """
+        files = set()
+        for (_, paths) in self._installed(directory):
+            files.update(paths)
+        return files
+
+    def report(self, directory):
+        """
+        Logs the distributions left out of `directory`, returns the bytes
+        left out.
+        """
+        total = 0
+        for (name, paths) in self._installed(directory):
+            size = 0
+            for path in paths:
+                try:
+                    size += os.path.getsize(os.path.join(directory, path))
+                except OSError:
+                    continue
+            LOGGER.info('Leaving out "%s", provided by the %s runtime: %d '
+                        'file(s), %d byte(s).', name, self.runtime,
+                        len(paths), size)
+            total += size
+        return total
+
+    def _installed(self, directory):
+        # Yields the name and files of each provided distribution installed
+        # in `directory`.
+        distributions = self.distributions()
+        if not distributions:
+            return
+        for (name, paths) in installed_distributions(directory):
+            if canonical_name(name.split('-')[0]) in distributions:
+                yield (name, paths)
+
+
+def installed_distributions(directory):
+    """
+    Yields the name, `name-version`, and the files of each distribution
+    installed in a `site-packages` `directory`: every file its `RECORD`
+    lists, scripts installed out of `directory` aside, and its
+    `.dist-info` directory.  Paths are relative to `directory`.
+    """
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith('.dist-info'):
+            continue
+        paths = _read_record(directory, name)
+        for (dirpath, _, filenames) in os.walk(os.path.join(directory,
+                                                            name)):
+            relative = os.path.relpath(dirpath, directory)
+            paths.update(posixpath.join(*(relative.split(os.sep)
+                                          + [filename]))
+                         for filename in filenames)
+        yield (name[:-len('.dist-info')], paths)
+
+
+def _read_record(directory, dist_info):
+    paths = set()
+    try:
+        with open(os.path.join(directory, dist_info, 'RECORD')) as handle:
+            lines = handle.read().splitlines()
+    except (IOError, OSError):
+        LOGGER.warning('No RECORD in "%s", only its own files are known.',
+                       dist_info)
+        return paths
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        path = posixpath.normpath(row[0])
+        if not path.startswith('..'):
+            paths.add(path)
+    return paths
@@ -0,0 +1,245 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import errno
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+
+try:
+    import queue
+    import socketserver
+except ImportError:  # pragma: no cover
+    import Queue as queue
+    import SocketServer as socketserver
+
+from plpacker.cache import Caches
+from plpacker.cli import parse_args, run, setup_logging
+from plpacker.client import default_socket
+from plpacker.utils import build_context, current_build
+
+LOGGER = logging.getLogger(__name__)
+
+_LOG_FORMAT = '%(levelname)s - %(message)s'
+
+
+class BuildServer(socketserver.UnixStreamServer):
+    """
+    Daemon building for `plp` clients, on the Unix socket `path`.  Builds
+    run on a pool of `workers` threads, requests beyond that wait their turn.
+    The `caches`, a `Caches`, stay in memory from one build to the next.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, path, workers=4, caches=None, default_cache_dir=None):
+        self.path = path
+        self.workers = workers
+        self.caches = caches or Caches()
+        self.default_cache_dir = default_cache_dir
+        self.builds = itertools.count(1)
+        self._requests = queue.Queue()
+        _remove_stale_socket(path)
+        socketserver.UnixStreamServer.__init__(self, path, BuildHandler)
+        self._threads = [threading.Thread(target=self._work)
+                         for _ in range(workers)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def server_bind(self):
+        # Only the user running the daemon may talk to it.
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address))
+
+    def _work(self):
+        while True:
+            (request, client_address) = self._requests.get()
+            if request is None:
+                return
+            try:
+                self.finish_request(request, client_address)
+            except Exception:  # pylint: disable=broad-except
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def build(self, argv, cwd):
+        """
+        Builds as `plp argv` would in `cwd`, returning the exit status.
+        """
+        try:
+            cli_args = parse_args(argv, _ClientArgumentParser)
+        except SystemExit as exception:
+            LOGGER.error('Invalid arguments: %s', ' '.join(argv))
+            return exception.code if isinstance(exception.code, int) else 2
+        if cli_args.watch:
+            LOGGER.error('--watch is not supported by the build server.')
+            return 2
+        return run(cli_args, cwd, caches=self.caches,
+                   default_cache_dir=self.default_cache_dir)
+
+    def server_close(self):
+        for _ in self._threads:
+            self._requests.put((None, None))
+        for thread in self._threads:
+            thread.join()
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BuildHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one `{"argv": [...], "cwd": "..."}` line, then streams the build
+    log back as `{"log": "..."}` lines and ends with `{"status": 0}`.
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            (argv, cwd) = (request['argv'], request['cwd'])
+        except (ValueError, KeyError, TypeError):
+            self._send({'status': 2})
+            return
+
+        handler = _ClientLogHandler(self._send, next(self.server.builds))
+        logger = logging.getLogger('plpacker')
+        logger.addHandler(handler)
+        try:
+            with build_context(handler.build):
+                status = self._build(argv, cwd)
+        finally:
+            logger.removeHandler(handler)
+        self._send({'status': status})
+
+    def _build(self, argv, cwd):
+        try:
+            return self.server.build(argv, cwd)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception('Build failed.')
+            return 1
+
+    def _send(self, message):
+        try:
+            self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        except (IOError, OSError):
+            LOGGER.debug('Client went away.')
+
+
+class _ClientLogHandler(logging.Handler):
+    # Only sends what is logged for the client's `build`, from whichever
+    # thread, see `build_context()`.
+    def __init__(self, send, build):
+        logging.Handler.__init__(self)
+        self.send = send
+        self.build = build
+        self.setFormatter(logging.Formatter(_LOG_FORMAT))
+
+    def filter(self, record):
+        # Handlers run in the thread logging the record.
+        return current_build() == self.build
+
+    def emit(self, record):
+        self.send({'log': self.format(record)})
+
+
+class _ClientArgumentParser(argparse.ArgumentParser):
+    # Logs the usage, help and errors `argparse` would print, so they are
+    # sent to the client rather than to the daemon's own output.
+    def __init__(self, **kwargs):
+        kwargs.setdefault('prog', 'plp')
+        argparse.ArgumentParser.__init__(self, **kwargs)
+
+    def error(self, message):
+        LOGGER.error('%s%s: error: %s', self.format_usage(), self.prog,
+                     message)
+        raise SystemExit(2)
+
+    def print_usage(self, file=None):
+        LOGGER.info('%s', self.format_usage().rstrip())
+
+    def print_help(self, file=None):
+        LOGGER.info('%s', self.format_help().rstrip())
+
+    def exit(self, status=0, message=None):
+        if message:
+            (LOGGER.error if status else LOGGER.info)('%s', message.rstrip())
+        raise SystemExit(status)
+
+
+def _remove_stale_socket(path):
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as exception:
+        if exception.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            raise
+        LOGGER.info('Removing stale socket: %s', path)
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError('A build server is already listening on: {}'
+                       .format(path))
+
+
+def parse_serve_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='plp serve',
+        description='Build daemon keeping caches warm between builds.')
+
+    parser.add_argument('--socket',
+                        dest='socket',
+                        default=default_socket(),
+                        help='Unix socket to listen on (default: %(default)s)')
+
+    parser.add_argument('--workers',
+                        dest='workers',
+                        type=int,
+                        default=4,
+                        help='builds run at once (default: %(default)s)')
+
+    parser.add_argument('--cache-dir',
+                        dest='cache_dir',
+                        default=os.path.join('~', '.cache',
+                                             'py-lambda-packer'),
+                        help=('cache directory for builds not configuring '
+                              'one (default: %(default)s)'))
+
+    parser.add_argument('--memory-cache-size',
+                        dest='memory_cache_size',
+                        type=int,
+                        default=256 * 1024 ** 2,
+                        help=('bytes of compressed members kept in memory '
+                              '(default: %(default)s)'))
+
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_serve_args(argv)
+    setup_logging()
+    caches = Caches(member_memory_size=args.memory_cache_size)
+    server = BuildServer(args.socket, args.workers, caches,
+                         os.path.expanduser(args.cache_dir))
+    LOGGER.info('Listening on "%s" with %d worker(s).', args.socket,
+                args.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        LOGGER.info('Stopped.')
+    finally:
+        server.server_close()
+    return 0
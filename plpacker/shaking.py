@@ -0,0 +1,222 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from plpacker.pattern import compile_patterns
+from plpacker.runtime import installed_distributions
+from plpacker.utils import sanitized_env
+
+LOGGER = logging.getLogger(__name__)
+
+# Run by the target interpreter, so sources parse whatever their Python
+# version.  Reads `[roots, modules]` as JSON and writes back the modules
+# reached, `{name: [path, importer]}`, and those not found in `roots` nor
+# by the interpreter itself, `{name: importer}`.
+_SCRIPT = r'''
+import ast, json, os, sys
+try:
+    from importlib.machinery import EXTENSION_SUFFIXES
+    from importlib.util import find_spec
+except ImportError:
+    import imp
+    EXTENSION_SUFFIXES = [suffix for (suffix, _, kind) in imp.get_suffixes()
+                          if kind == imp.C_EXTENSION]
+    def find_spec(name):
+        try:
+            return imp.find_module(name)
+        except ImportError:
+            return None
+(roots, modules) = json.loads(sys.stdin.read())
+sys.path = [path for path in sys.path if path not in roots]
+
+def find(name):
+    for root in roots:
+        base = os.path.join(root, *name.split('.'))
+        for path in [os.path.join(base, '__init__.py'), base + '.py'] \
+                + [base + suffix for suffix in EXTENSION_SUFFIXES]:
+            if os.path.isfile(path):
+                return path
+        if os.path.isdir(base):
+            return base
+
+def is_external(name):
+    try:
+        return find_spec(name.split('.')[0]) is not None
+    except Exception:
+        return False
+
+def imports(name, path):
+    with open(path, 'rb') as handle:
+        tree = ast.parse(handle.read(), path)
+    package = name if path.endswith('__init__.py') else name.rpartition('.')[0]
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield (alias.name, False)
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module
+            if node.level:
+                parts = package.split('.') if package else []
+                parts = parts[:len(parts) - node.level + 1]
+                module = '.'.join(parts + ([module] if module else []))
+            if not module:
+                continue
+            yield (module, False)
+            for alias in node.names:
+                if alias.name != '*':
+                    yield (module + '.' + alias.name, True)
+
+reached = {}
+missing = {}
+elsewhere = set()
+pending = [(module, None, False) for module in reversed(modules)]
+while pending:
+    (name, importer, optional) = pending.pop()
+    if name in reached or name in missing or name in elsewhere:
+        continue
+    parent = name.rpartition('.')[0]
+    if parent and parent not in reached:
+        if parent in elsewhere:
+            elsewhere.add(name)
+            continue
+        if parent in missing:
+            continue
+        pending.append((name, importer, optional))
+        pending.append((parent, importer, optional))
+        continue
+    path = find(name)
+    if path is None:
+        if optional or is_external(name):
+            elsewhere.add(name)
+        else:
+            missing[name] = importer
+        continue
+    reached[name] = [path, importer]
+    if not path.endswith('.py'):
+        continue
+    try:
+        for (module, is_optional) in imports(name, path):
+            pending.append((module, name, is_optional))
+    except (SyntaxError, ValueError) as exception:
+        sys.stderr.write('Unable to parse "%s": %s\n' % (path, exception))
+json.dump({'reached': reached, 'missing': missing}, sys.stdout)
+'''
+
+
+class TreeShaker(object):
+    """
+    Leaves out of the dependencies the distributions none of the modules of
+    which are imported, directly or not, by the `handlers`, `module.function`
+    as given to Lambda.  Imports are traced statically, by the target
+    interpreter, `python`, through the `project_dirs` then `site-packages`.
+
+    Imports made dynamically can not be traced, the `keep` globs, relative to
+    `site-packages`, are always kept.  Files no distribution owns are kept
+    too.
+    """
+    def __init__(self, handlers, keep=(), python=None, project_dirs=()):
+        if not handlers:
+            raise ValueError('Tree shaking needs the handlers to start from.')
+        self.handlers = list(handlers)
+        self.keep = list(keep or ())
+        self.python = python or sys.executable
+        self.project_dirs = list(project_dirs or ())
+        self._dropped = {}
+
+    @property
+    def modules(self):
+        # `app.handler` is function `handler` of module `app`.
+        return [handler.replace('/', '.').rpartition('.')[0] or handler
+                for handler in self.handlers]
+
+    def key(self):
+        """
+        Identifies what is kept, along with the project files, see
+        `PyLambdaPacker`.
+        """
+        return json.dumps([self.python, self.handlers, self.keep])
+
+    def analyse(self, site_package_dirs):
+        """
+        Traces the imports of the handlers, then works out and logs what is
+        left out of each of the `site_package_dirs`, see `files()`.  Returns
+        the bytes left out.
+        """
+        (reached, missing) = self._trace(self.project_dirs
+                                         + list(site_package_dirs))
+        for (name, importer) in sorted(missing.items()):
+            LOGGER.debug('Import of "%s" by "%s" not found.', name, importer)
+        if missing:
+            LOGGER.info('%d import(s) not found, see the debug log.',
+                        len(missing))
+
+        total = 0
+        self._dropped = {}
+        for directory in site_package_dirs:
+            (dropped, size) = self._shake(directory, reached)
+            self._dropped[directory] = dropped
+            total += size
+        LOGGER.info('Tree shaking left out %d byte(s).', total)
+        return total
+
+    def files(self, directory):
+        """
+        Paths, relative to a `site-packages` `directory`, of the files left
+        out, once analysed.
+        """
+        return self._dropped.get(directory, set())
+
+    def _shake(self, directory, reached):
+        # Returns the files left out of `directory` and their size.
+        imported = {}
+        for (name, (path, importer)) in reached.items():
+            relative = os.path.relpath(path, directory)
+            if not relative.startswith(os.pardir):
+                imported[relative.replace(os.sep, '/')] = (name, importer)
+
+        keep = compile_patterns(self.keep)
+        (dropped, total) = (set(), 0)
+        for (name, paths) in installed_distributions(directory):
+            reason = next((imported[path] for path in sorted(paths)
+                           if path in imported), None)
+            if reason:
+                LOGGER.debug('Keeping "%s", "%s" is imported by "%s".', name,
+                             reason[0], reason[1])
+                continue
+            paths = set(path for path in paths if not keep.match(path))
+            size = 0
+            for path in paths:
+                try:
+                    size += os.path.getsize(os.path.join(directory, path))
+                except OSError:
+                    continue
+            LOGGER.info('Leaving out "%s", none of its modules is imported '
+                        'by the handlers: %d file(s), %d byte(s).', name,
+                        len(paths), size)
+            dropped.update(paths)
+            total += size
+        return (dropped, total)
+
+    def _trace(self, roots):
+        process = subprocess.Popen(
+            [self.python, '-c', _SCRIPT], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            env=sanitized_env())
+        (stdoutdata, stderrdata) = process.communicate(
+            json.dumps([roots, self.modules]).encode('utf-8'))
+        for line in stderrdata.decode('utf-8', 'replace').splitlines():
+            LOGGER.warning(line)
+        if process.returncode != 0:
+            raise RuntimeError('Tracing imports with "{}" failed.'
+                               .format(self.python))
+        result = json.loads(stdoutdata.decode('utf-8'))
+        for module in self.modules:
+            if module not in result['reached']:
+                raise ValueError('Handler module "{}" not found.'
+                                 .format(module))
+        return (result['reached'], result['missing'])
@@ -0,0 +1,164 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import OrderedDict
+import json
+import logging
+import os
+
+from plpacker.fileset import FileSet
+from plpacker.pattern import compile_patterns
+from plpacker.utils import canonical_name
+
+LOGGER = logging.getLogger(__name__)
+
+# Files the runtime never reads, by profile, then by distribution, `*` being
+# every distribution, then by rule.  The globs of a distribution are relative
+# to each of its top level packages, the others to `site-packages`.
+_SAFE = OrderedDict([
+    ('bytecode', ['**/__pycache__/**', '**/*.pyc', '**/*.pyo']),
+    ('extension-sources', ['**/*.pyx', '**/*.pxd', '**/*.pxi', '**/*.c',
+                           '**/*.cpp', '**/*.h', '**/*.hpp']),
+    ('type-stubs', ['**/*.pyi', '**/py.typed']),
+    ('install-metadata', ['*.dist-info/INSTALLER', '*.dist-info/REQUESTED',
+                          '*.dist-info/WHEEL', '*.dist-info/direct_url.json',
+                          '*.egg-info/SOURCES.txt']),
+])
+
+_AGGRESSIVE = OrderedDict(_SAFE)
+_AGGRESSIVE.update([
+    ('tests', ['**/tests/**', '**/test/**', '**/conftest.py']),
+    # Not every `*.md` or `*.rst`, licenses have to stay.
+    ('docs', ['**/doc/**', '**/docs/**', '**/examples/**']),
+])
+
+PROFILES = {
+    'safe': OrderedDict([('*', _SAFE)]),
+    'aggressive': OrderedDict([
+        ('*', _AGGRESSIVE),
+        ('botocore', OrderedDict([
+            ('examples', ['data/**/examples-1.json']),
+        ])),
+    ]),
+}
+
+
+class Slimming(object):
+    """
+    Leaves out of the dependencies what the runtime never reads, by the
+    `rules` of a slimming profile, see `PROFILES`.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+
+    @classmethod
+    def from_config(cls, value):
+        """
+        Slimming by the named profile, or by rules given as is, `None`
+        without any.
+        """
+        if not value:
+            return None
+        if isinstance(value, dict):
+            return cls(value)
+        if value not in PROFILES:
+            raise ValueError('Unknown slimming profile "{}", expected one '
+                             'of: {}'.format(value,
+                                             ', '.join(sorted(PROFILES))))
+        return cls(PROFILES[value])
+
+    def key(self):
+        """
+        Identifies what is left out, see `PyLambdaPacker`.
+        """
+        return json.dumps(self.rules, sort_keys=True)
+
+    def excludes(self, directory):
+        """
+        The globs of every rule, in a `site-packages` `directory`, by rule
+        name.  Distributions not installed there have none.
+        """
+        top_levels = _top_levels(directory)
+        excludes = OrderedDict()
+        for (distribution, rules) in self.rules.items():
+            prefixes = ([''] if distribution == '*' else
+                        ['{}/'.format(name) for name in sorted(
+                            top_levels.get(canonical_name(distribution), ()))])
+            for (rule, globs) in rules.items():
+                if distribution != '*':
+                    rule = '{}:{}'.format(distribution, rule)
+                excludes.setdefault(rule, []).extend(
+                    prefix + glob for prefix in prefixes for glob in globs)
+        return excludes
+
+    def report(self, directory, excludes=(), skip=()):
+        """
+        Logs the files and bytes each rule leaves out of `directory`, files
+        matched by several rules counting for the first one only, files
+        already left out by `excludes` or `skip` not at all.  Returns the
+        bytes left out.
+        """
+        rules = [(rule, globs, compile_patterns(globs))
+                 for (rule, globs) in self.excludes(directory).items()
+                 if globs]
+        sizes = OrderedDict((rule, [0, 0]) for (rule, _, _) in rules)
+        if rules:
+            # A single walk for all the rules.
+            fileset = FileSet(directory,
+                              includes=[glob for (_, globs, _) in rules
+                                        for glob in globs],
+                              excludes=excludes or (), lazy=True, sort=False,
+                              skip=skip)
+            for (_, arcname, stat) in fileset.entries():
+                arcname = arcname.replace(os.sep, '/')
+                for (rule, _, patterns) in rules:
+                    if patterns.match(arcname):
+                        sizes[rule][0] += 1
+                        sizes[rule][1] += stat.size
+                        break
+        for (rule, (files, size)) in sizes.items():
+            LOGGER.info('Slimming rule "%s" removed %d file(s), %d byte(s).',
+                        rule, files, size)
+        total = sum(size for (_, size) in sizes.values())
+        LOGGER.info('Slimming removed %d byte(s) from: %s', total, directory)
+        return total
+
+
+def _top_levels(directory):
+    # Top level packages by canonical distribution name, from the metadata
+    # of what is installed in `directory`.
+    top_levels = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return top_levels
+    for name in names:
+        if not name.endswith(('.dist-info', '.egg-info')):
+            continue
+        metadata = os.path.join(directory, name)
+        packages = _read_top_level(metadata) or _read_record(metadata)
+        distribution = canonical_name(name.split('-')[0])
+        top_levels.setdefault(distribution, set()).update(
+            package for package in packages
+            if os.path.isdir(os.path.join(directory, package)))
+    return top_levels
+
+
+def _read_top_level(metadata):
+    try:
+        with open(os.path.join(metadata, 'top_level.txt')) as handle:
+            return set(line.strip() for line in handle if line.strip())
+    except (IOError, OSError):
+        return set()
+
+
+def _read_record(metadata):
+    try:
+        with open(os.path.join(metadata, 'RECORD')) as handle:
+            paths = [line.split(',')[0] for line in handle]
+    except (IOError, OSError):
+        return set()
+    return set(path.split('/')[0] for path in paths
+               if '/' in path and not path.startswith('..')
+               and not path.split('/')[0].endswith(('.dist-info',
+                                                    '.data')))
@@ -0,0 +1,134 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+
+from plpacker.index import hash_file
+from plpacker.utils import ordered_map, sanitized_env
+
+LOGGER = logging.getLogger(__name__)
+
+_ELF_MAGIC = b'\x7fELF'
+# `e_type` of shared objects, Python extensions included.
+_ET_DYN = 3
+
+
+def is_shared_object(path):
+    """
+    Whether `path` is an ELF shared object, from its header alone.
+    """
+    try:
+        with open(path, 'rb') as handle:
+            header = bytearray(handle.read(18))
+    except (IOError, OSError):
+        return False
+    if len(header) < 18 or bytes(header[0:4]) != _ELF_MAGIC:
+        return False
+    # `EI_DATA` is 1 for little endian, 2 for big endian.
+    if header[5] == 2:
+        e_type = header[16] << 8 | header[17]
+    else:
+        e_type = header[17] << 8 | header[16]
+    return e_type == _ET_DYN
+
+
+class Stripper(object):
+    """
+    Strips the symbols of the ELF shared objects archived, native
+    extensions mostly, with the `strip` tool, `jobs` at a time.
+
+    Stripped files are kept in `cache`, a `FileCache`, by the content of the
+    original, so each is only ever stripped once.  Without a cache they are
+    written to the temporary directory of the build.
+    """
+    def __init__(self, strip='strip', args=('--strip-unneeded',), cache=None,
+                 jobs=1):
+        # pylint: disable=too-many-arguments
+        self.strip = strip
+        self.args = tuple(args)
+        self.cache = cache
+        self.jobs = jobs
+
+    def key(self):
+        """
+        Identifies how files are stripped, see `PyLambdaPacker`.
+        """
+        return '\0'.join((self.strip,) + self.args)
+
+    def strip_entries(self, entries, tmp_dir):
+        """
+        Yields the `(source, arcname, stat)` `entries`, those of shared
+        objects pointing at a stripped copy instead.
+        """
+        if not self._is_available():
+            LOGGER.warning('"%s" not found, shared objects are archived '
+                           'as they are.', self.strip)
+            for entry in entries:
+                yield entry
+            return
+
+        (count, saved) = (0, 0)
+        results = ordered_map(self._strip_entry,
+                              ((source, arcname, stat, tmp_dir)
+                               for (source, arcname, stat) in entries),
+                              self.jobs)
+        for (entry, entry_saved) in results:
+            if entry_saved is not None:
+                count += 1
+                saved += entry_saved
+            yield entry
+        LOGGER.info('Stripped %d shared object(s), %d byte(s) saved.', count,
+                    saved)
+        if self.cache:
+            self.cache.prune()
+
+    def _strip_entry(self, source, arcname, stat, tmp_dir):
+        # Returns the entry to archive and the bytes stripping saved, `None`
+        # when it was not stripped.
+        if not is_shared_object(source):
+            return ((source, arcname, stat), None)
+        (key, stripped) = (None, None)
+        if self.cache:
+            key = hashlib.sha256('{}\0{}'.format(self.key(),
+                                                 hash_file(source))
+                                 .encode('utf-8')).hexdigest()
+            stripped = self.cache.get(key)
+        if not stripped:
+            stripped = self._run(source, tmp_dir)
+            if not stripped:
+                return ((source, arcname, stat), None)
+            if self.cache:
+                stripped = self.cache.put(key, stripped)
+        size = os.path.getsize(stripped)
+        LOGGER.info('Stripped "%s", %d byte(s) saved.', arcname,
+                    stat.size - size)
+        return ((stripped, arcname, stat._replace(size=size)),
+                stat.size - size)
+
+    def _run(self, source, tmp_dir):
+        (handle, target) = tempfile.mkstemp(dir=tmp_dir, suffix='.stripped')
+        os.close(handle)
+        process = subprocess.Popen(
+            [self.strip] + list(self.args) + ['-o', target, source],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            env=sanitized_env())
+        (_, stderrdata) = process.communicate()
+        if process.returncode != 0:
+            LOGGER.warning('Unable to strip "%s": %s', source,
+                           stderrdata.decode('utf-8', 'replace').strip())
+            os.remove(target)
+            return None
+        return target
+
+    def _is_available(self):
+        try:
+            subprocess.Popen([self.strip, '--version'],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             env=sanitized_env()).communicate()
+        except OSError:
+            return False
+        return True
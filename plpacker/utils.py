@@ -1,15 +1,153 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import multiprocessing
 import os
 import logging
+import re
+import shutil
+import subprocess
+import threading
 
 
 LOGGER = logging.getLogger(__name__)
 
+_CONTEXT = threading.local()
+
 
 def expand_path(path, log=False):
     expanded = os.path.normpath(os.path.abspath(path))
     if log and expanded != path:
         LOGGER.debug('Expanded "%s" to "%s".', path, expanded)
     return expanded
+
+
+def run_command(args, cwd=None, env=None):
+    LOGGER.info('Executing command "%s".', ' '.join(args))
+    process = subprocess.Popen(args,
+                               stderr=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               env=env if env is not None else sanitized_env(),
+                               cwd=cwd)
+    (stdoutdata, stderrdata) = process.communicate()
+    if stdoutdata:
+        LOGGER.debug(stdoutdata)
+    if stderrdata:
+        LOGGER.error(stderrdata)
+    if process.returncode != 0:
+        raise RuntimeError('Command failed: "{}"'.format(' '.join(args)))
+
+
+def sanitized_env():
+    # Keeps whatever virtualenv `plp` itself runs in from leaking into the
+    # commands it runs.
+    env = dict(os.environ)
+    if 'VIRTUAL_ENV' in env:
+        virtual_env = env['VIRTUAL_ENV']
+        env['PATH'] = ':'.join([item for item in env['PATH'].split(':')
+                                if not item.startswith(virtual_env)])
+        del env['VIRTUAL_ENV']
+    if '__PYVENV_LAUNCHER__' in env:
+        del env['__PYVENV_LAUNCHER__']
+    return env
+
+
+def cpu_count():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def ordered_map(function, iterable, jobs=1):
+    """
+    Lazily maps `function` over the argument tuples in `iterable` using a
+    pool of `jobs` threads, yielding results in the same order as the input.
+    Only a bounded window of calls is in flight at any time.
+    """
+    if jobs <= 1:
+        for args in iterable:
+            yield function(*args)
+        return
+
+    build = current_build()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for args in iterable:
+            pending.append(executor.submit(_call_in_build, build, function,
+                                           args))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _call_in_build(build, function, args):
+    with build_context(build):
+        return function(*args)
+
+
+def current_build():
+    """
+    Identifies the build the current thread works for, as set by
+    `build_context()`, `None` outside of any.
+    """
+    return getattr(_CONTEXT, 'build', None)
+
+
+@contextmanager
+def build_context(build):
+    """
+    Marks the current thread, and the threads `ordered_map()` starts from
+    it, as working for `build`.
+    """
+    previous = current_build()
+    _CONTEXT.build = build
+    try:
+        yield
+    finally:
+        _CONTEXT.build = previous
+
+
+def clone_tree(source, destination):
+    """
+    Recreates the `source` directory tree at `destination` using hard links,
+    falling back to copies when linking is not possible (e.g. across file
+    systems).  Symbolic links are recreated as is.
+    """
+    for (dirpath, dirnames, filenames) in os.walk(source):
+        target_dir = os.path.normpath(
+            os.path.join(destination, os.path.relpath(dirpath, source)))
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            target = os.path.join(target_dir, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), target)
+            elif name in filenames:
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copy2(path, target)
+
+
+def tree_size(directory):
+    total = 0
+    for (dirpath, _, filenames) in os.walk(directory):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def canonical_name(name):
+    """
+    Distribution `name` as compared by pip, `Foo_Bar` being `foo-bar`.
+    """
+    return re.sub(r'[-_.]+', '-', name).lower()
@@ -2,28 +2,62 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import glob
+import hashlib
 import os
 import logging
 import platform
+import re
 import shutil
 import subprocess
+import sys
 import tempfile
 
 from plpacker.fileset import FileSet
-from plpacker.utils import expand_path
+from plpacker.utils import (clone_tree, expand_path, run_command,
+                            sanitized_env)
+from plpacker.wheel import install_wheels
 
 LOGGER = logging.getLogger(__name__)
 
 
 class VirtualEnv(object):
+    # pylint: disable=too-many-instance-attributes
+    # `virtualenv` builds a full environment and installs into it with its
+    # own `pip`.  `pip-target` skips the environment entirely and has the
+    # interpreter's `pip` install straight into a single directory.
+    # `wheelhouse` unpacks the locked wheels of a wheelhouse into a single
+    # directory without running `pip` at all.
+    INSTALLERS = ('virtualenv', 'pip-target', 'wheelhouse')
+
     def __init__(self, python=None, path=None, keep=None, packages=None,
-                 requirements=None, fileset_excludes=None):
-        # pylint: disable=too-many-arguments
+                 requirements=None, fileset_excludes=None, cache=None,
+                 installer='virtualenv', wheelhouse=None, fileset_sort=True,
+                 cwd=None, slimming=None, runtime_provided=None,
+                 tree_shaker=None):
+        # pylint: disable=too-many-arguments,too-many-locals
+        # `cwd` is the project directory, local packages are relative to it
+        # and commands run from it.  `slimming` is a `Slimming` leaving out
+        # what the runtime never reads, `runtime_provided` a
+        # `RuntimeProvided` leaving out what it already has and
+        # `tree_shaker` a `TreeShaker` leaving out what is never imported.
+        if installer not in self.INSTALLERS:
+            raise ValueError('Unknown installer "{}", expected one of: {}'
+                             .format(installer, ', '.join(self.INSTALLERS)))
+        if installer == 'wheelhouse' and not wheelhouse:
+            raise ValueError('The "wheelhouse" installer needs a wheelhouse.')
+        self.installer = installer
         self.python = python
         self.keep = keep
         self.packages = packages
         self.requirements = requirements
         self.fileset_excludes = fileset_excludes
+        self.fileset_sort = fileset_sort
+        self.cache = cache
+        self.wheelhouse = wheelhouse
+        self.cwd = cwd
+        self.slimming = slimming
+        self.runtime_provided = runtime_provided
+        self.tree_shaker = tree_shaker
 
         if not path:
             prefix = '{}-'.format(__name__)
@@ -47,17 +81,57 @@ class VirtualEnv(object):
             LOGGER.exception('Failed to clean up virtual environment.')
 
     def create(self):
-        command = ['virtualenv']
-        if self.python:
-            command += ['--python', self.python]
-        command += [self.path]
+        fingerprint = self.fingerprint() if self.cache else None
+        if not fingerprint:
+            self._create()
+        else:
+            with self.cache.lock(fingerprint):
+                cached = self.cache.lookup(fingerprint)
+                if cached:
+                    LOGGER.info('Cloning cached virtualenv "%s" into: %s',
+                                cached, self.path)
+                    clone_tree(cached, self.path)
+                else:
+                    self._create()
+                    self.cache.store(fingerprint, self.path)
+            self.cache.prune()
+
+        if self.tree_shaker:
+            self.tree_shaker.analyse(self.site_package_dirs)
+        for directory in self.site_package_dirs:
+            if self.runtime_provided:
+                self.runtime_provided.report(directory)
+            if self.slimming:
+                self.slimming.report(directory, self.fileset_excludes,
+                                     self._skipped(directory))
+
+    def _create(self):
+        if self.installer in ('pip-target', 'wheelhouse'):
+            LOGGER.info('Installing into: %s', self.target_dir)
+            os.mkdir(self.target_dir)
+        else:
+            command = ['virtualenv']
+            if self.python:
+                command += ['--python', self.python]
+            command += [self.path]
 
-        LOGGER.info('Creating virtualenv in: %s', self.path)
-        self.run(command, cwd=self.path)
+            LOGGER.info('Creating virtualenv in: %s', self.path)
+            self.run(command, cwd=self.path)
 
-        if self.packages or self.requirements:
+        if self.wheelhouse:
+            self.install_from_wheelhouse()
+        elif self.packages or self.requirements:
             self.install(self.packages, self.requirements)
 
+    def install_from_wheelhouse(self):
+        # Exact versions from the lock, no index and no dependency
+        # resolution.
+        if self.installer == 'wheelhouse':
+            install_wheels(self.wheelhouse.locked_wheels(), self.target_dir)
+        else:
+            self.run(self.pip_install_command()
+                     + self.wheelhouse.install_args())
+
     def install(self, packages=(), requirements=()):
         if not (packages or requirements):
             raise RuntimeError(
@@ -66,7 +140,50 @@ class VirtualEnv(object):
         req_args = []
         for item in requirements:
             req_args += ['-r', item]
-        self.run([self.pip_exec(), 'install'] + req_args + list(packages))
+        self.run(self.pip_install_command() + req_args + list(packages))
+
+    def fingerprint(self):
+        """
+        Hash identifying the installed dependencies, made of the interpreter
+        version, the content of the requirements files and the packages, or
+        the wheelhouse lock when installing from one.  Returns `None` when
+        local paths are installed, their content is not tracked.
+        """
+        digest = hashlib.sha256()
+        digest.update(self.installer.encode('utf-8') + b'\0')
+        digest.update(self.interpreter_version().encode('utf-8'))
+        if self.wheelhouse:
+            digest.update(b'\0wheelhouse\0')
+            digest.update(self.wheelhouse.fingerprint().encode('utf-8'))
+            return digest.hexdigest()
+        for requirement in self.requirements or ():
+            if not _digest_requirements(digest, requirement):
+                LOGGER.info('Requirements "%s" install local paths.',
+                            requirement)
+                return None
+        for package in self.packages or ():
+            if _is_local_path(package, self.cwd or ''):
+                LOGGER.info('Package "%s" is a local path.', package)
+                return None
+            digest.update(b'\0package\0' + package.encode('utf-8'))
+        return digest.hexdigest()
+
+    def interpreter_version(self):
+        python = self.python or sys.executable
+        output = subprocess.check_output(
+            [python, '-c', 'import sys; print(sys.version)'],
+            env=self.sanitized_env())
+        return output.decode('utf-8').strip()
+
+    def pip_install_command(self):
+        if self.installer == 'pip-target':
+            return [self.python or sys.executable, '-m', 'pip', 'install',
+                    '--target', self.target_dir]
+        return [self.pip_exec(), 'install']
+
+    @property
+    def target_dir(self):
+        return os.path.join(self.path, 'site-packages')
 
     def pip_exec(self):
         if platform.system() == 'Windows':
@@ -74,22 +191,12 @@ class VirtualEnv(object):
         return os.path.join(self.path, 'bin', 'pip')
 
     def run(self, args, cwd=None):
-        LOGGER.info('Executing command "%s".', ' '.join(args))
-        process = subprocess.Popen(args,
-                                   stderr=subprocess.PIPE,
-                                   stdout=subprocess.PIPE,
-                                   env=self.sanitized_env(),
-                                   cwd=cwd)
-        (stdoutdata, stderrdata) = process.communicate()
-        if stdoutdata:
-            LOGGER.debug(stdoutdata)
-        if stderrdata:
-            LOGGER.error(stderrdata)
-        if process.returncode != 0:
-            raise RuntimeError('Command failed: "{}"'.format(' '.join(args)))
+        run_command(args, cwd=cwd or self.cwd, env=self.sanitized_env())
 
     @property
     def site_package_dirs(self):
+        if self.installer in ('pip-target', 'wheelhouse'):
+            return [self.target_dir] if os.path.isdir(self.target_dir) else []
         dirs = glob.glob(os.path.join(self.path, 'lib', '*', 'site-packages'))
         dirs.extend(
             glob.glob(os.path.join(self.path, 'lib', '*', 'dist-packages')))
@@ -101,11 +208,26 @@ class VirtualEnv(object):
     def filesets(self):
         sets = []
         for directory in self.site_package_dirs:
+            excludes = list(self.fileset_excludes or ())
+            if self.slimming:
+                for globs in self.slimming.excludes(directory).values():
+                    excludes.extend(globs)
             fileset = FileSet(directory, includes='**',
-                              excludes=self.fileset_excludes)
+                              excludes=excludes,
+                              skip=self._skipped(directory),
+                              lazy=True, sort=self.fileset_sort)
             sets.append(fileset)
         return sets
 
+    def _skipped(self, directory):
+        # Files left out whole distributions at a time.
+        skip = set()
+        if self.runtime_provided:
+            skip.update(self.runtime_provided.files(directory))
+        if self.tree_shaker:
+            skip.update(self.tree_shaker.files(directory))
+        return skip
+
     def clean(self):
         if not (self.path and os.path.isdir(self.path)):
             raise RuntimeError(
@@ -120,12 +242,44 @@ class VirtualEnv(object):
 
     @staticmethod
     def sanitized_env():
-        env = dict(os.environ)
-        if 'VIRTUAL_ENV' in env:
-            virtual_env = env['VIRTUAL_ENV']
-            env['PATH'] = ':'.join([item for item in env['PATH'].split(':')
-                                    if not item.startswith(virtual_env)])
-            del env['VIRTUAL_ENV']
-        if '__PYVENV_LAUNCHER__' in env:
-            del env['__PYVENV_LAUNCHER__']
-        return env
+        return sanitized_env()
+
+
+def _digest_requirements(digest, path):
+    # Follows nested requirement and constraint files.  Returns `False` when
+    # local paths are installed.
+    with open(path, 'rb') as handle:
+        content = handle.read()
+    digest.update(b'\0requirement\0' + content)
+
+    base_dir = os.path.dirname(path)
+    for line in content.decode('utf-8').splitlines():
+        line = line.split(' #', 1)[0].strip()
+        if not line or line.startswith('#'):
+            continue
+        if not line.startswith('-'):
+            if _is_local_path(line, base_dir):
+                return False
+            continue
+        (option, value) = _split_option(line)
+        if option in ('-r', '--requirement', '-c', '--constraint'):
+            if not _digest_requirements(
+                    digest, os.path.join(base_dir, value)):
+                return False
+        elif option in ('-e', '--editable'):
+            return False
+    return True
+
+
+def _split_option(line):
+    # Splits an option of a requirements file from its value, as pip does:
+    # `-r file`, `-rfile`, `--requirement file` or `--requirement=file`.
+    if line.startswith('--'):
+        (option, value) = re.match(r'(--[^\s=]+)[\s=]*(.*)', line).groups()
+    else:
+        (option, value) = (line[:2], line[2:])
+    return (option, value.strip())
+
+
+def _is_local_path(spec, base_dir=''):
+    return os.path.exists(os.path.join(base_dir, spec))
@@ -0,0 +1,305 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import OrderedDict
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from plpacker.archive import compress_file, read_members, write_member
+from plpacker.fileset import file_stat
+from plpacker.utils import ordered_map
+
+LOGGER = logging.getLogger(__name__)
+
+# From `<sys/inotify.h>`.
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 0o2000000
+_IN_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM
+            | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+            | _IN_MOVE_SELF)
+
+
+class IncrementalArchive(object):
+    """
+    Output archive laid out with the members of the `dependencies` archive
+    first and the project files last.  An update only truncates and rewrites
+    the project files, from the compressed members kept in memory, so only
+    files that changed are compressed again, as the `compression` policy
+    chooses when there is one.
+
+    The `dependencies` are read from a private link to the archive, or a
+    copy, so evicting it from a cache does not matter while watching.  It
+    is removed by `close()`.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, zip_file, dependencies, jobs=1, cache=None,
+                 compression=None):
+        # pylint: disable=too-many-arguments
+        self.zip_file = zip_file
+        self._tmp_dir = tempfile.mkdtemp(prefix='{}-'.format(__name__))
+        self.dependencies = os.path.join(self._tmp_dir, 'dependencies.zip')
+        try:
+            os.link(dependencies, self.dependencies)
+        except OSError:
+            shutil.copyfile(dependencies, self.dependencies)
+        self.jobs = jobs
+        self.cache = cache
+        self.compression = compression
+        # Archive name to `(stat, member)` of every project file.
+        self.members = {}
+        with ZipFile(self.dependencies, 'r') as archive:
+            self._dependency_names = frozenset(archive.namelist())
+        self._shadowed = None
+        self._offset = None
+        self._stat = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def update(self, entries):
+        """
+        Brings the archive up to date with `entries`, the `(source, arcname,
+        stat)` of every project file.  Returns how many files were changed
+        and removed.
+        """
+        current = OrderedDict()
+        for (source, arcname, stat) in entries:
+            current.setdefault(arcname, (source, stat))
+        removed = [arcname for arcname in self.members
+                   if arcname not in current]
+        changed = [(source, arcname, stat)
+                   for (arcname, (source, stat)) in current.items()
+                   if arcname not in self.members
+                   or self.members[arcname][0] != stat]
+        if not (changed or removed) and self._is_intact():
+            return (0, 0)
+
+        for name in removed:
+            del self.members[name]
+        for (member, stat) in ordered_map(self._compress, changed, self.jobs):
+            self.members[member.arcname] = (stat, member)
+
+        # Project files win over dependencies with the same name, when that
+        # set changes the dependencies have to be written again.
+        shadowed = self._dependency_names.intersection(self.members)
+        if shadowed == self._shadowed and self._is_intact():
+            self._write_project()
+        else:
+            self._write_all(shadowed)
+        return (len(changed), len(removed))
+
+    def _compress(self, source, arcname, stat):
+        if self.compression:
+            return (self.compression.compress(source, arcname,
+                                              cache=self.cache, stat=stat),
+                    stat)
+        return (compress_file(source, arcname, cache=self.cache, stat=stat),
+                stat)
+
+    def _is_intact(self):
+        # Whether the archive is still the one last written.
+        try:
+            stat = file_stat(os.stat(self.zip_file))
+        except OSError:
+            return False
+        return self._stat is not None \
+            and (stat.size, stat.mtime_ns) \
+            == (self._stat.size, self._stat.mtime_ns)
+
+    def _write_all(self, shadowed):
+        LOGGER.info('Writing "%s".', self.zip_file)
+        tmp_path = '{}.{}.tmp'.format(self.zip_file, os.getpid())
+        try:
+            with ZipFile(tmp_path, 'w', ZIP_DEFLATED) as archive:
+                for member in read_members(self.dependencies):
+                    if member.arcname not in shadowed:
+                        write_member(archive, member)
+                self._offset = archive.fp.tell()
+                self._write_members(archive)
+            os.rename(tmp_path, self.zip_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._shadowed = shadowed
+        self._stat = file_stat(os.stat(self.zip_file))
+
+    def _write_project(self):
+        # pylint: disable=protected-access
+        archive = ZipFile(self.zip_file, 'a')
+        try:
+            archive.filelist = [zinfo for zinfo in archive.filelist
+                                if zinfo.header_offset < self._offset]
+            archive.NameToInfo = dict((zinfo.filename, zinfo)
+                                      for zinfo in archive.filelist)
+            archive.fp.seek(self._offset)
+            archive.fp.truncate()
+            archive.start_dir = self._offset
+            archive._didModify = True
+            self._write_members(archive)
+        finally:
+            archive.close()
+        self._stat = file_stat(os.stat(self.zip_file))
+
+    def _write_members(self, archive):
+        for arcname in sorted(self.members):
+            write_member(archive, self.members[arcname][1])
+
+
+class Watcher(object):
+    """
+    Updates an `IncrementalArchive` whenever the files of the lazy
+    `filesets` change.  Changes are noticed with inotify on Linux, and by
+    polling every `interval` seconds elsewhere.  The file sets are scanned
+    again `delay` seconds after the first change, picking up all the files
+    saved together.
+    """
+
+    def __init__(self, filesets, archive, delay=0.05, interval=1.0):
+        for fileset in filesets:
+            if not fileset.lazy:
+                raise ValueError('Only lazy file sets can be watched: {}'
+                                 .format(fileset.directory))
+        self.filesets = filesets
+        self.archive = archive
+        self.delay = delay
+        self.interval = interval
+
+    def run(self):
+        self.update()
+        monitor = self._monitor()
+        try:
+            while True:
+                monitor.wait()
+                time.sleep(self.delay)
+                while monitor.wait(0):
+                    pass
+                self.update()
+        finally:
+            monitor.close()
+
+    def update(self):
+        started = time.time()
+        (changed, removed) = self.archive.update(self._entries())
+        if changed or removed:
+            LOGGER.info('Updated "%s", %d file(s) changed and %d removed in '
+                        '%.0f ms.', self.archive.zip_file, changed, removed,
+                        (time.time() - started) * 1000)
+        return (changed, removed)
+
+    def _entries(self):
+        for fileset in self.filesets:
+            for (source, arcname, stat) in fileset.entries():
+                # The archive may well be written within the watched files.
+                if source == self.archive.zip_file \
+                        or source.startswith(self.archive.zip_file + '.'):
+                    continue
+                yield (source, arcname, stat)
+
+    def _monitor(self):
+        try:
+            monitor = Inotify()
+        except OSError as exception:
+            LOGGER.info('Polling for changes every %s second(s), inotify '
+                        'is not available: %s', self.interval, exception)
+            return Poller(self.interval)
+        for fileset in self.filesets:
+            monitor.watch_tree(fileset.directory)
+        LOGGER.info('Watching for changes, press Ctrl-C to stop.')
+        return monitor
+
+
+class Inotify(object):
+    """
+    Minimal `ctypes` binding of Linux inotify, watching whole directory
+    trees for changes.
+    """
+    _EVENT = struct.Struct(str('iIII'))
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._paths = {}
+
+    def watch_tree(self, root):
+        for (dirpath, _, _) in os.walk(root):
+            self._add_watch(dirpath)
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(
+            self.fd, path.encode(sys.getfilesystemencoding()), _IN_MASK)
+        if wd < 0:
+            LOGGER.debug('Unable to watch "%s": %s', path,
+                         os.strerror(ctypes.get_errno()))
+            return
+        self._paths[wd] = path
+
+    def wait(self, timeout=None):
+        """
+        Waits for changes, returning false when `timeout` seconds went by
+        without any.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            (wd, mask, _, length) = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO) \
+                    and wd in self._paths:
+                self.watch_tree(os.path.join(
+                    self._paths[wd],
+                    name.decode(sys.getfilesystemencoding())))
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller(object):
+    # pylint: disable=no-self-use
+    def __init__(self, interval):
+        self.interval = interval
+
+    def wait(self, timeout=None):
+        if timeout is not None:
+            time.sleep(timeout)
+            return False
+        time.sleep(self.interval)
+        return True
+
+    def close(self):
+        pass
@@ -0,0 +1,115 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import errno
+import logging
+import os
+import shutil
+from zipfile import ZipFile
+
+from plpacker.utils import cpu_count, ordered_map
+
+LOGGER = logging.getLogger(__name__)
+
+
+def install_wheels(wheels, target_dir, jobs=None):
+    """
+    Unpacks several wheels into `target_dir` concurrently.
+    """
+    for _ in ordered_map(install_wheel,
+                         ((wheel, target_dir) for wheel in wheels),
+                         jobs or cpu_count()):
+        pass
+
+
+def install_wheel(wheel, target_dir):
+    """
+    Installs a wheel into `target_dir` by unpacking it, following the wheel
+    install layout (PEP 427).  Both `purelib` and `platlib` end up in
+    `target_dir`; scripts, headers and data files are not needed in a
+    deployment package and are skipped.  RECORD is rewritten to match.
+    """
+    LOGGER.debug('Unpacking "%s" into "%s".', wheel, target_dir)
+    target_dir = os.path.abspath(target_dir)
+    moved = {}
+    with ZipFile(wheel, 'r') as archive:
+        record = None
+        for zinfo in archive.infolist():
+            if zinfo.filename.endswith('/'):
+                continue
+            destination = _install_path(zinfo.filename)
+            moved[zinfo.filename] = destination
+            if destination is None:
+                LOGGER.debug('Skipping "%s" from "%s".', zinfo.filename,
+                             wheel)
+                continue
+            if destination.endswith('.dist-info/RECORD'):
+                record = (destination, archive.read(zinfo))
+                continue
+            _extract(archive, zinfo, _safe_join(target_dir, destination))
+
+    if record:
+        (destination, content) = record
+        installer = '{}/INSTALLER'.format(os.path.dirname(destination))
+        _makedirs(os.path.dirname(_safe_join(target_dir, installer)))
+        with open(_safe_join(target_dir, installer), 'w') as handle:
+            handle.write('plp\n')
+        content = _rewrite_record(content.decode('utf-8'), moved)
+        content += '{},,\n'.format(installer)
+        with open(_safe_join(target_dir, destination), 'wb') as handle:
+            handle.write(content.encode('utf-8'))
+
+
+def _install_path(filename):
+    (top, _, rest) = filename.partition('/')
+    if not top.endswith('.data'):
+        return filename
+    (scheme, _, path) = rest.partition('/')
+    if scheme in ('purelib', 'platlib'):
+        return path
+    return None
+
+
+def _safe_join(target_dir, path):
+    joined = os.path.normpath(os.path.join(target_dir, path))
+    if not joined.startswith(target_dir + os.sep):
+        raise ValueError('Wheel member escapes target directory: {}'
+                         .format(path))
+    return joined
+
+
+def _makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError as exception:
+        # Other wheels may be creating the same directories concurrently.
+        if exception.errno != errno.EEXIST:
+            raise
+
+
+def _extract(archive, zinfo, path):
+    _makedirs(os.path.dirname(path))
+    with archive.open(zinfo) as source, open(path, 'wb') as destination:
+        shutil.copyfileobj(source, destination)
+    mode = (zinfo.external_attr >> 16) & 0o777
+    if mode:
+        os.chmod(path, mode)
+
+
+def _rewrite_record(content, moved):
+    lines = []
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        (path, digest, size) = line.rsplit(',', 2)
+        quoted = path.startswith('"') and path.endswith('"')
+        if quoted:
+            path = path[1:-1].replace('""', '"')
+        if path in moved:
+            path = moved[path]
+            if path is None:
+                continue
+        if quoted or ',' in path:
+            path = '"{}"'.format(path.replace('"', '""'))
+        lines.append(','.join((path, digest, size)))
+    return ''.join(line + '\n' for line in lines)
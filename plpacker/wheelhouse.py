@@ -0,0 +1,127 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import glob
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from plpacker.utils import expand_path, run_command
+
+LOGGER = logging.getLogger(__name__)
+
+# https://www.python.org/dev/peps/pep-0427/#file-name-convention
+WHEEL_FILE_RE = re.compile(
+    r'^(?P<name>[^-]+)-(?P<version>[^-]+)(-(?P<build>\d[^-]*))?'
+    r'-(?P<python>[^-]+)-(?P<abi>[^-]+)-(?P<platform>[^-]+)\.whl$')
+
+
+class Wheelhouse(object):
+    """
+    Local directory of wheels plus a lock of the exact versions to install
+    from it, letting builds install offline without resolving anything.
+    """
+    LOCK_FILE = 'requirements.lock'
+
+    def __init__(self, path, python=None):
+        self.path = expand_path(path, True)
+        self.python = python
+
+    @property
+    def lock_path(self):
+        return os.path.join(self.path, self.LOCK_FILE)
+
+    def fill(self, packages=(), requirements=()):
+        if not (packages or requirements):
+            raise RuntimeError(
+                'Either, or both, "packages" or "requirements" must be '
+                'provided.')
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        # Wheels are built in isolation first, so the lock only lists what
+        # this run resolved and not whatever was left from earlier runs.
+        build_dir = tempfile.mkdtemp(prefix='{}-'.format(__name__))
+        try:
+            req_args = []
+            for item in requirements:
+                req_args += ['-r', item]
+            run_command([self.python or sys.executable, '-m', 'pip', 'wheel',
+                         '--wheel-dir', build_dir]
+                        + req_args + list(packages))
+
+            pins = []
+            for wheel in sorted(glob.glob(os.path.join(build_dir, '*.whl'))):
+                match = WHEEL_FILE_RE.match(os.path.basename(wheel))
+                if not match:
+                    raise RuntimeError('Not a wheel: {}'.format(wheel))
+                # The wheel file is kept as a comment, pip ignores it but
+                # `locked_wheels()` does not have to guess.
+                pins.append('{}=={}  # {}'.format(match.group('name'),
+                                                  match.group('version'),
+                                                  os.path.basename(wheel)))
+                target = os.path.join(self.path, os.path.basename(wheel))
+                if os.path.exists(target):
+                    os.remove(target)
+                shutil.move(wheel, target)
+        finally:
+            shutil.rmtree(build_dir)
+
+        LOGGER.info('Locking %d wheel(s) in: %s', len(pins), self.lock_path)
+        with open(self.lock_path, 'w') as handle:
+            handle.write(''.join(pin + '\n' for pin in pins))
+
+    def install_args(self):
+        self._check_filled()
+        return ['--no-index', '--find-links', self.path, '--no-deps',
+                '-r', self.lock_path]
+
+    def locked_wheels(self):
+        self._check_filled()
+        wheels = []
+        with open(self.lock_path, 'r') as handle:
+            for line in handle:
+                (pin, _, wheel) = line.partition('#')
+                if not pin.strip():
+                    continue
+                wheel = wheel.strip() or self._find_wheel(pin.strip())
+                wheels.append(os.path.join(self.path, wheel))
+        return wheels
+
+    def _check_filled(self):
+        if not os.path.isfile(self.lock_path):
+            raise RuntimeError(
+                'Wheelhouse has not been filled, missing: {}'
+                .format(self.lock_path))
+
+    def _find_wheel(self, pin):
+        (name, _, version) = pin.partition('==')
+        candidates = []
+        for wheel in sorted(os.listdir(self.path)):
+            match = WHEEL_FILE_RE.match(wheel)
+            if (match and _normalize(match.group('name')) == _normalize(name)
+                    and match.group('version') == version):
+                candidates.append(wheel)
+        if len(candidates) != 1:
+            raise RuntimeError('Expected one wheel for "{}", found: {}'
+                               .format(pin, candidates))
+        return candidates[0]
+
+    def fingerprint(self):
+        self._check_filled()
+        digest = hashlib.sha256()
+        with open(self.lock_path, 'rb') as handle:
+            digest.update(handle.read())
+        for wheel in sorted(os.listdir(self.path)):
+            if wheel.endswith('.whl'):
+                size = os.path.getsize(os.path.join(self.path, wheel))
+                digest.update('\0{}\0{}'.format(wheel, size).encode('utf-8'))
+        return digest.hexdigest()
+
+
+def _normalize(name):
+    return re.sub(r'[-_.]+', '_', name).lower()
@@ -4,7 +4,7 @@ import sys
 import ast
 from setuptools import setup, find_packages
 
-_ENTRY_POINT = 'plpacker.cli:entry_point'
+_ENTRY_POINT = 'plpacker.client:entry_point'
 
 
 def version():
@@ -67,6 +67,8 @@ setup(
         'PyYAML>=3.12',
         'colorlog>=2.10.0',
         'future>=0.16.0',
+        'futures>=3.1.1; python_version < "3.2"',
+        'scandir>=1.5; python_version < "3.5"',
     ],
     tests_require=_TEST_REQUIRE,
     extras_require={
@@ -0,0 +1,97 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import time
+import zipfile
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import pytest
+
+from plpacker.archive import compress_file, read_members, write_member
+from plpacker.cache import MemberCache
+from plpacker.fileset import FileStat
+
+
+class TestCompressFile(object):
+    @pytest.mark.parametrize("compress_type", [ZIP_DEFLATED, ZIP_STORED])
+    def test_round_trip(self, source_fs, compress_type):
+        # pylint: disable=unused-argument, no-self-use
+        source_fs.create_file('/home/foo/tmp/data.txt',
+                              contents='hello world ' * 100)
+        member = compress_file('/home/foo/tmp/data.txt', 'data.txt',
+                               compress_type)
+
+        assert member.arcname == 'data.txt'
+        assert member.file_size == 1200
+        assert member.compress_type == compress_type
+        if compress_type == ZIP_STORED:
+            assert member.data == b'hello world ' * 100
+        else:
+            assert len(member.data) < member.file_size
+
+    def test_uses_cache(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        source_fs.create_file('/home/foo/tmp/data.txt', contents='abc' * 99)
+        cache = MemberCache('/home/foo/tmp/cache')
+
+        first = compress_file('/home/foo/tmp/data.txt', 'a.txt', cache=cache)
+        second = compress_file('/home/foo/tmp/data.txt', 'b.txt', cache=cache)
+
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert second.arcname == 'b.txt'
+        assert second.data == first.data
+        assert second.crc == first.crc
+        assert second.file_size == first.file_size
+
+    def test_uses_given_stat(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        source_fs.create_file('/home/foo/tmp/data.txt', contents='abc')
+        mtime = time.mktime((2017, 6, 1, 12, 30, 10, 0, 0, -1))
+        stat = FileStat(3, mtime, 0o100755, int(mtime * 1e9), 1)
+        with patch('plpacker.archive.os.stat') as stat_mock:
+            member = compress_file('/home/foo/tmp/data.txt', 'data.txt',
+                                   stat=stat)
+        assert not stat_mock.called
+        assert member.date_time == (2017, 6, 1, 12, 30, 10)
+        assert member.external_attr == 0o100755 << 16
+
+
+class TestWriteMember(object):
+    def test_archive_is_readable(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        source_fs.create_file('/home/foo/tmp/a.txt', contents='aaaa' * 50)
+        source_fs.create_file('/home/foo/tmp/b.txt', contents='')
+        with ZipFile('/home/foo/tmp/out.zip', 'w', ZIP_DEFLATED) as archive:
+            write_member(archive, compress_file('/home/foo/tmp/a.txt',
+                                                'dir/a.txt'))
+            write_member(archive, compress_file('/home/foo/tmp/b.txt',
+                                                'b.txt', ZIP_STORED))
+
+        with zipfile.ZipFile('/home/foo/tmp/out.zip', 'r') as archive:
+            assert not archive.testzip()
+            assert archive.namelist() == ['dir/a.txt', 'b.txt']
+            assert archive.read('dir/a.txt') == b'aaaa' * 50
+            assert archive.read('b.txt') == b''
+
+
+class TestReadMembers(object):
+    def test_raw_copy(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        with ZipFile('/home/foo/tmp/in.zip', 'w', ZIP_DEFLATED) as archive:
+            archive.writestr('a/b.txt', b'bbbb' * 100)
+            archive.writestr('c.txt', b'c', ZIP_STORED)
+
+        with ZipFile('/home/foo/tmp/out.zip', 'w', ZIP_DEFLATED) as archive:
+            for member in read_members('/home/foo/tmp/in.zip'):
+                write_member(archive, member)
+
+        with zipfile.ZipFile('/home/foo/tmp/out.zip', 'r') as archive:
+            assert not archive.testzip()
+            assert archive.namelist() == ['a/b.txt', 'c.txt']
+            assert archive.read('a/b.txt') == b'bbbb' * 100
+            assert archive.getinfo('c.txt').compress_type == ZIP_STORED
@@ -0,0 +1,186 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+try:
+    from unittest.mock import MagicMock
+except ImportError:
+    from mock import MagicMock
+
+import json
+import os
+import zipfile
+
+import pytest
+
+from plpacker.batch import BatchBuilder, dependencies_key
+from plpacker.packager import Packager
+
+
+def function(name, requirements=()):
+    return {'name': name,
+            'cache': {'path': None},
+            'packager': {'target': name + '.zip', 'sort': False,
+                         'compile': False, 'optimize': 0,
+                         'invalidation_mode': 'unchecked-hash',
+                         'drop_sources': False, 'strip': False,
+                         'compression': None},
+            'virtualenv': {'python': 'python3.6',
+                           'installer': 'virtualenv',
+                           'default_excludes': [],
+                           'slimming': None,
+                           'runtime_provided': {'exclude': False},
+                           'tree_shaking': {'enabled': False},
+                           'pip': {'requirements': list(requirements),
+                                   'packages': [],
+                                   'wheelhouse': None}}}
+
+
+DEPENDENCIES = {'x': '/home/foo/tmp/x.zip', 'y': '/home/foo/tmp/y.zip'}
+
+
+def write_dependencies(path, names):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name in names:
+            archive.writestr(name + '.py', name * 100)
+            archive.writestr(name + '.dist-info/RECORD',
+                             '{0}.py,sha256={0},100\n'
+                             '{0}.dist-info/RECORD,,'.format(name))
+
+
+def namelist(path):
+    with zipfile.ZipFile(path, 'r') as archive:
+        return sorted(archive.namelist())
+
+
+class FakePacker(object):
+    # pylint: disable=too-few-public-methods
+    built = []
+
+    def __init__(self, data, virtual_env):
+        self.data = data
+        self.virtual_env = virtual_env
+        if data['packager'].get('build_path'):
+            # Stages to its build path, made when the packager is.
+            self.packager = Packager(data['packager']['target'],
+                                     build_path=data['packager']['build_path'],
+                                     keep=True)
+        else:
+            self.packager = MagicMock(zip_file=data['packager']['target'])
+        self.dependencies = None
+
+    def prepare_dependencies(self, tmp_dir):
+        # pylint: disable=unused-argument
+        self.virtual_env.create()
+        self.dependencies = DEPENDENCIES.get(self.data['name'],
+                                             'deps-' + self.data['name'])
+        return self.dependencies
+
+    def build(self):
+        if self.data['name'] == 'broken':
+            raise RuntimeError('broken')
+        dependencies = self.dependencies
+        if os.path.isfile(dependencies):
+            # What is left of them, with shared layers.
+            dependencies = namelist(dependencies)
+        FakePacker.built.append((self.data['name'], dependencies))
+
+
+@pytest.fixture(scope='function')
+def builds():
+    FakePacker.built = []
+    return FakePacker.built
+
+
+class TestBatchBuilder(object):
+    def test_dependencies_key(self):
+        # pylint: disable=no-self-use
+        assert dependencies_key(function('a', ['r.txt'])) \
+            == dependencies_key(function('b', ['r.txt']))
+        assert dependencies_key(function('a', ['r.txt'])) \
+            != dependencies_key(function('a', ['other.txt']))
+        compiled = function('a', ['r.txt'])
+        compiled['packager']['compile'] = True
+        assert dependencies_key(function('a', ['r.txt'])) \
+            != dependencies_key(compiled)
+
+    def test_shares_dependencies(self, builds):
+        # pylint: disable=no-self-use, redefined-outer-name
+        environments = []
+
+        def make_virtual_env(data):
+            environments.append(MagicMock(name=data['name']))
+            return environments[-1]
+
+        functions = [function('a', ['r.txt']), function('b', ['other.txt']),
+                     function('c', ['r.txt'])]
+        builder = BatchBuilder(functions, make_virtual_env, FakePacker,
+                               jobs=2)
+        assert [[data['name'] for data in group]
+                for group in builder.groups()] == [['a', 'c'], ['b']]
+
+        builder.build()
+        assert sorted(builds) == [('a', 'deps-a'), ('b', 'deps-b'),
+                                  ('c', 'deps-a')]
+        assert len(environments) == 2
+        for virtual_env in environments:
+            assert virtual_env.create.call_count == 1
+            virtual_env.__exit__.assert_called_once_with(None, None, None)
+
+    def test_stages_each_function_once(self, builds, source_fs):
+        # pylint: disable=no-self-use, redefined-outer-name, unused-argument
+        functions = [function('a', ['r.txt']), function('b', ['r.txt'])]
+        for data in functions:
+            data['packager']['build_path'] = \
+                '/home/foo/tmp/stage-' + data['name']
+        BatchBuilder(functions, lambda data: MagicMock(), FakePacker).build()
+
+        assert sorted(builds) == [('a', 'deps-a'), ('b', 'deps-a')]
+        assert sorted(name for name in os.listdir('/home/foo/tmp')
+                      if name.startswith('stage-')) == ['stage-a', 'stage-b']
+
+    def test_failure_cleans_up(self, builds):
+        # pylint: disable=no-self-use, redefined-outer-name, unused-argument
+        virtual_env = MagicMock()
+        builder = BatchBuilder([function('broken'), function('fine')],
+                               lambda data: virtual_env, FakePacker)
+        with pytest.raises(RuntimeError):
+            builder.build()
+        virtual_env.__exit__.assert_called_with(None, None, None)
+
+    def test_shared_layers(self, builds, source_fs):
+        # pylint: disable=no-self-use, redefined-outer-name, unused-argument
+        write_dependencies(DEPENDENCIES['x'], ['six', 'boto'])
+        write_dependencies(DEPENDENCIES['y'], ['six', 'numpy'])
+
+        BatchBuilder([function('x', ['x.txt']), function('y', ['y.txt'])],
+                     lambda data: MagicMock(), FakePacker,
+                     shared_layer_dir='/home/foo/tmp/layers').build()
+
+        assert dict(builds) == {'x': ['boto.dist-info/RECORD', 'boto.py'],
+                                'y': ['numpy.dist-info/RECORD', 'numpy.py']}
+        with open('/home/foo/tmp/layers/layers.json') as handle:
+            layers = json.load(handle)
+        assert layers['x'] == layers['y']
+        (layer,) = layers['x']
+        assert namelist(os.path.join('/home/foo/tmp/layers', layer)) == [
+            'python/six.dist-info/RECORD', 'python/six.py']
+
+    def test_shared_layers_need_the_same_content(self, builds, source_fs):
+        # pylint: disable=no-self-use, redefined-outer-name, unused-argument
+        write_dependencies(DEPENDENCIES['x'], ['six', 'boto'])
+        write_dependencies(DEPENDENCIES['y'], ['six', 'numpy'])
+        excluding = function('y', ['y.txt'])
+        excluding['virtualenv']['default_excludes'] = ['six/tests/**']
+
+        BatchBuilder([function('x', ['x.txt']), excluding],
+                     lambda data: MagicMock(), FakePacker,
+                     shared_layer_dir='/home/foo/tmp/layers').build()
+
+        # Excluded differently, `six` is not the same in both.
+        assert dict(builds) == {
+            'x': ['boto.dist-info/RECORD', 'boto.py',
+                  'six.dist-info/RECORD', 'six.py'],
+            'y': ['numpy.dist-info/RECORD', 'numpy.py',
+                  'six.dist-info/RECORD', 'six.py']}
+        with open('/home/foo/tmp/layers/layers.json') as handle:
+            assert json.load(handle) == {'x': [], 'y': []}
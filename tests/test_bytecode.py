@@ -0,0 +1,71 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+
+import pytest
+
+from plpacker.bytecode import Compiler
+from plpacker.fileset import file_stat
+
+
+def sources(root, files):
+    entries = []
+    for (arcname, content) in files:
+        path = os.path.join(root, arcname.replace('/', '-'))
+        with open(path, 'w') as handle:
+            handle.write(content)
+        entries.append((path, arcname, file_stat(os.stat(path))))
+    return entries
+
+
+class TestCompiler(object):
+    def test_defaults(self):
+        # pylint: disable=no-self-use
+        compiler = Compiler()
+        assert compiler.python == sys.executable
+        assert compiler.invalidation_mode == 'unchecked-hash'
+        assert not compiler.drop_sources
+
+    def test_unknown_invalidation_mode(self):
+        # pylint: disable=no-self-use
+        with pytest.raises(ValueError):
+            Compiler(invalidation_mode='never')
+
+    def test_key(self):
+        # pylint: disable=no-self-use
+        assert Compiler().key() == Compiler().key()
+        assert Compiler().key() != Compiler(optimize=2).key()
+        assert Compiler().key() != Compiler(drop_sources=True).key()
+
+    @pytest.mark.parametrize('jobs', [1, 3])
+    def test_compiles(self, tmpdir, jobs):
+        # pylint: disable=no-self-use
+        entries = sources(str(tmpdir), [('pkg/a.py', 'A = 1\n'),
+                                        ('b.py', 'B = (\n'),
+                                        ('pkg/c.py', 'C = 3\n')])
+        (compiled, failed) = Compiler(jobs=jobs).compile(entries,
+                                                         str(tmpdir))
+        assert [arcname for (_, arcname, _) in failed] == ['b.py']
+        assert [os.path.dirname(arcname) for (_, arcname, _) in compiled] \
+            == ['pkg/__pycache__'] * 2
+        for (path, _, stat) in compiled:
+            assert os.path.getsize(path) == stat.size
+
+    def test_drops_sources(self, tmpdir):
+        # pylint: disable=no-self-use
+        entries = sources(str(tmpdir), [('pkg/a.py', 'A = 1\n')])
+        (compiled, _) = Compiler(drop_sources=True).compile(entries,
+                                                            str(tmpdir))
+        assert [arcname for (_, arcname, _) in compiled] == ['pkg/a.pyc']
+
+    def test_optimize(self, tmpdir):
+        # pylint: disable=no-self-use
+        entries = sources(str(tmpdir), [('a.py', 'A = 1\n')])
+        (compiled, _) = Compiler(optimize=2).compile(entries, str(tmpdir))
+        assert '.opt-2.pyc' in compiled[0][1]
+
+    def test_nothing_to_compile(self, tmpdir):
+        # pylint: disable=no-self-use
+        assert Compiler().compile([], str(tmpdir)) == ([], [])
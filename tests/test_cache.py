@@ -0,0 +1,172 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from plpacker.cache import Caches, EnvironmentCache, FileCache, MemberCache
+
+
+class TestMemberCache(object):
+    def test_creates_directory(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        cache = MemberCache('/home/foo/tmp/cache')
+        assert os.path.isdir(cache.path)
+
+    def test_key(self):
+        # pylint: disable=no-self-use
+        assert MemberCache.key('abcdef', 8, 6) == 'abcdef-8-6'
+
+    def test_miss_then_hit(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        cache = MemberCache('/home/foo/tmp/cache')
+        assert cache.get('abcdef-8-6') is None
+
+        cache.put('abcdef-8-6', b'compressed', 1234, 56)
+        assert cache.get('abcdef-8-6') == (b'compressed', 1234, 56)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_session_counts_its_own_lookups(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        cache = MemberCache('/home/foo/tmp/cache')
+        cache.put('abcdef-8-6', b'compressed', 1234, 56)
+        cache.get('abcdef-8-6')
+        session = cache.session()
+        assert session.key('abcdef', 8, 6) == 'abcdef-8-6'
+        assert session.get('abcdef-8-6') == (b'compressed', 1234, 56)
+        assert session.get('012345-8-6') is None
+        session.put('012345-8-6', b'compressed', 1234, 56)
+        assert (session.hits, session.misses) == (1, 1)
+        assert (cache.hits, cache.misses) == (2, 1)
+        assert cache.session().hits == 0
+
+    def test_prune_evicts_least_recently_used(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        cache = MemberCache('/home/foo/tmp/cache', max_size=30)
+        cache.put('aa-8-6', b'0123456789', 1, 10)
+        cache.put('bb-8-6', b'0123456789', 2, 10)
+        os.utime(cache._entry_path('aa-8-6'), (1, 1))  # noqa pylint: disable=protected-access
+
+        # Each entry is 12 bytes of header plus 10 bytes of data.
+        assert cache.prune() == 22
+        assert cache.evictions == 1
+        assert cache.get('aa-8-6') is None
+        assert cache.get('bb-8-6') == (b'0123456789', 2, 10)
+
+    def test_memory_layer(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        cache = MemberCache('/home/foo/tmp/cache', memory_max_size=20)
+        cache.put('aa-8-6', b'0123456789', 1, 10)
+        cache.put('bb-8-6', b'0123456789', 2, 10)
+        os.remove(cache._entry_path('aa-8-6'))  # noqa pylint: disable=protected-access
+        assert cache.get('aa-8-6') == (b'0123456789', 1, 10)
+
+        # Least recently used entries are dropped from memory first.
+        cache.put('cc-8-6', b'0123456789', 3, 10)
+        os.remove(cache._entry_path('bb-8-6'))  # noqa pylint: disable=protected-access
+        assert cache.get('bb-8-6') is None
+        assert cache.get('aa-8-6') == (b'0123456789', 1, 10)
+
+
+class TestFileCache(object):
+    @staticmethod
+    def write(path, content):
+        with open(path, 'w') as handle:
+            handle.write(content)
+        return path
+
+    def test_miss_then_hit(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        cache = FileCache('/home/foo/tmp/cache')
+        assert cache.get('abcdef') is None
+
+        path = cache.put('abcdef', self.write('/home/foo/tmp/out', 'data'))
+        assert not os.path.exists('/home/foo/tmp/out')
+        assert cache.get('abcdef') == path
+        with open(path) as handle:
+            assert handle.read() == 'data'
+
+    def test_prune_evicts_least_recently_used(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        cache = FileCache('/home/foo/tmp/cache', max_size=15)
+        old = cache.put('aa', self.write('/home/foo/tmp/aa', '0123456789'))
+        cache.put('bb', self.write('/home/foo/tmp/bb', '0123456789'))
+        os.utime(old, (1, 1))
+
+        assert cache.prune() == 10
+        assert cache.get('aa') is None
+        assert cache.get('bb')
+
+
+class TestCaches(object):
+    def test_kept(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        caches = Caches(member_memory_size=10)
+        cache = caches.get(MemberCache, '/home/foo/tmp/cache', 100)
+        assert caches.get(MemberCache, '/home/foo/tmp/cache', 100) is cache
+        assert cache.memory_max_size == 10
+        assert caches.lock('out.zip') is caches.lock('out.zip')
+
+    def test_not_kept(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        caches = Caches(keep=False)
+        assert caches.get(MemberCache, '/home/foo/tmp/cache') \
+            is not caches.get(MemberCache, '/home/foo/tmp/cache')
+
+
+class TestEnvironmentCache(object):
+    @staticmethod
+    def make_env(fs, path, size=10):
+        fs.create_file(os.path.join(path, 'lib', 'site-packages', 'mod.py'),
+                       contents='x' * size)
+        return path
+
+    def test_lookup_miss(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        cache = EnvironmentCache('/home/foo/tmp/cache')
+        assert cache.lookup('abc') is None
+
+    def test_store_then_lookup(self, source_fs):
+        # pylint: disable=no-self-use
+        cache = EnvironmentCache('/home/foo/tmp/cache')
+        env = self.make_env(source_fs, '/home/foo/tmp/env')
+        with cache.lock('abc') as acquired:
+            assert acquired
+            cache.store('abc', env)
+
+        path = cache.lookup('abc')
+        assert path == '/home/foo/tmp/cache/abc'
+        assert os.path.isfile(os.path.join(path, 'lib', 'site-packages',
+                                           'mod.py'))
+        assert not [name for name in os.listdir(cache.path)
+                    if name.endswith('.tmp')]
+
+    def test_prune_evicts_least_recently_used(self, source_fs):
+        # pylint: disable=no-self-use
+        cache = EnvironmentCache('/home/foo/tmp/cache', max_size=15)
+        cache.store('old', self.make_env(source_fs, '/home/foo/tmp/old'))
+        cache.store('new', self.make_env(source_fs, '/home/foo/tmp/new'))
+        os.utime('/home/foo/tmp/cache/old', (1, 1))
+
+        assert cache.prune() == 10
+        assert cache.lookup('old') is None
+        assert cache.lookup('new')
+
+    @patch('plpacker.cache.tree_size')
+    def test_prune_reads_recorded_sizes(self, tree_size, source_fs):
+        # pylint: disable=no-self-use
+        tree_size.return_value = 10
+        cache = EnvironmentCache('/home/foo/tmp/cache', max_size=15)
+        cache.store('old', self.make_env(source_fs, '/home/foo/tmp/old'))
+        cache.store('new', self.make_env(source_fs, '/home/foo/tmp/new'))
+        os.utime('/home/foo/tmp/cache/old', (1, 1))
+        tree_size.reset_mock()
+
+        assert cache.prune() == 10
+        tree_size.assert_not_called()
+        assert sorted(os.listdir(cache.path)) \
+            == ['new', 'new.size', 'old.lock']
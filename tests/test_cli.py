@@ -3,7 +3,7 @@ from __future__ import (absolute_import, division, print_function,
 
 import pytest
 
-from plpacker.cli import parse_args
+from plpacker.cli import _resolve_paths, parse_args, run
 
 
 class TestParseArgs(object):
@@ -11,18 +11,38 @@ class TestParseArgs(object):
         # pylint: disable=unused-argument, no-self-use
         args = vars(parse_args([]))
         assert args['archive_dir'] is None
+        assert args['cache_dir'] is None
+        assert args['compile'] is None
+        assert args['compress_level'] is None
         assert args['config_file'] is None
+        assert args['drop_sources'] is None
+        assert args['exclude_runtime_provided'] is None
         assert args['excludes'] is None
         assert args['followlinks'] is None
         assert args['generate_config'] is False
+        assert args['handlers'] is None
         assert args['includes'] is None
+        assert args['installer'] is None
+        assert args['invalidation_mode'] is None
+        assert args['jobs'] is None
         assert args['keep_archive'] is None
         assert args['keep_virtualenv'] is None
+        assert args['layer_dir'] is None
+        assert args['optimize'] is None
         assert args['output'] is None
         assert args['packages'] is None
         assert args['python'] is None
         assert args['requirements'] is None
+        assert args['shared_layers'] is None
+        assert args['server'] is None
+        assert args['slimming'] is None
+        assert args['sort'] is None
+        assert args['strip'] is None
+        assert args['tree_shake'] is None
+        assert args['tree_shake_keep'] is None
         assert args['virtualenv_dir'] is None
+        assert args['watch'] is False
+        assert args['wheelhouse'] is None
 
     cli_options = (
         (['--config-file', 'config_file_path'],
@@ -46,6 +66,24 @@ class TestParseArgs(object):
         (['--python', 'some_python_ver'],
          'python',
          'some_python_ver'),
+        (['--installer', 'pip-target'],
+         'installer',
+         'pip-target'),
+        (['--slim', 'safe'],
+         'slimming',
+         'safe'),
+        (['--exclude-runtime-provided'],
+         'exclude_runtime_provided',
+         True),
+        (['--tree-shake'],
+         'tree_shake',
+         True),
+        (['--handler', 'app.handler', '--handler', 'jobs.run'],
+         'handlers',
+         ['app.handler', 'jobs.run']),
+        (['--tree-shake-keep', 'certifi/**'],
+         'tree_shake_keep',
+         ['certifi/**']),
         (['--requirement', 'req1',
           '--requirement', 'req2',
           '--requirement', 'req3'],
@@ -63,6 +101,9 @@ class TestParseArgs(object):
         (['-p', 'another_pip_package'],
          'packages',
          ['another_pip_package']),
+        (['--wheelhouse', 'some_wheelhouse'],
+         'wheelhouse',
+         'some_wheelhouse'),
         (['--output', 'some_other_zip'],
          'output',
          'some_other_zip'),
@@ -75,6 +116,48 @@ class TestParseArgs(object):
         (['--keep-archive'],
          'keep_archive',
          True),
+        (['--jobs', '6'],
+         'jobs',
+         6),
+        (['-j', '2'],
+         'jobs',
+         2),
+        (['--sort'],
+         'sort',
+         True),
+        (['--cache-dir', 'some_cache_dir'],
+         'cache_dir',
+         'some_cache_dir'),
+        (['--layer-dir', 'layers'],
+         'layer_dir',
+         'layers'),
+        (['--shared-layers'],
+         'shared_layers',
+         True),
+        (['--compile'],
+         'compile',
+         True),
+        (['--optimize', '2'],
+         'optimize',
+         2),
+        (['--invalidation-mode', 'checked-hash'],
+         'invalidation_mode',
+         'checked-hash'),
+        (['--drop-sources'],
+         'drop_sources',
+         True),
+        (['--strip'],
+         'strip',
+         True),
+        (['--compress-level', '9'],
+         'compress_level',
+         9),
+        (['--watch'],
+         'watch',
+         True),
+        (['--server', '/tmp/plp.sock'],
+         'server',
+         '/tmp/plp.sock'),
         (['--generate-config'],
          'generate_config',
          True),
@@ -85,3 +168,37 @@ class TestParseArgs(object):
         # pylint: disable=no-self-use
         result = vars(parse_args(argv))
         assert result[key] == expected
+
+
+class TestResolvePaths(object):
+    def test_relative_to_project(self, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file('/home/foo/src/bar-project/requirements.txt')
+        project = '/home/foo/src/bar-project'
+        data = {
+            'cache': {'path': 'cache'},
+            'packager': {'target': 'out.zip', 'build_path': None,
+                         'layer_dir': 'layers'},
+            'virtualenv': {'path': None,
+                           'pip': {'wheelhouse': None,
+                                   'requirements': ['requirements.txt'],
+                                   'packages': ['requests', 'static']}}}
+        _resolve_paths(data, project)
+
+        assert data['packager']['target'] == \
+            '/home/foo/src/bar-project/out.zip'
+        assert data['cache']['path'] == '/home/foo/src/bar-project/cache'
+        assert data['packager']['layer_dir'] == \
+            '/home/foo/src/bar-project/layers'
+        assert data['virtualenv']['pip']['requirements'] == \
+            ['/home/foo/src/bar-project/requirements.txt']
+        assert data['virtualenv']['pip']['packages'] == \
+            ['requests', '/home/foo/src/bar-project/static']
+
+
+class TestRun(object):
+    @pytest.mark.parametrize('flag', ['--compile', '--drop-sources',
+                                      '--strip'])
+    def test_watch_refuses_rewriting(self, flag, tmpdir):
+        # pylint: disable=no-self-use
+        assert run(parse_args(['--watch', flag]), str(tmpdir)) == 2
@@ -0,0 +1,38 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import os
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import pytest
+
+from plpacker.client import _pop_server, default_socket, request_build
+
+
+class TestPopServer(object):
+    @pytest.mark.parametrize('argv,expected', [
+        (['--output', 'x.zip'], (['--output', 'x.zip'], 'env.sock')),
+        (['--server', 'a.sock', '-k'], (['-k'], 'a.sock')),
+        (['-k', '--server=a.sock'], (['-k'], 'a.sock')),
+    ])
+    def test_pop_server(self, argv, expected):
+        # pylint: disable=no-self-use
+        assert _pop_server(argv, 'env.sock') == expected
+
+
+class TestRequestBuild(object):
+    def test_unreachable(self, tmpdir):
+        # pylint: disable=no-self-use
+        path = str(tmpdir.join('missing.sock'))
+        assert request_build(path, [], '/tmp', io.StringIO()) is None
+
+    def test_default_socket(self):
+        # pylint: disable=no-self-use
+        with patch.dict(os.environ, {'XDG_RUNTIME_DIR': '/run/user/1000'}):
+            assert default_socket().startswith(
+                '/run/user/1000/py-lambda-packer-')
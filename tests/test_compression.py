@@ -0,0 +1,141 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from collections import OrderedDict
+import os
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+import zlib
+
+import pytest
+
+from plpacker.compression import CompressionPolicy, entropy
+
+
+RULES = OrderedDict([
+    ('compressed', {'level': 'store', 'globs': ['**/*.zip', '**/*.png']}),
+    ('models', {'level': 9, 'globs': ['models/**']}),
+])
+
+
+def read(path):
+    with open(path, 'rb') as handle:
+        return handle.read()
+
+
+@pytest.fixture
+def files(tmpdir):
+    paths = {}
+    for (name, data) in (('text.txt', b'import os\n' * 1000),
+                         ('random.bin', os.urandom(10000)),
+                         ('data.zip', b'PK' + b'\0' * 1000),
+                         ('models/weights.txt', b'0.5 ' * 1000)):
+        path = tmpdir.join(name)
+        path.dirpath().ensure(dir=True)
+        path.write_binary(data)
+        paths[name] = str(path)
+    return paths
+
+
+class TestEntropy(object):
+    @pytest.mark.parametrize("data,expected", [
+        (b'', 0.0),
+        (b'aaaa', 0.0),
+        (b'abab', 1.0),
+        (bytes(bytearray(range(256))), 8.0),
+    ])
+    def test_entropy(self, data, expected):
+        # pylint: disable=no-self-use
+        assert entropy(data) == pytest.approx(expected)
+
+    def test_compressed_data(self):
+        # pylint: disable=no-self-use
+        assert entropy(zlib.compress(os.urandom(4096))) > 7.5
+
+
+class TestCompressionPolicy(object):
+    def test_from_config(self):
+        # pylint: disable=no-self-use
+        assert CompressionPolicy.from_config(None) is None
+        policy = CompressionPolicy.from_config(
+            {'level': 9, 'entropy': None, 'sample_size': 10, 'rules': RULES})
+        assert (policy.level, policy.entropy, policy.sample_size,
+                policy.estimate) == (9, None, 10, False)
+        assert policy.rules == RULES
+        assert CompressionPolicy.from_config({'estimate': True}).estimate
+        # Same defaults either way.
+        assert CompressionPolicy.from_config({'estimate': True}).key() \
+            == CompressionPolicy().key()
+
+    @pytest.mark.parametrize("level", [-1, 10, 'fast', True])
+    def test_invalid_level(self, level):
+        # pylint: disable=no-self-use
+        with pytest.raises(ValueError):
+            CompressionPolicy(level=level)
+        with pytest.raises(ValueError):
+            CompressionPolicy({'bad': {'level': level, 'globs': ['*']}})
+
+    def test_key(self):
+        # pylint: disable=no-self-use
+        assert CompressionPolicy().key() == CompressionPolicy().key()
+        assert CompressionPolicy().key() != CompressionPolicy(level=9).key()
+        assert CompressionPolicy().key() \
+            != CompressionPolicy(entropy=7.5).key()
+
+    @pytest.mark.parametrize("name,expected", [
+        ('data.zip', ('compressed', ZIP_STORED, 0)),
+        ('models/weights.txt', ('models', ZIP_DEFLATED, 9)),
+        ('random.bin', ('entropy', ZIP_STORED, 0)),
+        ('text.txt', ('default', ZIP_DEFLATED, 6)),
+    ])
+    def test_choose(self, files, name, expected):
+        # pylint: disable=no-self-use,redefined-outer-name
+        policy = CompressionPolicy(RULES, entropy=7.5)
+        assert policy.choose(name, read(files[name])) == expected
+
+    def test_without_entropy(self, files):
+        # pylint: disable=no-self-use,redefined-outer-name
+        # Not sampled by default.
+        policy = CompressionPolicy(RULES, level=1)
+        assert policy.choose('random.bin', read(files['random.bin'])) \
+            == ('default', ZIP_DEFLATED, 1)
+
+    def test_samples_the_start(self):
+        # pylint: disable=no-self-use
+        data = os.urandom(1000) + b'\0' * 1000
+        assert CompressionPolicy(entropy=7.5, sample_size=1000) \
+            .choose('data', data)[0] == 'entropy'
+        assert CompressionPolicy(entropy=7.5, sample_size=2000) \
+            .choose('data', data)[0] == 'default'
+
+    def test_compress(self, files):
+        # pylint: disable=no-self-use,redefined-outer-name
+        policy = CompressionPolicy(RULES, entropy=7.5)
+        stored = policy.compress(files['random.bin'], 'random.bin')
+        assert stored.compress_type == ZIP_STORED
+        assert len(stored.data) == stored.file_size == 10000
+        deflated = policy.compress(files['text.txt'], 'text.txt')
+        assert deflated.compress_type == ZIP_DEFLATED
+        assert len(deflated.data) < deflated.file_size
+
+    @pytest.mark.parametrize("estimate,lines", [(False, 4), (True, 7)])
+    @patch('plpacker.compression.LOGGER')
+    def test_report(self, logger, files, estimate, lines):
+        # pylint: disable=no-self-use,redefined-outer-name
+        policy = CompressionPolicy(RULES, entropy=7.5, estimate=estimate)
+        for (name, path) in sorted(files.items()):
+            policy.compress(path, name)
+        policy.report()
+        rules = [call[0][1] for call in logger.info.call_args_list]
+        assert sorted(set(rules)) == [
+            'compressed', 'default', 'entropy', 'models']
+        # Along with what they saved, but for the default, when estimated.
+        assert len(rules) == lines
+
+        logger.reset_mock()
+        policy.report()
+        assert not logger.info.called
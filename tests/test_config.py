@@ -40,11 +40,25 @@ class TestConfigConstructor(object):
     def test_default_values(self):
         # pylint: disable=no-self-use
         config = Configuration({})
+        assert config.data['cache']['path'] is None
+        assert config.data['cache']['members_max_size'] == 1024 ** 3
+        assert config.data['cache']['virtualenvs_max_size'] == 4 * 1024 ** 3
+        assert config.data['cache']['stripped_max_size'] == 1024 ** 3
+        assert config.data['cache']['bases_max_size'] == 2 * 1024 ** 3
         assert config.data['virtualenv']['python'] == 'python2.7'
+        assert config.data['virtualenv']['installer'] == 'virtualenv'
         assert config.data['virtualenv']['path'] is None
         assert not config.data['virtualenv']['keep']
         assert config.data['virtualenv']['pip']['requirements'] == []
         assert config.data['virtualenv']['pip']['packages'] == []
+        assert config.data['virtualenv']['pip']['wheelhouse'] is None
+        assert config.data['virtualenv']['slimming'] is None
+        assert not config.data['virtualenv']['runtime_provided']['exclude']
+        assert config.data['virtualenv']['tree_shaking'] == {
+            'enabled': False, 'handlers': [], 'keep': []}
+        runtimes = config.data['virtualenv']['runtime_provided']['runtimes']
+        for minor in range(6, 14):
+            assert 'boto3' in runtimes['python3.{}'.format(minor)]
         assert config.data['virtualenv']['default_excludes'] == [
             'easy_install.*',
             'pip*/**',
@@ -54,6 +68,8 @@ class TestConfigConstructor(object):
         assert config.data['packager']['target'] == 'py-lambda-package.zip'
         assert config.data['packager']['build_path'] is None
         assert not config.data['packager']['keep']
+        assert config.data['packager']['jobs'] is None
+        assert not config.data['packager']['sort']
         assert not config.data['packager']['followlinks']
         assert config.data['packager']['includes'] == []
         assert config.data['packager']['excludes'] == []
@@ -74,14 +90,65 @@ class TestConfigConstructor(object):
         # pylint: disable=no-self-use
         # Poor version of scheme validation.
         config = Configuration({})
-        assert sorted(config.data.keys()) == ['packager', 'virtualenv']
+        assert sorted(config.data.keys()) == [
+            'cache', 'functions', 'packager', 'virtualenv']
+        assert sorted(config.data['cache'].keys()) == [
+            'bases_max_size', 'members_max_size', 'path', 'stripped_max_size',
+            'virtualenvs_max_size']
         assert sorted(config.data['packager'].keys()) == [
-            'build_path', 'default_excludes', 'excludes', 'followlinks',
-            'includes', 'keep', 'target']
+            'build_path', 'compile', 'compression', 'default_excludes',
+            'drop_sources', 'excludes', 'followlinks', 'includes',
+            'invalidation_mode', 'jobs', 'keep', 'layer_dir', 'optimize',
+            'shared_layers', 'sort', 'strip', 'target']
         assert sorted(config.data['virtualenv'].keys()) == [
-            'default_excludes', 'keep', 'path', 'pip', 'python']
+            'default_excludes', 'installer', 'keep', 'path', 'pip',
+            'python', 'runtime_provided', 'slimming', 'tree_shaking']
         assert sorted(config.data['virtualenv']['pip'].keys()) == [
-            'packages', 'requirements']
+            'packages', 'requirements', 'wheelhouse']
+
+
+class TestConfigFunctions(object):
+    def test_none(self):
+        # pylint: disable=no-self-use
+        assert Configuration({}).functions() == []
+
+    def test_shared_defaults(self):
+        # pylint: disable=no-self-use
+        config = Configuration({'jobs': 3})
+        config.data['functions'] = [
+            {'name': 'api',
+             'packager': {'target': 'api.zip', 'includes': ['api/**']}},
+            {'packager': {'target': 'worker.zip'},
+             'virtualenv': {'pip': {'packages': ['requests']}}}]
+
+        (api, worker) = config.functions()
+        assert (api['name'], worker['name']) == ('api', 'worker')
+        assert api['packager']['includes'] == ['api/**']
+        assert worker['packager']['includes'] == []
+        assert api['virtualenv']['pip']['packages'] == []
+        assert worker['virtualenv']['pip']['packages'] == ['requests']
+        assert api['packager']['jobs'] == worker['packager']['jobs'] == 3
+        assert 'functions' not in api
+        assert config.data['packager']['target'] == 'py-lambda-package.zip'
+
+    def test_same_target(self):
+        # pylint: disable=no-self-use
+        config = Configuration({})
+        config.data['functions'] = [{'name': 'a'}, {'name': 'b'}]
+        with pytest.raises(ValueError):
+            config.functions()
+
+    def test_shared_layers_without_layer_dir(self):
+        # pylint: disable=no-self-use
+        config = Configuration({'shared_layers': True})
+        config.data['functions'] = [{'packager': {'target': 'a.zip'}},
+                                    {'packager': {'target': 'b.zip'}}]
+        with pytest.raises(ValueError) as info:
+            config.functions()
+        assert '--layer-dir' in str(info.value)
+
+        config.data['packager']['layer_dir'] = 'layers'
+        assert len(config.functions()) == 2
 
 
 class TestConfigMergeDicts(object):
@@ -102,6 +169,9 @@ class TestConfigMergeDicts(object):
         ({'a': {'a1': '1a'}, 'b': '2'},
          {'a': {'a2': '2a'}},
          {'a': {'a1': '1a', 'a2': '2a'}, 'b': '2'}),
+        ({'a': None, 'b': 2},
+         {'a': 4, 'b': None},
+         {'a': 4, 'b': None}),
     )
 
     @pytest.mark.parametrize("left,right,expected", good_merge_data)
@@ -160,28 +230,64 @@ class TestConfigMergeCliArgs(object):
         # `cli_args_sentinals` instead of `cli_args` just for in case
         # `cli_args` was tampered with.
         cli_args_sentinals = self.cli_args_sentinals()
+        assert merged_data['cache']['path'] \
+            == cli_args_sentinals['cache_dir']
         assert merged_data['virtualenv']['python'] \
             == cli_args_sentinals['python']
+        assert merged_data['virtualenv']['slimming'] \
+            == cli_args_sentinals['slimming']
+        assert merged_data['virtualenv']['runtime_provided']['exclude'] \
+            == cli_args_sentinals['exclude_runtime_provided']
+        assert merged_data['virtualenv']['tree_shaking']['enabled'] \
+            == cli_args_sentinals['tree_shake']
+        assert merged_data['virtualenv']['tree_shaking']['handlers'] \
+            == cli_args_sentinals['handlers']
+        assert merged_data['virtualenv']['tree_shaking']['keep'] \
+            == cli_args_sentinals['tree_shake_keep']
         assert merged_data['virtualenv']['path'] \
             == cli_args_sentinals['virtualenv_dir']
+        assert merged_data['virtualenv']['installer'] \
+            == cli_args_sentinals['installer']
         assert merged_data['virtualenv']['keep'] \
             == cli_args_sentinals['keep_virtualenv']
         assert merged_data['virtualenv']['pip']['requirements'] \
             == cli_args_sentinals['requirements']
         assert merged_data['virtualenv']['pip']['packages'] \
             == cli_args_sentinals['packages']
+        assert merged_data['virtualenv']['pip']['wheelhouse'] \
+            == cli_args_sentinals['wheelhouse']
         assert merged_data['packager']['target'] \
             == cli_args_sentinals['output']
         assert merged_data['packager']['build_path'] \
             == cli_args_sentinals['archive_dir']
         assert merged_data['packager']['keep'] \
             == cli_args_sentinals['keep_archive']
+        assert merged_data['packager']['layer_dir'] \
+            == cli_args_sentinals['layer_dir']
+        assert merged_data['packager']['shared_layers'] \
+            == cli_args_sentinals['shared_layers']
+        assert merged_data['packager']['compile'] \
+            == cli_args_sentinals['compile']
+        assert merged_data['packager']['compression']['level'] \
+            == cli_args_sentinals['compress_level']
+        assert merged_data['packager']['optimize'] \
+            == cli_args_sentinals['optimize']
+        assert merged_data['packager']['invalidation_mode'] \
+            == cli_args_sentinals['invalidation_mode']
+        assert merged_data['packager']['drop_sources'] \
+            == cli_args_sentinals['drop_sources']
+        assert merged_data['packager']['strip'] \
+            == cli_args_sentinals['strip']
         assert merged_data['packager']['followlinks'] \
             == cli_args_sentinals['followlinks']
         assert merged_data['packager']['includes'] \
             == cli_args_sentinals['includes']
         assert merged_data['packager']['excludes'] \
             == cli_args_sentinals['excludes']
+        assert merged_data['packager']['jobs'] \
+            == cli_args_sentinals['jobs']
+        assert merged_data['packager']['sort'] \
+            == cli_args_sentinals['sort']
 
     def test_default_data_with_cli_args(self):
         # pylint: disable=no-self-use,protected-access
@@ -193,28 +299,64 @@ class TestConfigMergeCliArgs(object):
         # `cli_args_sentinals` instead of `cli_args` just for in case
         # `cli_args` was tampered with.
         cli_args_sentinals = self.cli_args_sentinals()
+        assert merged_data['cache']['path'] \
+            == cli_args_sentinals['cache_dir']
         assert merged_data['virtualenv']['python'] \
             == cli_args_sentinals['python']
+        assert merged_data['virtualenv']['slimming'] \
+            == cli_args_sentinals['slimming']
+        assert merged_data['virtualenv']['runtime_provided']['exclude'] \
+            == cli_args_sentinals['exclude_runtime_provided']
+        assert merged_data['virtualenv']['tree_shaking']['enabled'] \
+            == cli_args_sentinals['tree_shake']
+        assert merged_data['virtualenv']['tree_shaking']['handlers'] \
+            == cli_args_sentinals['handlers']
+        assert merged_data['virtualenv']['tree_shaking']['keep'] \
+            == cli_args_sentinals['tree_shake_keep']
         assert merged_data['virtualenv']['path'] \
             == cli_args_sentinals['virtualenv_dir']
+        assert merged_data['virtualenv']['installer'] \
+            == cli_args_sentinals['installer']
         assert merged_data['virtualenv']['keep'] \
             == cli_args_sentinals['keep_virtualenv']
         assert merged_data['virtualenv']['pip']['requirements'] \
             == cli_args_sentinals['requirements']
         assert merged_data['virtualenv']['pip']['packages'] \
             == cli_args_sentinals['packages']
+        assert merged_data['virtualenv']['pip']['wheelhouse'] \
+            == cli_args_sentinals['wheelhouse']
         assert merged_data['packager']['target'] \
             == cli_args_sentinals['output']
         assert merged_data['packager']['build_path'] \
             == cli_args_sentinals['archive_dir']
         assert merged_data['packager']['keep'] \
             == cli_args_sentinals['keep_archive']
+        assert merged_data['packager']['layer_dir'] \
+            == cli_args_sentinals['layer_dir']
+        assert merged_data['packager']['shared_layers'] \
+            == cli_args_sentinals['shared_layers']
+        assert merged_data['packager']['compile'] \
+            == cli_args_sentinals['compile']
+        assert merged_data['packager']['compression']['level'] \
+            == cli_args_sentinals['compress_level']
+        assert merged_data['packager']['optimize'] \
+            == cli_args_sentinals['optimize']
+        assert merged_data['packager']['invalidation_mode'] \
+            == cli_args_sentinals['invalidation_mode']
+        assert merged_data['packager']['drop_sources'] \
+            == cli_args_sentinals['drop_sources']
+        assert merged_data['packager']['strip'] \
+            == cli_args_sentinals['strip']
         assert merged_data['packager']['followlinks'] \
             == cli_args_sentinals['followlinks']
         assert merged_data['packager']['includes'] \
             == cli_args_sentinals['includes']
         assert merged_data['packager']['excludes'] \
             == cli_args_sentinals['excludes']
+        assert merged_data['packager']['jobs'] \
+            == cli_args_sentinals['jobs']
+        assert merged_data['packager']['sort'] \
+            == cli_args_sentinals['sort']
 
     @patch('plpacker.config.CliArgInjector')
     def test_utilizes_injector(self, injector):
@@ -229,23 +371,41 @@ class TestConfigMergeCliArgs(object):
         config = Configuration({})
         cli_args = self.cli_args_sentinals()
         config._merge_cli_args({}, cli_args)
-        assert map_mock.call_count == 11
+        assert map_mock.call_count == 29
 
     @staticmethod
     def cli_args_sentinals():
         return {
             'archive_dir': sentinel.archive_dir,
+            'cache_dir': sentinel.cache_dir,
+            'compile': sentinel.compile,
+            'compress_level': sentinel.compress_level,
             'config_file': sentinel.config_file,
+            'drop_sources': sentinel.drop_sources,
+            'exclude_runtime_provided': sentinel.exclude_runtime_provided,
             'excludes': sentinel.excludes,
             'followlinks': sentinel.followlinks,
+            'handlers': sentinel.handlers,
             'includes': sentinel.includes,
+            'installer': sentinel.installer,
+            'invalidation_mode': sentinel.invalidation_mode,
+            'jobs': sentinel.jobs,
             'keep_archive': sentinel.keep_archive,
             'keep_virtualenv': sentinel.keep_virtualenv,
+            'layer_dir': sentinel.layer_dir,
+            'optimize': sentinel.optimize,
             'output': sentinel.output,
             'packages': sentinel.packages,
             'python': sentinel.python,
             'requirements': sentinel.requirements,
-            'virtualenv_dir': sentinel.virtualenv_dir}
+            'shared_layers': sentinel.shared_layers,
+            'slimming': sentinel.slimming,
+            'sort': sentinel.sort,
+            'strip': sentinel.strip,
+            'tree_shake': sentinel.tree_shake,
+            'tree_shake_keep': sentinel.tree_shake_keep,
+            'virtualenv_dir': sentinel.virtualenv_dir,
+            'wheelhouse': sentinel.wheelhouse}
 
 
 class TestConfigFindConfigFile(object):
@@ -280,6 +440,16 @@ class TestConfigFindConfigFile(object):
         path = config._find_config_file(None)
         assert path is None
 
+    @patch.object(Configuration, '_load_file')
+    def test_looks_in_cwd_given(self, load_file_mock, source_fs):
+        # pylint: disable=no-self-use,protected-access,unused-argument
+        load_file_mock.return_value = {}
+        os.chdir('/home/foo/src/bar-project')
+        config = Configuration({}, '/home')
+        assert config.config_file_path is None
+        assert config._find_config_file('conf.yaml', '/home/foo') \
+            == '/home/foo/conf.yaml'
+
 
 class TestConfigMerge(object):
     @patch.object(Configuration, '_merge_cli_args')
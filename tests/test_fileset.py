@@ -2,15 +2,17 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 try:
-    from unittest import mock
     from unittest.mock import patch
 except ImportError:
-    import mock
     from mock import patch
 
+import os
+import time
+
 import pytest
 
-from plpacker.fileset import FileSet
+from plpacker.fileset import FileSet, scandir
+from plpacker.index import FileIndex
 
 
 class TestFileSetConstructor(object):
@@ -94,17 +96,49 @@ class TestFileSetExpandFileset(object):
         actual = fileset._expand_fileset()
         assert actual == ()
 
-    @patch.object(FileSet, '_expand_glob')
-    def test_calls_expand_glob(self, expand_glob_mock, source_fs):
-        # pylint: disable=unused-argument,no-self-use,protected-access
-        expand_glob_mock.return_value = []
-        FileSet('/home/foo/src/bar-project',
-                includes=['**'],
-                excludes=['c*i.jpg'],
-                followlinks=True)
-        expand_glob_mock.assert_has_calls([mock.call('**', True),
-                                           mock.call('c*i.jpg', True)])
-        assert expand_glob_mock.call_count == 2
+    def test_lists_directories_once(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with patch('plpacker.fileset.scandir',
+                   side_effect=scandir) as scandir_mock:
+            FileSet('/home/foo/src/bar-project',
+                    includes=['**', 'static/*'],
+                    excludes=['c*i.jpg', '*.yaml'],
+                    followlinks=True)
+        listed = [item[0][0] for item in scandir_mock.call_args_list]
+        assert '/home/foo/src/bar-project/static/images' in listed
+        assert len(listed) == len(set(listed))
+
+    def test_skips_excluded_directories(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with patch('plpacker.fileset.scandir',
+                   side_effect=scandir) as scandir_mock:
+            fileset = FileSet('/home/foo/src/bar-project',
+                              includes=['**'],
+                              excludes=['posts/**', 'stat*/**'])
+        listed = [item[0][0] for item in scandir_mock.call_args_list]
+        assert sorted(listed) == [
+            '/home/foo/src/bar-project',
+            '/home/foo/src/bar-project/.git',
+            '/home/foo/src/bar-project/templates',
+            '/home/foo/src/bar-project/templates/images']
+        assert 'static/images/hello.png' not in fileset.fileset
+
+    def test_skips_unmatched_directories(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with patch('plpacker.fileset.scandir',
+                   side_effect=scandir) as scandir_mock:
+            FileSet('/home/foo/src/bar-project', includes=['static/images/*'])
+        listed = [item[0][0] for item in scandir_mock.call_args_list]
+        assert listed == ['/home/foo/src/bar-project',
+                          '/home/foo/src/bar-project/static',
+                          '/home/foo/src/bar-project/static/images']
+
+    def test_excludes_all_patterns(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        fileset = FileSet('/home/foo/src/bar-project',
+                          includes=['*', 'static/images/*'],
+                          excludes=['*.yaml', 'static/images/*'])
+        assert fileset.fileset == ('config.json',)
 
 
 class TestFileSetExpandGlob(object):
@@ -200,8 +234,16 @@ class TestFileSetExpandGlob(object):
           'posts/a/b/c/d/e/got.html',
           'posts/a/b/c/d/tess.html',
           'posts/a/ref-90.html')),
-        ('posts/a/**/e/*.html', ()),
-        ('posts/a/**/c/**/e/*.html', ()),
+        ('posts/a/**/e/*.html',
+         ('posts/a/b/c/d/e/bar.html',
+          'posts/a/b/c/d/e/got.html')),
+        ('posts/a/**/c/**/e/*.html',
+         ('posts/a/b/c/d/e/bar.html',
+          'posts/a/b/c/d/e/got.html')),
+        ('posts/**/b/**/*.txt',
+         ('posts/a/b/c/d/tess.txt',)),
+        ('**/d/*.txt',
+         ('posts/a/b/c/d/tess.txt',)),
     )
 
     @pytest.mark.parametrize("expression,expected", double_splat)
@@ -276,3 +318,104 @@ class TestIterator(object):
         assert next(iterator) == (
             '/home/foo/src/bar-project/static/images/large.jpg',
             'static/images/large.jpg')
+
+
+class TestFileSetLazy(object):
+    def test_does_not_scan_up_front(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with patch('plpacker.fileset.scandir') as scandir_mock:
+            FileSet('/home/foo/src/bar-project', includes=['**'], lazy=True)
+        assert not scandir_mock.called
+
+    def test_sorted_like_eager(self, fileset, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        lazy = FileSet(fileset.directory, fileset.includes, fileset.excludes,
+                       lazy=True)
+        assert tuple(lazy) == fileset.fileset
+        assert list(lazy.pairs()) == list(fileset.pairs())
+
+    def test_sorted_whole_tree(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        lazy = FileSet('/home/foo/src/bar-project', includes=['**'],
+                       lazy=True)
+        assert list(lazy) == sorted(lazy)
+
+    def test_unsorted(self, fileset, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        lazy = FileSet(fileset.directory, fileset.includes, fileset.excludes,
+                       lazy=True, sort=False)
+        assert sorted(lazy) == list(fileset.fileset)
+
+    def test_rescans(self, source_fs):
+        # pylint: disable=no-self-use
+        lazy = FileSet('/home/foo/src/bar-project', includes=['*.json'],
+                       lazy=True)
+        assert list(lazy) == ['config.json']
+        source_fs.create_file('/home/foo/src/bar-project/new.json')
+        assert list(lazy) == ['config.json', 'new.json']
+
+    def test_no_length_or_index(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        lazy = FileSet('/home/foo/src/bar-project', includes=['**'],
+                       lazy=True)
+        with pytest.raises(TypeError):
+            len(lazy)
+        with pytest.raises(TypeError):
+            lazy[0]  # pylint: disable=pointless-statement
+
+
+class TestEntries(object):
+    def test_eager(self, fileset, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with open('/home/foo/src/bar-project/.gitignore', 'w') as handle:
+            handle.write('*.pyc')
+        entries = list(fileset.entries())
+        assert [item[:2] for item in entries] == list(fileset.pairs())
+        # Recorded when the file set was scanned, before the write above.
+        assert entries[1][2].size == 0
+
+    def test_lazy(self, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file('/home/foo/src/bar-project/data.json',
+                              contents='{}')
+        os.chmod('/home/foo/src/bar-project/data.json', 0o640)
+        lazy = FileSet('/home/foo/src/bar-project', includes=['data.json'],
+                       lazy=True)
+        [(source, arcname, stat)] = list(lazy.entries())
+        assert source == '/home/foo/src/bar-project/data.json'
+        assert arcname == 'data.json'
+        assert stat.size == 2
+        assert stat.mode & 0o777 == 0o640
+        assert stat.mtime == os.stat(source).st_mtime
+
+    def test_dangling_link(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        fileset = FileSet('/home/foo/src/bar-project',
+                          includes=['posts/links/*'])
+        [(_, arcname, stat)] = list(fileset.entries())
+        assert arcname == 'posts/links/tef-90.html'
+        assert stat.mode
+
+
+class TestFingerprint(object):
+    def test_stable(self, fileset, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        for (source, _) in fileset.pairs():
+            os.utime(source, (time.time() - 60, time.time() - 60))
+        fileset = FileSet(fileset.directory, fileset.includes,
+                          fileset.excludes)
+        index = FileIndex('/home/foo/tmp/index.json')
+        lazy = FileSet(fileset.directory, fileset.includes, fileset.excludes,
+                       lazy=True, sort=False)
+        assert fileset.fingerprint(index) == lazy.fingerprint(index)
+        assert index.hashed == 5
+
+    def test_content_changes(self, fileset, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        index = FileIndex('/home/foo/tmp/index.json')
+        before = fileset.fingerprint(index)
+        with open('/home/foo/src/bar-project/.gitignore', 'w') as handle:
+            handle.write('*.pyc')
+        after = FileSet(fileset.directory, fileset.includes,
+                        fileset.excludes).fingerprint(index)
+        assert before != after
@@ -0,0 +1,133 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import os
+import time
+
+from plpacker.fileset import file_stat
+from plpacker.index import FileIndex, hash_file
+
+INDEX = '/home/foo/tmp/index/zip.json'
+SOURCE = '/home/foo/tmp/data.txt'
+
+
+def stat_of(path):
+    return file_stat(os.stat(path))
+
+
+def create_file(source_fs, path, contents):
+    # Old enough not to be racy.
+    source_fs.create_file(path, contents=contents)
+    os.utime(path, (time.time() - 60, time.time() - 60))
+
+
+class TestFileIndex(object):
+    def test_hashes_new_files(self, source_fs):
+        # pylint: disable=no-self-use
+        create_file(source_fs, SOURCE, 'abc')
+        index = FileIndex(INDEX)
+        assert index.digest(SOURCE, stat_of(SOURCE)) \
+            == hashlib.sha256(b'abc').hexdigest()
+        assert (index.hashed, index.reused) == (1, 0)
+
+    def test_reuses_unchanged(self, source_fs):
+        # pylint: disable=no-self-use
+        create_file(source_fs, SOURCE, 'abc')
+        index = FileIndex(INDEX)
+        digest = index.digest(SOURCE, stat_of(SOURCE))
+        index.save()
+
+        index = FileIndex(INDEX)
+        assert index.digest(SOURCE, stat_of(SOURCE)) == digest
+        assert (index.hashed, index.reused) == (0, 1)
+
+    def test_rehashes_changed(self, source_fs):
+        # pylint: disable=no-self-use
+        create_file(source_fs, SOURCE, 'abc')
+        index = FileIndex(INDEX)
+        index.digest(SOURCE, stat_of(SOURCE))
+        index.save()
+        with open(SOURCE, 'w') as handle:
+            handle.write('abcd')
+        os.utime(SOURCE, (time.time() - 30, time.time() - 30))
+
+        index = FileIndex(INDEX)
+        assert index.digest(SOURCE, stat_of(SOURCE)) \
+            == hashlib.sha256(b'abcd').hexdigest()
+        assert (index.hashed, index.reused) == (1, 0)
+
+    def test_rehashes_racy(self, source_fs):
+        # pylint: disable=no-self-use
+        # Modified right before being hashed, it could change again without
+        # its modification time changing.
+        source_fs.create_file(SOURCE, contents='abc')
+        index = FileIndex(INDEX)
+        index.digest(SOURCE, stat_of(SOURCE))
+        index.save()
+
+        index = FileIndex(INDEX)
+        index.digest(SOURCE, stat_of(SOURCE))
+        assert (index.hashed, index.reused) == (1, 0)
+
+    def test_reuses_within_run(self, source_fs):
+        # pylint: disable=no-self-use
+        create_file(source_fs, SOURCE, 'abc')
+        index = FileIndex(INDEX)
+        index.digest(SOURCE, stat_of(SOURCE))
+        index.digest(SOURCE, stat_of(SOURCE))
+        assert (index.hashed, index.reused) == (1, 1)
+
+    def test_keeps_only_seen(self, source_fs):
+        # pylint: disable=no-self-use
+        create_file(source_fs, SOURCE, 'abc')
+        create_file(source_fs, '/home/foo/tmp/other.txt', 'xyz')
+        index = FileIndex(INDEX)
+        index.digest(SOURCE, stat_of(SOURCE))
+        index.digest('/home/foo/tmp/other.txt',
+                     stat_of('/home/foo/tmp/other.txt'))
+        index.save()
+
+        index = FileIndex(INDEX)
+        index.digest(SOURCE, stat_of(SOURCE))
+        index.save()
+
+        index = FileIndex(INDEX)
+        index.digest('/home/foo/tmp/other.txt',
+                     stat_of('/home/foo/tmp/other.txt'))
+        assert (index.hashed, index.reused) == (1, 0)
+
+    def test_reused_after_save(self, source_fs):
+        # pylint: disable=no-self-use
+        # As kept in memory by `plp serve`.
+        create_file(source_fs, SOURCE, 'abc')
+        index = FileIndex(INDEX)
+        index.digest(SOURCE, stat_of(SOURCE))
+        index.save()
+        index.digest(SOURCE, stat_of(SOURCE))
+        assert (index.hashed, index.reused) == (0, 1)
+
+    def test_records_archive(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        index = FileIndex(INDEX)
+        assert index.archive is None
+        index.archive = {'fingerprint': 'abc'}
+        index.save()
+        assert FileIndex(INDEX).archive == {'fingerprint': 'abc'}
+
+    def test_ignores_corrupt(self, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file(INDEX, contents='{"version": 1, "entr')
+        index = FileIndex(INDEX)
+        assert index.archive is None
+
+    def test_ignores_other_versions(self, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file(INDEX, contents='{"version": 0}')
+        index = FileIndex(INDEX)
+        assert index.archive is None
+
+
+def test_hash_file(source_fs):
+    source_fs.create_file(SOURCE, contents='abc' * 1000000)
+    assert hash_file(SOURCE) == hashlib.sha256(b'abc' * 1000000).hexdigest()
@@ -0,0 +1,118 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import zipfile
+
+from plpacker.layers import (Distribution, layer_name, plan_layers,
+                             read_distributions)
+
+DEPENDENCIES = '/home/foo/tmp/deps.zip'
+
+
+def distribution(name, size):
+    return Distribution(name=name, arcnames=frozenset([name + '.py']),
+                        size=size, compress_size=size)
+
+
+def write_dependencies(path, requested=False):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('six.py', 'x' * 100)
+        record = ['six.py,sha256=abc,100',
+                  'six-1.0.dist-info/RECORD,,',
+                  'six-1.0.dist-info/INSTALLER,,']
+        if requested:
+            archive.writestr('six-1.0.dist-info/REQUESTED', '')
+            record.append('six-1.0.dist-info/REQUESTED,,')
+        archive.writestr('six-1.0.dist-info/RECORD', '\n'.join(record))
+        archive.writestr('six-1.0.dist-info/INSTALLER', 'pip')
+        archive.writestr('handler_helpers.py', 'y')
+
+
+class TestReadDistributions(object):
+    def test_reads_records(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        write_dependencies(DEPENDENCIES)
+        (six,) = read_distributions(DEPENDENCIES).values()
+        assert six.name == 'six-1.0.dist-info'
+        assert six.arcnames == frozenset([
+            'six.py', 'six-1.0.dist-info/RECORD',
+            'six-1.0.dist-info/INSTALLER'])
+        assert six.size == 103 + len('six.py,sha256=abc,100\n'
+                                     'six-1.0.dist-info/RECORD,,\n'
+                                     'six-1.0.dist-info/INSTALLER,,')
+
+    def test_byte_code_follows_source(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        write_dependencies(DEPENDENCIES)
+        with zipfile.ZipFile(DEPENDENCIES, 'a') as archive:
+            archive.writestr('six.pyc', 'z')
+            archive.writestr('__pycache__/six.cpython-38.pyc', 'z')
+            archive.writestr('__pycache__/handler_helpers.cpython-38.pyc',
+                             'z')
+        (six,) = read_distributions(DEPENDENCIES).values()
+        assert 'six.pyc' in six.arcnames
+        assert '__pycache__/six.cpython-38.pyc' in six.arcnames
+        assert '__pycache__/handler_helpers.cpython-38.pyc' \
+            not in six.arcnames
+
+    def test_same_key_for_same_install(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        write_dependencies(DEPENDENCIES)
+        write_dependencies('/home/foo/tmp/other.zip', requested=True)
+        assert list(read_distributions(DEPENDENCIES)) \
+            == list(read_distributions('/home/foo/tmp/other.zip'))
+        assert list(read_distributions(DEPENDENCIES)) \
+            != list(read_distributions(DEPENDENCIES, salt='compiled'))
+
+
+class TestPlanLayers(object):
+    def test_groups_by_users(self):
+        # pylint: disable=no-self-use
+        functions = {
+            'a': {'boto': distribution('boto', 100),
+                  'six': distribution('six', 10),
+                  'numpy': distribution('numpy', 500)},
+            'b': {'boto': distribution('boto', 100),
+                  'six': distribution('six', 10)},
+            'c': {'numpy': distribution('numpy', 500),
+                  'requests': distribution('requests', 50)}}
+        layers = plan_layers(functions)
+        assert [(layer.keys, layer.functions, layer.size)
+                for layer in layers] == [
+                    (('numpy',), ('a', 'c'), 500),
+                    (('boto', 'six'), ('a', 'b'), 110)]
+
+    def test_limits(self):
+        # pylint: disable=no-self-use
+        functions = {
+            'a': {'x': distribution('x', 20),
+                  'y': distribution('y', 10)},
+            'b': {'x': distribution('x', 20)},
+            'c': {'y': distribution('y', 10)}}
+        # `y` would be a second layer for `a`.
+        layers = plan_layers(functions, max_layers=1, max_size=100)
+        assert [layer.keys for layer in layers] == [('x',)]
+
+    def test_limits_functions_with_layers(self):
+        # pylint: disable=no-self-use
+        big = 150 * 1024 * 1024
+        functions = {
+            'a': {'numpy': distribution('numpy', big),
+                  'scipy': distribution('scipy', big),
+                  'six': distribution('six', 10)},
+            'b': {'numpy': distribution('numpy', big),
+                  'scipy': distribution('scipy', big)},
+            'c': {'six': distribution('six', 10)},
+            'd': {'boto': distribution('boto', 100)},
+            'e': {'boto': distribution('boto', 100)}}
+        # Each fits in a layer, not both with `a` or `b`.
+        layers = plan_layers(functions)
+        assert [(layer.keys, layer.functions) for layer in layers] == [
+            (('boto',), ('d', 'e'))]
+
+    def test_layer_name(self):
+        # pylint: disable=no-self-use
+        (layer,) = plan_layers({'a': {'six': distribution('six', 10)},
+                                'b': {'six': distribution('six', 10)}})
+        assert layer_name(layer).startswith('layer-')
+        assert layer_name(layer) == layer_name(layer._replace(size=0))
@@ -1,11 +1,19 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
 import os
 import zipfile
 
 import pytest
 
+from plpacker.cache import MemberCache
+from plpacker.compression import CompressionPolicy
+from plpacker.fileset import FileSet
 from plpacker.packager import Packager
 
 
@@ -14,20 +22,31 @@ class TestConstructor(object):
         # pylint: disable=unused-argument, no-self-use
         packer = Packager('zip.zip')
         assert not packer.keep
-        # pylint: disable=len-as-condition
-        assert len(packer.build_path) > 0
-        assert os.path.isabs(packer.build_path)
+        assert packer.jobs >= 1
+        assert packer.build_path is None
+        assert not packer.manifest
+
+    def test_jobs(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        assert Packager('zip.zip', jobs=3).jobs == 3
 
     def test_with(self, source_fs):
         # pylint: disable=unused-argument, no-self-use
-        with Packager('zip.zip') as packer:
+        with Packager('zip.zip', keep=True) as packer:
             assert os.path.exists(packer.build_path)
-        assert not os.path.exists(packer.build_path)
+        assert os.path.exists(packer.build_path)
 
-    def test_creates_build_dir(self, source_fs):
+    def test_no_staging_without_keep(self, source_fs):
         # pylint: disable=unused-argument, no-self-use
         build_path = '/home/foo/tmp/build'
         packer = Packager('zip.zip', build_path)
+        assert packer.build_path is None
+        assert not os.path.exists(build_path)
+
+    def test_creates_build_dir(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        build_path = '/home/foo/tmp/build'
+        packer = Packager('zip.zip', build_path, True)
         assert os.path.exists(packer.build_path)
 
     def test_error_on_existing_build_dir(self, source_fs):
@@ -35,16 +54,17 @@ class TestConstructor(object):
         # pylint: disable=invalid-name
         build_path = '/home/foo/tmp'
         with pytest.raises(OSError):
-            Packager('zip.zip', build_path)
+            Packager('zip.zip', build_path, True)
 
 
 class TestClean(object):
-    def test_deletes_build_dir(self, source_fs):
+    def test_nothing_staged(self, source_fs):
         # pylint: disable=unused-argument, no-self-use
         build_path = '/home/foo/tmp/build'
         packer = Packager('zip.zip', build_path)
         packer.package()
-        packer.clean()
+        with pytest.raises(RuntimeError):
+            packer.clean()
         assert not os.path.exists(build_path)
 
     def test_keeps(self, source_fs):
@@ -114,3 +134,206 @@ class TestPackage(object):
                             'posts/a/b/c/d/tess.txt',
                             'static/images/large.gif',
                             'static/images/large.jpg']
+
+    @pytest.mark.parametrize("jobs", [1, 4])
+    def test_zip_contents_in_manifest_order(self, source_fs, fileset, jobs):
+        # pylint: disable=unused-argument, no-self-use
+        packager = Packager('zip.zip', jobs=jobs)
+        packager.add_fileset_items(fileset)
+        packager.package()
+
+        with zipfile.ZipFile('zip.zip', 'r') as zip_file:
+            assert not zip_file.testzip()
+            assert zip_file.namelist() == list(packager.manifest.keys())
+
+    @patch('plpacker.cache.LOGGER')
+    def test_reports_and_prunes_cache(self, logger, source_fs, fileset):
+        # pylint: disable=unused-argument, no-self-use
+        cache = MemberCache('/home/foo/tmp/cache')
+        reported = []
+        for _ in range(2):
+            packager = Packager('zip.zip', cache=cache)
+            packager.add_fileset_items(fileset)
+            packager.package()
+            reported.append(logger.info.call_args[0][1:3])
+
+        # The fixture files are all empty, so they share one cache entry.
+        assert (cache.hits, cache.misses) == (9, 1)
+        # Each build only reports its own lookups.
+        assert reported == [(4, 1), (5, 0)]
+        with zipfile.ZipFile('zip.zip', 'r') as zip_file:
+            assert not zip_file.testzip()
+
+    def test_copies_archives(self, packager, source_fs, fileset):
+        # pylint: disable=unused-argument, no-self-use
+        with zipfile.ZipFile('/home/foo/tmp/base.zip', 'w') as zip_file:
+            zip_file.writestr('.gitignore', b'from the base archive')
+            zip_file.writestr('lib/module.py', b'import os')
+
+        packager.add_fileset_items(fileset)
+        packager.add_archive('/home/foo/tmp/base.zip')
+        packager.package()
+
+        with zipfile.ZipFile('zip.zip', 'r') as zip_file:
+            assert not zip_file.testzip()
+            assert len(zip_file.namelist()) == 6
+            assert zip_file.read('lib/module.py') == b'import os'
+            assert zip_file.read('.gitignore') == b''
+
+    def test_streams_from_source(self, packager, source_fs, fileset):
+        # pylint: disable=unused-argument, no-self-use
+        packager.add_fileset_items(fileset)
+        assert packager.manifest['.gitignore'] == \
+            '/home/foo/src/bar-project/.gitignore'
+
+    def test_records_stats(self, packager, source_fs, fileset):
+        # pylint: disable=unused-argument, no-self-use
+        source_fs.create_file('/home/foo/src/bar-project/lib/module.py',
+                              contents='import os')
+        packager.add_fileset_items(
+            FileSet('/home/foo/src/bar-project', 'lib/*.py', lazy=True))
+        packager.package()
+        assert packager.stats['lib/module.py'].size == 9
+
+    def test_stages_when_keeping(self, source_fs, fileset):
+        # pylint: disable=unused-argument, no-self-use
+        build_path = '/home/foo/tmp/build'
+        packager = Packager('zip.zip', build_path, True)
+        packager.add_fileset_items(fileset)
+        packager.package()
+
+        assert packager.manifest['.gitignore'] == \
+            '/home/foo/tmp/build/.gitignore'
+        assert os.path.isfile('/home/foo/tmp/build/posts/a/b/c/d/tess.txt')
+        with zipfile.ZipFile('zip.zip', 'r') as zip_file:
+            assert len(zip_file.namelist()) == 5
+
+    def test_stages_copied_archives(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        with zipfile.ZipFile('/home/foo/tmp/base.zip', 'w') as zip_file:
+            zip_file.writestr('lib/module.py', b'import os',
+                              zipfile.ZIP_DEFLATED)
+            zip_file.writestr('lib/data.bin', b'data')
+        packager = Packager('zip.zip', '/home/foo/tmp/build', True)
+        packager.add_archive('/home/foo/tmp/base.zip')
+        packager.package()
+
+        with open('/home/foo/tmp/build/lib/module.py', 'rb') as handle:
+            assert handle.read() == b'import os'
+        with open('/home/foo/tmp/build/lib/data.bin', 'rb') as handle:
+            assert handle.read() == b'data'
+
+    def test_first_added_wins(self, packager, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        packager.add_fileset_items(
+            FileSet('/home/foo/src/bar-project/posts/a/b/c/d', 'bw.html'))
+        packager.add_fileset_items(
+            FileSet('/home/foo/src/bar-project/posts/a1/b/diff', 'bw.html'))
+        assert list(packager.manifest.items()) == [
+            ('bw.html', '/home/foo/src/bar-project/posts/a/b/c/d/bw.html')]
+
+    def test_scans_lazy_filesets_while_packaging(self, packager, source_fs,
+                                                 fileset):
+        # pylint: disable=unused-argument, no-self-use
+        packager.add_fileset_items(
+            FileSet('/home/foo/src/bar-project/posts/a/b/c/d', '*.txt'))
+        packager.add_fileset_items(
+            FileSet(fileset.directory, fileset.includes, fileset.excludes,
+                    lazy=True))
+        assert list(packager.manifest.keys()) == ['tess.txt']
+
+        packager.package()
+        expected = ['tess.txt'] + list(fileset.fileset)
+        assert list(packager.manifest.keys()) == expected
+        with zipfile.ZipFile('zip.zip', 'r') as zip_file:
+            assert zip_file.namelist() == expected
+
+    def test_lazy_first_added_wins(self, packager, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        packager.add_fileset_items(
+            FileSet('/home/foo/src/bar-project/posts/a/b/c/d', 'bw.html',
+                    lazy=True))
+        packager.add_fileset_items(
+            FileSet('/home/foo/src/bar-project/posts/a1/b/diff', 'bw.html',
+                    lazy=True))
+        packager.package()
+        assert list(packager.manifest.items()) == [
+            ('bw.html', '/home/foo/src/bar-project/posts/a/b/c/d/bw.html')]
+
+
+class FakeCompiler(object):
+    # pylint: disable=too-few-public-methods
+    def __init__(self, drop_sources=False):
+        self.drop_sources = drop_sources
+        self.compiled = None
+
+    is_source = staticmethod(lambda arcname: arcname.endswith('.py'))
+    is_bytecode = staticmethod(lambda arcname: arcname.endswith('.pyc'))
+
+    def compile(self, entries, tmp_dir):
+        self.compiled = [arcname for (_, arcname, _) in entries]
+        compiled = []
+        for (source, arcname, stat) in entries:
+            if arcname.startswith('broken'):
+                continue
+            path = os.path.join(tmp_dir, arcname.replace('/', '-'))
+            with open(path, 'w') as handle:
+                handle.write('byte code')
+            compiled.append((path, arcname + 'c', stat))
+        return (compiled, [entry for entry in entries
+                           if entry[1].startswith('broken')])
+
+
+class TestCompile(object):
+    @staticmethod
+    def package(compiler):
+        root = '/home/foo/src/project'
+        os.makedirs(root)
+        for name in ('handler.py', 'handler.pyc', 'broken.py', 'data.json'):
+            with open(os.path.join(root, name), 'w') as handle:
+                handle.write(name)
+        packager = Packager('/home/foo/out.zip', compiler=compiler)
+        packager.add_fileset_items(FileSet(root, '**'))
+        packager.package()
+        with zipfile.ZipFile('/home/foo/out.zip') as archive:
+            return sorted(archive.namelist())
+
+    def test_compiles_sources(self, source_fs):
+        # pylint: disable=unused-argument
+        compiler = FakeCompiler()
+        assert self.package(compiler) == [
+            'broken.py', 'data.json', 'handler.py', 'handler.pyc']
+        assert sorted(compiler.compiled) == ['broken.py', 'handler.py']
+        with zipfile.ZipFile('/home/foo/out.zip') as archive:
+            assert archive.read('handler.pyc') == b'byte code'
+
+    def test_drops_sources(self, source_fs):
+        # pylint: disable=unused-argument
+        assert self.package(FakeCompiler(drop_sources=True)) == [
+            'broken.py', 'data.json', 'handler.pyc']
+
+
+class TestCompression(object):
+    def test_stores_compressed_content(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        root = '/home/foo/src/project'
+        os.makedirs(root)
+        for (name, data) in (('handler.py', b'import os\n' * 100),
+                             ('random.bin', os.urandom(1000)),
+                             ('data.zip', b'PK' + b'\0' * 100)):
+            with open(os.path.join(root, name), 'wb') as handle:
+                handle.write(data)
+        policy = CompressionPolicy(
+            {'compressed': {'level': 'store', 'globs': ['**/*.zip']}},
+            entropy=7.5)
+        packager = Packager('/home/foo/out.zip', compression=policy)
+        packager.add_fileset_items(FileSet(root, '**'))
+        packager.package()
+
+        with zipfile.ZipFile('/home/foo/out.zip') as archive:
+            assert not archive.testzip()
+            assert dict((info.filename, info.compress_type)
+                        for info in archive.infolist()) == {
+                            'data.zip': zipfile.ZIP_STORED,
+                            'handler.py': zipfile.ZIP_DEFLATED,
+                            'random.bin': zipfile.ZIP_STORED}
@@ -0,0 +1,128 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import pytest
+
+from plpacker.pattern import (Pattern, PatternSet, compile_pattern,
+                              compile_patterns)
+
+
+class TestPattern(object):
+    matches = (
+        ('*', 'config.json', True),
+        ('*', '.gitignore', False),
+        ('*', 'static/hello.png', False),
+        ('.*', '.gitignore', True),
+        ('static/*/*.png', 'static/images/hello.png', True),
+        ('static/*/*.png', 'static/images/a/hello.png', False),
+        ('static/[!a-h]*', 'static/images', True),
+        ('static/[!a-h]*', 'static/css', False),
+        ('static/[abc', 'static/[abc', True),
+        ('**', 'posts/a/.hidden', True),
+        ('**', 'config.json', True),
+        ('posts/**', 'posts/a/b/c/d/tess.txt', True),
+        ('posts/**', 'static/hello.png', False),
+        ('posts/**/*.txt', 'posts/a/b/c/d/tess.txt', True),
+        ('posts/**/*.txt', 'posts/a/b/c/d/tess.html', False),
+        ('**/*.txt', 'tess.txt', True),
+        ('**/d/*.txt', 'posts/a/b/c/d/tess.txt', True),
+        ('**/*.txt', 'posts/.tess.txt', True),
+        ('posts/*/*.txt', 'posts/.a/tess.txt', False),
+        ('posts/**/*.txt', 'posts/.a/tess.txt', True),
+        ('src/**/handlers/**/*.py', 'src/handlers/main.py', True),
+        ('src/**/handlers/**/*.py', 'src/a/b/handlers/c/main.py', True),
+        ('src/**/handlers/**/*.py', 'src/a/b/main.py', False),
+        ('src/**/handlers/**/*.py', 'src/handlers.py', False),
+        ('src/**/', 'src/a/main.py', True),
+        ('src**', 'src/main.py', False),
+        ('src**', 'srcfile', True),
+        ('s[a-z]c/*.py', 'src/main.py', True),
+        ('s[!a-z]c/*.py', 'src/main.py', False),
+        ('*.py', 'main.pyc', False),
+        ('', 'config.json', False),
+    )
+
+    @pytest.mark.parametrize('expression,path,expected', matches)
+    def test_match(self, expression, path, expected):
+        # pylint: disable=no-self-use
+        assert Pattern(expression).match(path) is expected
+
+    could_match_below = (
+        ('*', ['static'], False),
+        ('static/*', ['static'], True),
+        ('static/*', ['static', 'images'], False),
+        ('static/images/*', ['templates'], False),
+        ('s*/images/*', ['static', 'images'], True),
+        ('**', ['posts', 'a', 'b'], True),
+        ('posts/**', ['posts', 'a', 'b'], True),
+        ('posts/**', ['static'], False),
+        ('', ['static'], False),
+        ('src/**/handlers/*.py', ['src', 'a', 'b'], True),
+        ('src/**/handlers/*.py', ['lib'], False),
+        ('src/*/handlers/*.py', ['src', 'a', 'b'], False),
+        ('src/*/handlers/*.py', ['src', 'a', 'handlers'], True),
+    )
+
+    @pytest.mark.parametrize('expression,directory,expected',
+                             could_match_below)
+    def test_could_match_below(self, expression, directory, expected):
+        # pylint: disable=no-self-use
+        assert Pattern(expression).could_match_below(directory) is expected
+
+    covers_below = (
+        ('**', [], True),
+        ('**', ['posts'], True),
+        ('pip*/**', ['pip'], True),
+        ('pip*/**', ['pip', 'commands'], True),
+        ('pip*/**', ['setuptools'], False),
+        ('pip*/**', [], False),
+        ('pip*/**/*', ['pip'], True),
+        ('pip*/**/*.py', ['pip'], False),
+        ('pip*', ['pip'], False),
+        ('', [], False),
+        ('**/__pycache__/**', ['a', '__pycache__'], True),
+        ('**/__pycache__/**', ['a', 'b'], False),
+        ('src/**/tests/**', ['src', 'a', 'tests', 'b'], True),
+        ('**/*', ['a'], True),
+        ('*/**/*.py', ['a'], False),
+    )
+
+    @pytest.mark.parametrize('expression,directory,expected', covers_below)
+    def test_covers_below(self, expression, directory, expected):
+        # pylint: disable=no-self-use
+        assert Pattern(expression).covers_below(directory) is expected
+
+
+class TestPatternSet(object):
+    def test_match_any(self):
+        # pylint: disable=no-self-use
+        patterns = PatternSet(('*.json', 'static/**'))
+        assert patterns.match('config.json')
+        assert patterns.match('static/images/hello.png')
+        assert not patterns.match('templates/index.html')
+
+    def test_empty(self):
+        # pylint: disable=no-self-use
+        patterns = PatternSet(())
+        assert not patterns.match('config.json')
+        assert not patterns.could_match_below(['static'])
+        assert not patterns.covers_below(['static'])
+
+    def test_could_match_below_any(self):
+        # pylint: disable=no-self-use
+        patterns = PatternSet(('static/*', 'posts/**'))
+        assert patterns.could_match_below(['posts', 'a'])
+        assert patterns.could_match_below(['static'])
+        assert not patterns.could_match_below(['templates'])
+
+
+class TestCompile(object):
+    def test_pattern_cached(self):
+        # pylint: disable=no-self-use
+        assert compile_pattern('src/**/*.py') is compile_pattern('src/**/*.py')
+
+    def test_pattern_set_cached(self):
+        # pylint: disable=no-self-use
+        patterns = compile_patterns(['*.py', 'src/**'])
+        assert patterns is compile_patterns(('*.py', 'src/**'))
+        assert patterns.patterns[0] is compile_pattern('*.py')
@@ -1,11 +1,17 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import os
+import zipfile
+
 try:
     from unittest.mock import patch, sentinel, call
 except ImportError:
     from mock import patch, sentinel, call
 
+from plpacker.bytecode import Compiler
+from plpacker.fileset import FileSet
+from plpacker.index import FileIndex
 from plpacker.pylambdapacker import PyLambdaPacker
 
 
@@ -46,3 +52,280 @@ class TestPyLambdaPackerBuild(object):
             call(sentinel.venv_fileset1),
             call(sentinel.venv_fileset2)])
         packager.package.assert_called_with()
+
+
+class TestPyLambdaPackerBaseArchive(object):
+    @staticmethod
+    def make_packer(virtual_env, packager, max_size=None):
+        virtual_env.fingerprint.return_value = 'fingerprint'
+        virtual_env.fileset_excludes = ['pip*/**']
+        virtual_env.slimming = None
+        virtual_env.runtime_provided = None
+        virtual_env.tree_shaker = None
+        virtual_env.filesets = (FileSet('/home/foo/src/bar-project',
+                                        ['static/**']),)
+        packager.jobs = 1
+        packager.cache = None
+        packager.compiler = None
+        packager.stripper = None
+        packager.compression = None
+        return PyLambdaPacker(
+            virtual_env=virtual_env,
+            packager=packager,
+            filesets=(sentinel.fileset1,),
+            base_archive_dir='/home/foo/tmp/bases',
+            base_archive_max_size=max_size)
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_builds_base_archive(self, virtual_env, packager, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        packer = self.make_packer(virtual_env, packager)
+        packer.build()
+
+        virtual_env.create.assert_called_with()
+        packager.add_fileset_items.assert_has_calls([call(sentinel.fileset1)])
+        assert packager.add_fileset_items.call_count == 1
+        (base_archive,) = packager.add_archive.call_args[0]
+        assert os.path.dirname(base_archive) == '/home/foo/tmp/bases'
+        with zipfile.ZipFile(base_archive, 'r') as zip_file:
+            assert len(zip_file.namelist()) == 5
+        packager.package.assert_called_with()
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_reuses_base_archive(self, virtual_env, packager, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        self.make_packer(virtual_env, packager).build()
+        first_archive = packager.add_archive.call_args[0][0]
+        virtual_env.reset_mock()
+
+        self.make_packer(virtual_env, packager).build()
+
+        virtual_env.create.assert_not_called()
+        packager.add_archive.assert_called_with(first_archive)
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_evicts_old_base_archives(self, virtual_env, packager, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        source_fs.create_file('/home/foo/tmp/bases/base-old.zip',
+                              contents='x' * 1000)
+        os.utime('/home/foo/tmp/bases/base-old.zip', (1, 1))
+        self.make_packer(virtual_env, packager, max_size=10).build()
+
+        # The new archive is kept, however large.
+        assert os.listdir('/home/foo/tmp/bases') \
+            == [os.path.basename(packager.add_archive.call_args[0][0])]
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_uncacheable(self, virtual_env, packager, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        packer = self.make_packer(virtual_env, packager)
+        virtual_env.fingerprint.return_value = None
+        packer.build()
+
+        virtual_env.create.assert_called_with()
+        packager.add_archive.assert_not_called()
+        assert packager.add_fileset_items.call_count == 2
+
+
+class TestPyLambdaPackerLayer(object):
+    @staticmethod
+    def make_packer(virtual_env, packager, fingerprint='fingerprint'):
+        virtual_env.fingerprint.return_value = fingerprint
+        virtual_env.fileset_excludes = []
+        virtual_env.slimming = None
+        virtual_env.runtime_provided = None
+        virtual_env.tree_shaker = None
+        virtual_env.filesets = (FileSet('/home/foo/src/bar-project',
+                                        ['static/**']),)
+        packager.jobs = 1
+        packager.cache = None
+        packager.compiler = None
+        packager.stripper = None
+        packager.compression = None
+        return PyLambdaPacker(
+            virtual_env=virtual_env,
+            packager=packager,
+            filesets=(sentinel.fileset1,),
+            layer_dir='/home/foo/tmp/layers')
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_splits_dependencies(self, virtual_env, packager, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        packer = self.make_packer(virtual_env, packager)
+        packer.build()
+
+        packager.add_fileset_items.assert_called_once_with(sentinel.fileset1)
+        packager.add_archive.assert_not_called()
+        assert os.path.dirname(packer.layer) == '/home/foo/tmp/layers'
+        with zipfile.ZipFile(packer.layer, 'r') as zip_file:
+            names = zip_file.namelist()
+        assert len(names) == 5
+        assert 'python/static/images/hello.png' in names
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_reuses_layer(self, virtual_env, packager, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        first = self.make_packer(virtual_env, packager)
+        first.build()
+        virtual_env.reset_mock()
+
+        second = self.make_packer(virtual_env, packager)
+        second.build()
+        virtual_env.create.assert_not_called()
+        assert second.layer == first.layer
+
+        third = self.make_packer(virtual_env, packager, 'changed')
+        third.build()
+        assert third.layer != first.layer
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_named_by_content(self, virtual_env, packager, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        first = self.make_packer(virtual_env, packager, None)
+        first.build()
+        virtual_env.create.assert_called_with()
+        assert os.path.isfile(first.layer)
+
+        second = self.make_packer(virtual_env, packager, None)
+        second.build()
+        assert second.layer == first.layer
+
+        source_fs.create_file('/home/foo/src/bar-project/static/new.css')
+        third = self.make_packer(virtual_env, packager, None)
+        third.build()
+        assert third.layer != first.layer
+
+
+class TestPyLambdaPackerNoChanges(object):
+    @staticmethod
+    def make_packer(virtual_env, packager, layer_dir=None):
+        virtual_env.fingerprint.return_value = 'fingerprint'
+        virtual_env.fileset_excludes = ['pip*/**']
+        virtual_env.slimming = None
+        virtual_env.runtime_provided = None
+        virtual_env.tree_shaker = None
+        virtual_env.filesets = (FileSet('/home/foo/src/bar-project',
+                                        ['static/**']),)
+        packager.zip_file = '/home/foo/tmp/out.zip'
+        packager.jobs = 1
+        packager.cache = None
+        packager.compiler = None
+        packager.stripper = None
+        packager.compression = None
+
+        def package():
+            with open(packager.zip_file, 'w') as handle:
+                handle.write('zip')
+        packager.package.side_effect = package
+        return PyLambdaPacker(
+            virtual_env=virtual_env,
+            packager=packager,
+            filesets=(FileSet('/home/foo/src/bar-project', ['static/**']),),
+            index=FileIndex('/home/foo/tmp/index.json'),
+            layer_dir=layer_dir)
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_skips_unchanged(self, virtual_env, packager, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        self.make_packer(virtual_env, packager).build()
+        assert packager.package.call_count == 1
+
+        self.make_packer(virtual_env, packager).build()
+        assert packager.package.call_count == 1
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_rebuilds_changed_files(self, virtual_env, packager, source_fs):
+        # pylint: disable=no-self-use
+        self.make_packer(virtual_env, packager).build()
+        source_fs.create_file('/home/foo/src/bar-project/static/new.css')
+
+        self.make_packer(virtual_env, packager).build()
+        assert packager.package.call_count == 2
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_rebuilds_changed_dependencies(self, virtual_env, packager,
+                                           source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        self.make_packer(virtual_env, packager).build()
+
+        packer = self.make_packer(virtual_env, packager)
+        virtual_env.fingerprint.return_value = 'other'
+        packer.build()
+        assert packager.package.call_count == 2
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_rebuilds_changed_settings_in_layer(self, virtual_env, packager,
+                                                source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        self.make_packer(virtual_env, packager, '/home/foo/tmp/layers').build()
+        self.make_packer(virtual_env, packager, '/home/foo/tmp/layers').build()
+        assert packager.package.call_count == 1
+
+        packer = self.make_packer(virtual_env, packager,
+                                  '/home/foo/tmp/layers')
+        packager.compiler = Compiler(optimize=2)
+        packer.build()
+        assert packager.package.call_count == 2
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_rebuilds_missing_archive(self, virtual_env, packager,
+                                      source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        self.make_packer(virtual_env, packager).build()
+        os.remove('/home/foo/tmp/out.zip')
+
+        self.make_packer(virtual_env, packager).build()
+        assert packager.package.call_count == 2
+
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_uncacheable_dependencies(self, virtual_env, packager,
+                                      source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        packer = self.make_packer(virtual_env, packager)
+        virtual_env.fingerprint.return_value = None
+        packer.build()
+        packer = self.make_packer(virtual_env, packager)
+        virtual_env.fingerprint.return_value = None
+        packer.build()
+        assert packager.package.call_count == 2
+
+
+class TestPyLambdaPackerWatch(object):
+    @patch('plpacker.pylambdapacker.Watcher')
+    @patch('plpacker.pylambdapacker.IncrementalArchive')
+    @patch('plpacker.packager.Packager')
+    @patch('plpacker.virtualenv.VirtualEnv')
+    def test_installs_once(self, virtual_env, packager, archive, watcher,
+                           source_fs):
+        # pylint: disable=unused-argument,no-self-use,too-many-arguments
+        virtual_env.filesets = (FileSet('/home/foo/src/bar-project',
+                                        ['static/**']),)
+        packager.zip_file = '/home/foo/tmp/out.zip'
+        packager.jobs = 1
+        packager.cache = None
+        packager.compiler = None
+        packager.stripper = None
+        packager.compression = None
+        packer = PyLambdaPacker(virtual_env=virtual_env, packager=packager,
+                                filesets=(sentinel.fileset,))
+        packer.watch()
+
+        virtual_env.create.assert_called_once_with()
+        (zip_file, dependencies) = archive.call_args[0]
+        assert zip_file == '/home/foo/tmp/out.zip'
+        assert not os.path.exists(dependencies)
+        watcher.assert_called_with((sentinel.fileset,), archive.return_value)
+        watcher.return_value.run.assert_called_once_with()
@@ -0,0 +1,103 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+
+import pytest
+
+from plpacker.fileset import FileSet
+from plpacker.runtime import RuntimeProvided
+
+SITE_PACKAGES = '/home/foo/venv/site-packages'
+
+RUNTIMES = {'python3.8': ['boto3', 'python-dateutil']}
+
+
+def install(name, files, record=True):
+    dist_info = '{}.dist-info'.format(name)
+    rows = []
+    for (path, content) in files + [(dist_info + '/METADATA', 'meta')]:
+        full_path = os.path.join(SITE_PACKAGES, path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'w') as handle:
+            handle.write(content)
+        rows.append('{},sha256=x,{}'.format(path, len(content)))
+    if record:
+        rows += ['{}/RECORD,,'.format(dist_info), '../../bin/tool,,']
+        with open(os.path.join(SITE_PACKAGES, dist_info, 'RECORD'),
+                  'w') as handle:
+            handle.write('\n'.join(rows))
+
+
+@pytest.fixture
+def site_packages(source_fs):
+    # pylint: disable=unused-argument
+    install('boto3-1.9.0', [('boto3/__init__.py', 'x' * 10),
+                            ('boto3/data/s3.json', 'x' * 100)])
+    install('python_dateutil-2.8.0', [('dateutil/tz.py', 'x' * 20)],
+            record=False)
+    # Shares the `google` namespace with nothing provided.
+    install('google_auth-1.0', [('google/auth/__init__.py', 'x'),
+                                ('google/__init__.py', '')])
+    return SITE_PACKAGES
+
+
+@pytest.fixture
+def provided():
+    runtime_provided = RuntimeProvided(RUNTIMES)
+    runtime_provided._runtime = 'python3.8'  # noqa pylint: disable=protected-access
+    return runtime_provided
+
+
+class TestRuntimeProvided(object):
+    def test_runtime(self):
+        # pylint: disable=no-self-use
+        assert RuntimeProvided({}).runtime \
+            == 'python{}.{}'.format(*sys.version_info[:2])
+
+    def test_distributions(self, provided):
+        # pylint: disable=no-self-use,redefined-outer-name
+        assert provided.distributions() \
+            == frozenset(['boto3', 'python-dateutil'])
+
+    def test_unknown_runtime(self, provided):
+        # pylint: disable=no-self-use,redefined-outer-name
+        provided._runtime = 'python9.9'  # noqa pylint: disable=protected-access
+        with pytest.raises(ValueError) as info:
+            provided.distributions()
+        assert str(info.value).startswith(
+            'Unknown runtime "python9.9", expected one of: python3.8.')
+
+    def test_key(self, provided):
+        # pylint: disable=no-self-use,redefined-outer-name
+        other = RuntimeProvided({'python3.8': ['boto3']})
+        other._runtime = 'python3.8'  # noqa pylint: disable=protected-access
+        assert provided.key() != other.key()
+
+    def test_files(self, site_packages, provided):
+        # pylint: disable=no-self-use,redefined-outer-name
+        assert provided.files(site_packages) == set([
+            'boto3/__init__.py', 'boto3/data/s3.json',
+            'boto3-1.9.0.dist-info/METADATA',
+            'boto3-1.9.0.dist-info/RECORD',
+            # Without a `RECORD` only the `.dist-info` is known.
+            'python_dateutil-2.8.0.dist-info/METADATA'])
+
+    def test_report(self, site_packages, provided):
+        # pylint: disable=no-self-use,redefined-outer-name
+        size = os.path.getsize(
+            os.path.join(site_packages, 'boto3-1.9.0.dist-info/RECORD'))
+        assert provided.report(site_packages) == 10 + 100 + 4 + size + 4
+
+    def test_skipped_by_filesets(self, site_packages, provided):
+        # pylint: disable=no-self-use,redefined-outer-name
+        fileset = FileSet(site_packages, '**',
+                          skip=provided.files(site_packages))
+        assert sorted(fileset) == [
+            'dateutil/tz.py',
+            'google/__init__.py',
+            'google/auth/__init__.py',
+            'google_auth-1.0.dist-info/METADATA',
+            'google_auth-1.0.dist-info/RECORD']
@@ -0,0 +1,136 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import logging
+import os
+import socket
+import stat
+import threading
+
+try:
+    from unittest.mock import patch, MagicMock
+except ImportError:
+    from mock import patch, MagicMock
+
+import pytest
+
+from plpacker.client import request_build
+from plpacker.server import BuildServer, parse_serve_args
+from plpacker.utils import ordered_map
+
+
+@pytest.fixture(scope='function')
+def server(tmpdir):
+    instance = BuildServer(str(tmpdir.join('plp.sock')), workers=2)
+    thread = threading.Thread(target=instance.serve_forever)
+    thread.start()
+    yield instance
+    instance.shutdown()
+    thread.join()
+    instance.server_close()
+
+
+def fake_run(cli_args, cwd, **_):
+    logging.getLogger('plpacker.cli').warning('Building %s in %s',
+                                              cli_args.output, cwd)
+    return 0
+
+
+def fake_pooled_run(cli_args, cwd, **_):
+    # pylint: disable=unused-argument
+    def compress(name):
+        logging.getLogger('plpacker.packager').warning('Compressing %s', name)
+    list(ordered_map(compress, (('a.py',), ('b.py',)), 2))
+    return 0
+
+
+class TestBuildServer(object):
+    def test_builds_for_client(self, server):
+        # pylint: disable=redefined-outer-name, no-self-use
+        stream = io.StringIO()
+        with patch('plpacker.server.run', side_effect=fake_run) as run:
+            status = request_build(server.path, ['--output', 'out.zip'],
+                                   '/home/foo/src/bar-project', stream)
+        assert status == 0
+        assert stream.getvalue() == \
+            'WARNING - Building out.zip in /home/foo/src/bar-project\n'
+        assert run.call_args[1]['caches'] is server.caches
+
+    def test_build_failure(self, server):
+        # pylint: disable=redefined-outer-name, no-self-use
+        stream = io.StringIO()
+        with patch('plpacker.server.run', side_effect=RuntimeError('boom')):
+            status = request_build(server.path, [], '/tmp', stream)
+        assert status == 1
+        assert 'Build failed.' in stream.getvalue()
+
+    @pytest.mark.parametrize('argv', [['--watch'], ['--no-such-option']])
+    def test_rejected_arguments(self, server, argv):
+        # pylint: disable=redefined-outer-name, no-self-use
+        with patch('plpacker.server.run') as run:
+            status = request_build(server.path, argv, '/tmp', io.StringIO())
+        assert status == 2
+        assert not run.called
+
+    def test_sends_pool_thread_logs(self, server):
+        # pylint: disable=redefined-outer-name, no-self-use
+        stream = io.StringIO()
+        with patch('plpacker.server.run', side_effect=fake_pooled_run):
+            status = request_build(server.path, [], '/tmp', stream)
+        assert status == 0
+        assert sorted(stream.getvalue().splitlines()) == [
+            'WARNING - Compressing a.py', 'WARNING - Compressing b.py']
+
+    def test_sends_argument_errors(self, server):
+        # pylint: disable=redefined-outer-name, no-self-use
+        stream = io.StringIO()
+        status = request_build(server.path, ['--no-such-option'], '/tmp',
+                               stream)
+        assert status == 2
+        assert 'usage: ' in stream.getvalue()
+        assert 'unrecognized arguments: --no-such-option' \
+            in stream.getvalue()
+
+    @patch('plpacker.cli._virtual_env', MagicMock())
+    @patch('plpacker.cli._packer')
+    def test_ignores_own_config(self, packer, server, tmpdir, monkeypatch):
+        # pylint: disable=redefined-outer-name, no-self-use
+        tmpdir.join('daemon', 'py-lambda-packer.yaml').write(
+            'packager:\n  target: FROM_DAEMON_CWD.zip\n', ensure=True)
+        project = tmpdir.mkdir('project')
+        monkeypatch.chdir(str(tmpdir.join('daemon')))
+
+        status = request_build(server.path, [], str(project), io.StringIO())
+        assert status == 0
+        assert packer.call_args[0][0]['packager']['target'] \
+            == str(project.join('py-lambda-package.zip'))
+
+    def test_socket_is_private(self, server):
+        # pylint: disable=redefined-outer-name, no-self-use
+        assert stat.S_IMODE(os.stat(server.path).st_mode) == 0o600
+
+    def test_refuses_to_start_twice(self, server):
+        # pylint: disable=redefined-outer-name, no-self-use
+        with pytest.raises(RuntimeError):
+            BuildServer(server.path)
+
+    def test_removes_stale_socket(self, tmpdir):
+        # pylint: disable=no-self-use
+        path = str(tmpdir.join('plp.sock'))
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+
+        instance = BuildServer(path, workers=1)
+        instance.server_close()
+        assert not os.path.exists(path)
+
+
+class TestParseServeArgs(object):
+    def test_defaults(self):
+        # pylint: disable=no-self-use
+        args = parse_serve_args([])
+        assert args.socket.endswith('.sock')
+        assert args.workers == 4
+        assert args.memory_cache_size == 256 * 1024 ** 2
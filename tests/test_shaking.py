@@ -0,0 +1,103 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+
+import pytest
+
+from plpacker.shaking import TreeShaker
+
+
+def write(root, path, content=''):
+    path = os.path.join(root, path)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as handle:
+        handle.write(content)
+
+
+def install(site_packages, name, files):
+    dist_info = '{}.dist-info'.format(name)
+    for (path, content) in files:
+        write(site_packages, path, content)
+    write(site_packages, dist_info + '/RECORD',
+          '\n'.join([path + ',,' for (path, _) in files]
+                    + [dist_info + '/RECORD,,']))
+
+
+@pytest.fixture
+def project(tmpdir):
+    root = str(tmpdir.mkdir('project'))
+    site_packages = str(tmpdir.mkdir('site-packages'))
+    write(root, 'app.py', 'import json\nfrom os import path\n'
+          'from collections.abc import Mapping\n'
+          'from lib import helpers\n\n'
+          'def handler(event, context):\n'
+          '    import requests\n')
+    write(root, 'lib/__init__.py')
+    write(root, 'lib/helpers.py', 'from . import util\n')
+    write(root, 'lib/util.py', 'from urllib3.util import retry\n')
+    install(site_packages, 'requests-2.0', [
+        ('requests/__init__.py', 'from .api import get\n'),
+        ('requests/api.py', 'import chardet\nimport not_installed\n'),
+        ('requests/cacert.pem', 'certificates')])
+    install(site_packages, 'urllib3-1.0', [
+        ('urllib3/__init__.py', ''),
+        ('urllib3/util/__init__.py', ''),
+        ('urllib3/util/retry.py', '')])
+    install(site_packages, 'chardet-3.0', [('chardet/__init__.py', '')])
+    install(site_packages, 'numpy-1.0', [
+        ('numpy/__init__.py', 'x' * 100),
+        ('numpy/data.txt', 'y' * 10)])
+    install(site_packages, 'unused-1.0', [('unused.py', 'import numpy\n')])
+    write(site_packages, 'orphan.py')
+    return (root, site_packages)
+
+
+class TestTreeShaker(object):
+    def test_needs_handlers(self):
+        # pylint: disable=no-self-use
+        with pytest.raises(ValueError):
+            TreeShaker([])
+
+    def test_modules(self):
+        # pylint: disable=no-self-use
+        assert TreeShaker(['app.handler', 'jobs/nightly.run']).modules \
+            == ['app', 'jobs.nightly']
+
+    def test_key(self):
+        # pylint: disable=no-self-use
+        assert TreeShaker(['app.handler']).key() \
+            != TreeShaker(['app.handler'], keep=['numpy/**']).key()
+
+    def test_leaves_out_unimported(self, project):
+        # pylint: disable=no-self-use,redefined-outer-name
+        (root, site_packages) = project
+        shaker = TreeShaker(['app.handler'], project_dirs=[root])
+        assert shaker.analyse([site_packages]) > 0
+        assert shaker.files(site_packages) == set([
+            'numpy/__init__.py', 'numpy/data.txt',
+            'numpy-1.0.dist-info/RECORD',
+            'unused.py', 'unused-1.0.dist-info/RECORD'])
+
+    def test_keeps_globs(self, project):
+        # pylint: disable=no-self-use,redefined-outer-name
+        (root, site_packages) = project
+        shaker = TreeShaker(['app.handler'], keep=['numpy/*.txt'],
+                            project_dirs=[root])
+        shaker.analyse([site_packages])
+        assert 'numpy/data.txt' not in shaker.files(site_packages)
+        assert 'numpy/__init__.py' in shaker.files(site_packages)
+
+    def test_missing_handler(self, project):
+        # pylint: disable=no-self-use,redefined-outer-name
+        (root, site_packages) = project
+        shaker = TreeShaker(['nope.handler'], project_dirs=[root])
+        with pytest.raises(ValueError):
+            shaker.analyse([site_packages])
+
+    def test_nothing_before_analysis(self, project):
+        # pylint: disable=no-self-use,redefined-outer-name
+        (root, site_packages) = project
+        shaker = TreeShaker(['app.handler'], project_dirs=[root])
+        assert shaker.files(site_packages) == set()
@@ -0,0 +1,118 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+
+import pytest
+
+try:
+    from unittest.mock import patch, PropertyMock
+except ImportError:
+    from mock import patch, PropertyMock
+
+from plpacker.slimming import PROFILES, Slimming
+from plpacker.virtualenv import VirtualEnv
+
+SITE_PACKAGES = '/home/foo/venv/site-packages'
+
+
+def install(files):
+    for (path, size) in files:
+        path = os.path.join(SITE_PACKAGES, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as handle:
+            handle.write('x' * size)
+
+
+@pytest.fixture
+def site_packages(source_fs):
+    # pylint: disable=unused-argument
+    install([('botocore/__init__.py', 10),
+             ('botocore/data/s3/examples-1.json', 100),
+             ('botocore/tests/test_s3.py', 20),
+             ('botocore/__pycache__/__init__.cpython-38.pyc', 5),
+             ('botocore-1.0.dist-info/RECORD',
+              0),
+             ('botocore-1.0.dist-info/INSTALLER', 3),
+             ('Py_Foo-2.0.dist-info/top_level.txt', 0),
+             ('py_foo/__init__.py', 10),
+             ('py_foo/docs/index.rst', 50),
+             ('py_foo/speedups.c', 40)])
+    with open(os.path.join(SITE_PACKAGES, 'botocore-1.0.dist-info/RECORD'),
+              'w') as handle:
+        handle.write('botocore/__init__.py,sha256=abc,10\n'
+                     'botocore-1.0.dist-info/RECORD,,\n')
+    with open(os.path.join(SITE_PACKAGES,
+                           'Py_Foo-2.0.dist-info/top_level.txt'),
+              'w') as handle:
+        handle.write('py_foo\n')
+    return SITE_PACKAGES
+
+
+class TestFromConfig(object):
+    def test_none(self):
+        # pylint: disable=no-self-use
+        assert Slimming.from_config(None) is None
+
+    @pytest.mark.parametrize('name', sorted(PROFILES))
+    def test_profiles(self, name):
+        # pylint: disable=no-self-use
+        assert Slimming.from_config(name).rules == PROFILES[name]
+
+    def test_rules(self):
+        # pylint: disable=no-self-use
+        rules = {'*': {'tests': ['**/tests/**']}}
+        assert Slimming.from_config(rules).rules == rules
+
+    def test_unknown_profile(self):
+        # pylint: disable=no-self-use
+        with pytest.raises(ValueError):
+            Slimming.from_config('everything')
+
+    def test_key(self):
+        # pylint: disable=no-self-use
+        assert Slimming.from_config('safe').key() \
+            != Slimming.from_config('aggressive').key()
+
+
+class TestExcludes(object):
+    def test_by_distribution(self, site_packages):
+        # pylint: disable=no-self-use,redefined-outer-name
+        slimming = Slimming({'*': {'tests': ['**/tests/**']},
+                             'py-foo': {'docs': ['docs/**']},
+                             'BotoCore': {'examples': ['data/**/*.json']},
+                             'absent': {'docs': ['docs/**']}})
+        assert slimming.excludes(site_packages) == {
+            'tests': ['**/tests/**'],
+            'py-foo:docs': ['py_foo/docs/**'],
+            'BotoCore:examples': ['botocore/data/**/*.json'],
+            'absent:docs': []}
+
+    @patch.object(VirtualEnv, 'site_package_dirs', new_callable=PropertyMock)
+    def test_filesets(self, site_package_dirs, site_packages):
+        # pylint: disable=no-self-use,redefined-outer-name
+        site_package_dirs.return_value = [site_packages]
+        virtual_env = VirtualEnv(path='/home/foo/other-venv',
+                                 fileset_excludes=['*.dist-info/RECORD'],
+                                 slimming=Slimming.from_config('aggressive'))
+        (fileset,) = virtual_env.filesets
+        assert sorted(fileset) == [
+            'Py_Foo-2.0.dist-info/top_level.txt',
+            'botocore/__init__.py',
+            'py_foo/__init__.py']
+
+
+class TestReport(object):
+    def test_counts_first_rule(self, site_packages):
+        # pylint: disable=no-self-use,redefined-outer-name
+        slimming = Slimming({'*': {'docs': ['**/docs/**'],
+                                   'sources': ['**/*.c', '**/*.rst']}})
+        assert slimming.report(site_packages) == 90
+
+    def test_skips_excluded(self, site_packages):
+        # pylint: disable=no-self-use,redefined-outer-name
+        slimming = Slimming.from_config('aggressive')
+        assert slimming.report(site_packages,
+                               excludes=['botocore/**']) == 90 + 3
+        assert slimming.report(site_packages) == 90 + 100 + 20 + 5 + 3
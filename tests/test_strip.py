@@ -0,0 +1,103 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import struct
+import sys
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import pytest
+
+from plpacker.cache import FileCache
+from plpacker.fileset import file_stat
+from plpacker.strip import Stripper, is_shared_object
+
+# Stands in for `strip`, dropping the last 100 bytes of the file.
+FAKE_STRIP = ('import sys\n'
+              '(target, source) = sys.argv[-2:]\n'
+              'data = open(source, "rb").read()\n'
+              'open(target, "wb").write(data[:-100])\n')
+
+
+def elf(e_type, big_endian=False, size=1000):
+    header = b'\x7fELF\x02' + (b'\x02' if big_endian else b'\x01')
+    header += b'\x00' * 10
+    header += struct.pack(str('>H' if big_endian else '<H'), e_type)
+    return header + b'\x00' * (size - len(header))
+
+
+def write(root, name, content):
+    path = os.path.join(root, name)
+    with open(path, 'wb') as handle:
+        handle.write(content)
+    return (path, name, file_stat(os.stat(path)))
+
+
+@pytest.fixture
+def stripper():
+    return Stripper(strip=sys.executable, args=('-c', FAKE_STRIP))
+
+
+class TestIsSharedObject(object):
+    @pytest.mark.parametrize('content,expected', [
+        (elf(3), True),
+        (elf(3, big_endian=True), True),
+        (elf(2), False),
+        (b'\x7fELF', False),
+        (b'#!/bin/sh\n' * 10, False),
+    ])
+    def test_detects_by_header(self, tmpdir, content, expected):
+        # pylint: disable=no-self-use
+        (path, _, _) = write(str(tmpdir), 'file', content)
+        assert is_shared_object(path) is expected
+
+
+class TestStripper(object):
+    def test_strips_shared_objects(self, tmpdir, stripper):
+        # pylint: disable=no-self-use,redefined-outer-name
+        root = str(tmpdir)
+        entries = [write(root, 'ext.so', elf(3)),
+                   write(root, 'program', elf(2)),
+                   write(root, 'module.py', b'x' * 1000)]
+        stripped = list(stripper.strip_entries(entries, root))
+        assert [arcname for (_, arcname, _) in stripped] \
+            == ['ext.so', 'program', 'module.py']
+        assert stripped[0][0] != entries[0][0]
+        assert stripped[0][2].size == os.path.getsize(stripped[0][0]) == 900
+        assert stripped[1:] == entries[1:]
+
+    def test_caches_by_content(self, tmpdir, stripper):
+        # pylint: disable=no-self-use,redefined-outer-name
+        root = str(tmpdir)
+        stripper.cache = FileCache(os.path.join(root, 'cache'))
+        (first,) = stripper.strip_entries([write(root, 'a.so', elf(3))], root)
+        stripper.strip = 'no-such-strip'
+        stripper.args = ()
+        (second,) = stripper.strip_entries([write(root, 'b.so', elf(3))],
+                                           root)
+        # The tool is missing, nothing is stripped.
+        assert second[0] == os.path.join(root, 'b.so')
+
+        stripper.strip = sys.executable
+        stripper.args = ('-c', FAKE_STRIP)
+        (third,) = stripper.strip_entries([write(root, 'c.so', elf(3))], root)
+        assert third[0] == first[0]
+
+    @patch('plpacker.strip.hash_file')
+    def test_only_hashes_for_cache(self, hash_file, tmpdir, stripper):
+        # pylint: disable=no-self-use,redefined-outer-name
+        root = str(tmpdir)
+        list(stripper.strip_entries([write(root, 'a.so', elf(3))], root))
+        assert not hash_file.called
+
+    def test_keeps_failures(self, tmpdir):
+        # pylint: disable=no-self-use
+        root = str(tmpdir)
+        stripper = Stripper(strip=sys.executable,
+                            args=('-c', 'raise SystemExit(1)'))
+        entries = [write(root, 'ext.so', elf(3))]
+        assert list(stripper.strip_entries(entries, root)) == entries
@@ -0,0 +1,63 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import time
+
+import pytest
+
+from plpacker.utils import (build_context, clone_tree, current_build,
+                            ordered_map, tree_size)
+
+
+class TestOrderedMap(object):
+    @staticmethod
+    def slow_square(value):
+        # Later items finish first.
+        time.sleep((10 - value) / 1000.0)
+        return value * value
+
+    @pytest.mark.parametrize("jobs", [1, 2, 8])
+    def test_keeps_order(self, jobs):
+        results = ordered_map(self.slow_square,
+                              ((value,) for value in range(10)), jobs)
+        assert list(results) == [value * value for value in range(10)]
+
+    def test_is_lazy(self):
+        # pylint: disable=no-self-use
+        def explode():
+            yield (1,)
+            raise AssertionError('Consumed too eagerly.')
+
+        results = ordered_map(abs, explode(), 1)
+        assert next(results) == 1
+
+    @pytest.mark.parametrize("jobs", [1, 4])
+    def test_keeps_build(self, jobs):
+        # pylint: disable=no-self-use
+        assert current_build() is None
+        with build_context('build-1'):
+            results = ordered_map(lambda _: current_build(),
+                                  ((value,) for value in range(8)), jobs)
+            assert set(results) == set(['build-1'])
+        assert current_build() is None
+
+
+class TestCloneTree(object):
+    def test_clones(self, source_fs):
+        # pylint: disable=unused-argument, no-self-use
+        source_fs.create_file('/home/foo/src/bar-project/posts/a/new.html',
+                              contents='abc')
+        clone_tree('/home/foo/src/bar-project/posts', '/home/foo/tmp/posts')
+
+        with open('/home/foo/tmp/posts/a/new.html') as handle:
+            assert handle.read() == 'abc'
+        assert os.path.islink('/home/foo/tmp/posts/a/b/c/d/symlink-dir')
+        assert os.path.islink('/home/foo/tmp/posts/links/tef-90.html')
+        assert os.path.isfile('/home/foo/tmp/posts/bucket/link-03.html')
+
+    def test_tree_size(self, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file('/home/foo/tmp/a/one', contents='12345')
+        source_fs.create_file('/home/foo/tmp/a/b/two', contents='123')
+        assert tree_size('/home/foo/tmp/a') == 8
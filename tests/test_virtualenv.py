@@ -12,7 +12,9 @@ except ImportError:
 
 import pytest
 
+from plpacker.cache import EnvironmentCache
 from plpacker.virtualenv import VirtualEnv
+from plpacker.wheelhouse import Wheelhouse
 
 
 class TestVirtualEnvConstructor(object):
@@ -44,6 +46,36 @@ class TestVirtualEnvConstructor(object):
         assert os.path.exists(build_path)
 
 
+class TestVirtualEnvPipTarget(object):
+    def test_unknown_installer(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with pytest.raises(ValueError) as info:
+            VirtualEnv(installer='conda')
+        assert str(info.value) == ('Unknown installer "conda", expected one '
+                                   'of: virtualenv, pip-target, wheelhouse')
+
+    @patch.object(VirtualEnv, 'run')
+    def test_create(self, run_mock, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        build_path = '/home/foo/tmp/venv-Rg1x0'
+        venv = VirtualEnv(python='python3.6', path=build_path,
+                          packages=['Flask'], requirements=['reqs.txt'],
+                          installer='pip-target')
+        venv.create()
+
+        run_mock.assert_called_once_with([
+            'python3.6', '-m', 'pip', 'install',
+            '--target', '/home/foo/tmp/venv-Rg1x0/site-packages',
+            '-r', 'reqs.txt', 'Flask'])
+        assert venv.site_package_dirs == [
+            '/home/foo/tmp/venv-Rg1x0/site-packages']
+
+    def test_no_site_packages_before_create(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        venv = VirtualEnv(installer='pip-target')
+        assert venv.site_package_dirs == []
+
+
 class TestVirtualEnvCreate(object):
     @patch.object(VirtualEnv, 'run')
     def test_defaults(self, run_mock, source_fs, virtual_env):
@@ -90,6 +122,44 @@ class TestVirtualEnvCreate(object):
         assert call_kargs['cwd'] == build_path
 
 
+class TestVirtualEnvCreateCached(object):
+    @patch.object(VirtualEnv, 'fingerprint')
+    @patch.object(VirtualEnv, 'run')
+    def test_miss_then_hit(self, run_mock, fingerprint, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        fingerprint.return_value = 'abc'
+        cache = EnvironmentCache('/home/foo/tmp/cache')
+
+        def fake_virtualenv(args, cwd=None):
+            # pylint: disable=unused-argument
+            source_fs.create_file(
+                os.path.join(args[-1], 'lib', 'python3.6', 'site-packages',
+                             'mod.py'))
+        run_mock.side_effect = fake_virtualenv
+
+        first = VirtualEnv(cache=cache)
+        first.create()
+        assert run_mock.call_count == 1
+        assert cache.lookup('abc')
+
+        second = VirtualEnv(cache=cache)
+        second.create()
+        assert run_mock.call_count == 1
+        assert second.site_package_dirs == [os.path.join(
+            second.path, 'lib', 'python3.6', 'site-packages')]
+
+    @patch.object(VirtualEnv, 'fingerprint')
+    @patch.object(VirtualEnv, 'run')
+    def test_uncacheable(self, run_mock, fingerprint, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        fingerprint.return_value = None
+        cache = EnvironmentCache('/home/foo/tmp/cache')
+        VirtualEnv(cache=cache).create()
+        VirtualEnv(cache=cache).create()
+        assert run_mock.call_count == 2
+        assert not os.listdir(cache.path)
+
+
 class TestVirtualEnvInstall(object):
     def test_packages_or_reqs(self, source_fs, virtual_env):
         # pylint: disable=unused-argument,no-self-use
@@ -145,6 +215,142 @@ class TestVirtualEnvInstall(object):
                                 '-r', 'requirements-dev.txt']
 
 
+class TestVirtualEnvFingerprint(object):
+    @patch.object(VirtualEnv, 'interpreter_version')
+    def test_stable(self, interpreter_version, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        interpreter_version.return_value = '3.6.1'
+        source_fs.create_file('/home/foo/tmp/requirements.txt',
+                              contents='Flask==0.12\n')
+        first = VirtualEnv(packages=['boto3'],
+                           requirements=['/home/foo/tmp/requirements.txt'])
+        second = VirtualEnv(packages=['boto3'],
+                            requirements=['/home/foo/tmp/requirements.txt'])
+        assert first.fingerprint() == second.fingerprint()
+        assert len(first.fingerprint()) == 64
+        assert first.fingerprint() != VirtualEnv(
+            packages=['boto3'],
+            requirements=['/home/foo/tmp/requirements.txt'],
+            installer='pip-target').fingerprint()
+
+    @patch.object(VirtualEnv, 'interpreter_version')
+    def test_changes(self, interpreter_version, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        interpreter_version.return_value = '3.6.1'
+        source_fs.create_file('/home/foo/tmp/requirements.txt',
+                              contents='-r nested.txt\nFlask==0.12\n')
+        source_fs.create_file('/home/foo/tmp/nested.txt',
+                              contents='requests==2.18.1\n')
+        venv = VirtualEnv(requirements=['/home/foo/tmp/requirements.txt'])
+        before = venv.fingerprint()
+
+        with open('/home/foo/tmp/nested.txt', 'w') as handle:
+            handle.write('requests==2.18.2\n')
+        assert venv.fingerprint() != before
+
+        interpreter_version.return_value = '2.7.13'
+        assert VirtualEnv().fingerprint() != \
+            VirtualEnv(packages=['boto3']).fingerprint()
+
+    @pytest.mark.parametrize("option", [
+        '-r nested.txt', '-rnested.txt', '--requirement nested.txt',
+        '--requirement=nested.txt', '-c nested.txt', '-cnested.txt',
+        '--constraint=nested.txt', '--constraint = nested.txt',
+    ])
+    @patch.object(VirtualEnv, 'interpreter_version')
+    def test_follows_nested_files(self, interpreter_version, option,
+                                  source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        interpreter_version.return_value = '3.6.1'
+        source_fs.create_file('/home/foo/tmp/requirements.txt',
+                              contents=option + '\nFlask==0.12\n')
+        source_fs.create_file('/home/foo/tmp/nested.txt',
+                              contents='requests==2.18.1\n')
+        venv = VirtualEnv(requirements=['/home/foo/tmp/requirements.txt'])
+        before = venv.fingerprint()
+
+        with open('/home/foo/tmp/nested.txt', 'w') as handle:
+            handle.write('requests==2.18.2\n')
+        assert venv.fingerprint() != before
+
+    local_specs = (
+        (['.'], '', None),
+        ([], '-e .\n', None),
+        ([], '--editable=.\n', None),
+        ([], '# Comment\n../config\n', None),
+        ([], 'Flask==0.12  # Comment\n', True),
+    )
+
+    @pytest.mark.parametrize("packages,requirements,expected", local_specs)
+    @patch.object(VirtualEnv, 'interpreter_version')
+    def test_local_paths(self, interpreter_version, packages, requirements,
+                         expected, source_fs):
+        # pylint: disable=unused-argument,no-self-use,too-many-arguments
+        interpreter_version.return_value = '3.6.1'
+        os.chdir('/home/foo/src/bar-project')
+        source_fs.create_file('/home/foo/src/bar-project/requirements.txt',
+                              contents=requirements)
+        venv = VirtualEnv(packages=packages,
+                          requirements=['requirements.txt'])
+        assert bool(venv.fingerprint()) is bool(expected)
+
+
+class TestVirtualEnvWheelhouse(object):
+    @patch.object(VirtualEnv, 'run')
+    def test_installs_from_lock(self, run_mock, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        source_fs.create_file('/home/foo/wheels/requirements.lock')
+        build_path = '/home/foo/tmp/venv-Wh3l5'
+        venv = VirtualEnv(path=build_path, requirements=['reqs.txt'],
+                          wheelhouse=Wheelhouse('/home/foo/wheels'))
+        venv.create()
+
+        pip_path = os.path.join(build_path, 'bin', 'pip')
+        run_mock.assert_called_with([
+            pip_path, 'install', '--no-index',
+            '--find-links', '/home/foo/wheels', '--no-deps',
+            '-r', '/home/foo/wheels/requirements.lock'])
+
+    @patch('plpacker.virtualenv.install_wheels')
+    @patch.object(VirtualEnv, 'run')
+    def test_unpacks_wheels(self, run_mock, install_wheels, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        source_fs.create_file(
+            '/home/foo/wheels/requirements.lock',
+            contents='six==1.10.0  # six-1.10.0-py2.py3-none-any.whl\n')
+        build_path = '/home/foo/tmp/venv-Wh3l5'
+        venv = VirtualEnv(path=build_path, installer='wheelhouse',
+                          wheelhouse=Wheelhouse('/home/foo/wheels'))
+        venv.create()
+
+        run_mock.assert_not_called()
+        install_wheels.assert_called_once_with(
+            ['/home/foo/wheels/six-1.10.0-py2.py3-none-any.whl'],
+            '/home/foo/tmp/venv-Wh3l5/site-packages')
+        assert venv.site_package_dirs == [
+            '/home/foo/tmp/venv-Wh3l5/site-packages']
+
+    def test_unpacking_needs_wheelhouse(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with pytest.raises(ValueError):
+            VirtualEnv(installer='wheelhouse')
+
+    @patch.object(VirtualEnv, 'interpreter_version')
+    def test_fingerprint_follows_lock(self, interpreter_version, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        interpreter_version.return_value = '3.6.1'
+        source_fs.create_file('/home/foo/wheels/requirements.lock',
+                              contents='six==1.10.0\n')
+        venv = VirtualEnv(packages=['.'],
+                          wheelhouse=Wheelhouse('/home/foo/wheels'))
+        before = venv.fingerprint()
+        assert before
+
+        with open('/home/foo/wheels/requirements.lock', 'w') as handle:
+            handle.write('six==1.11.0\n')
+        assert venv.fingerprint() != before
+
+
 class TestVirtualEnvRun(object):
     @staticmethod
     def config_popen_mock(popen):
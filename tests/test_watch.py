@@ -0,0 +1,209 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import zipfile
+
+try:
+    from unittest.mock import patch, Mock
+except ImportError:
+    from mock import patch, Mock
+
+import pytest
+
+from plpacker.fileset import FileSet
+from plpacker.watch import IncrementalArchive, Inotify, Poller, Watcher
+
+PROJECT = '/home/foo/src/bar-project'
+OUTPUT = '/home/foo/tmp/out.zip'
+
+
+@pytest.fixture(scope='function')
+def dependencies(source_fs):
+    # pylint: disable=unused-argument
+    path = '/home/foo/tmp/deps.zip'
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('requests/__init__.py', 'import os')
+        archive.writestr('config.json', '{"from": "dependencies"}')
+    return path
+
+
+@pytest.fixture(scope='function')
+def project(source_fs):
+    # pylint: disable=unused-argument
+    return FileSet(PROJECT, includes=['static/**', 'lib/**'], lazy=True)
+
+
+def offsets():
+    with zipfile.ZipFile(OUTPUT, 'r') as archive:
+        assert not archive.testzip()
+        return dict((zinfo.filename, zinfo.header_offset)
+                    for zinfo in archive.infolist())
+
+
+def read(name):
+    with zipfile.ZipFile(OUTPUT, 'r') as archive:
+        return archive.read(name)
+
+
+class TestIncrementalArchive(object):
+    def test_dependencies_first(self, dependencies, project):
+        # pylint: disable=no-self-use
+        archive = IncrementalArchive(OUTPUT, dependencies)
+        assert archive.update(project.entries()) == (5, 0)
+        with zipfile.ZipFile(OUTPUT, 'r') as zip_file:
+            assert zip_file.namelist() == [
+                'requests/__init__.py',
+                'config.json',
+                'static/images/hello.png',
+                'static/images/large.gif',
+                'static/images/large.jpg',
+                'static/images/large.png',
+                'static/images/thumb.png']
+
+    def test_unchanged(self, dependencies, project):
+        # pylint: disable=no-self-use
+        archive = IncrementalArchive(OUTPUT, dependencies)
+        archive.update(project.entries())
+        mtime = os.stat(OUTPUT).st_mtime
+        with patch('plpacker.watch.compress_file') as compress_mock:
+            assert archive.update(project.entries()) == (0, 0)
+        assert not compress_mock.called
+        assert os.stat(OUTPUT).st_mtime == mtime
+
+    def test_rewrites_project_only(self, dependencies, project, source_fs):
+        # pylint: disable=no-self-use
+        archive = IncrementalArchive(OUTPUT, dependencies)
+        archive.update(project.entries())
+        before = offsets()
+
+        source_fs.create_file(PROJECT + '/lib/module.py', contents='x = 1')
+        with open(PROJECT + '/static/images/hello.png', 'w') as handle:
+            handle.write('png')
+        os.remove(PROJECT + '/static/images/thumb.png')
+        assert archive.update(project.entries()) == (2, 1)
+
+        after = offsets()
+        assert after['requests/__init__.py'] == \
+            before['requests/__init__.py']
+        assert after['config.json'] == before['config.json']
+        assert 'static/images/thumb.png' not in after
+        assert read('lib/module.py') == b'x = 1'
+        assert read('static/images/hello.png') == b'png'
+
+    def test_shorter_rewrite(self, dependencies, project, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file(PROJECT + '/lib/big.txt', contents='x' * 5000)
+        archive = IncrementalArchive(OUTPUT, dependencies)
+        archive.update(project.entries())
+        size = os.path.getsize(OUTPUT)
+
+        os.remove(PROJECT + '/lib/big.txt')
+        archive.update(project.entries())
+        assert os.path.getsize(OUTPUT) < size
+        assert 'lib/big.txt' not in offsets()
+
+    def test_project_shadows_dependencies(self, dependencies, source_fs):
+        # pylint: disable=no-self-use
+        project = FileSet(PROJECT, includes=['static/**', '*.json'],
+                          lazy=True)
+        archive = IncrementalArchive(OUTPUT, dependencies)
+        archive.update(project.entries())
+        assert read('config.json') == b''
+        assert list(offsets()).count('config.json') == 1
+
+        os.remove(PROJECT + '/config.json')
+        archive.update(project.entries())
+        assert read('config.json') == b'{"from": "dependencies"}'
+
+    def test_rewrites_when_tampered_with(self, dependencies, project):
+        # pylint: disable=no-self-use
+        archive = IncrementalArchive(OUTPUT, dependencies)
+        archive.update(project.entries())
+        os.remove(OUTPUT)
+        archive.update(project.entries())
+        assert len(offsets()) == 7
+
+    def test_rewrites_when_replaced(self, dependencies, project):
+        # pylint: disable=no-self-use
+        archive = IncrementalArchive(OUTPUT, dependencies)
+        archive.update(project.entries())
+        size = os.path.getsize(OUTPUT)
+        with open(OUTPUT, 'wb') as handle:
+            handle.write(b'x' * size)
+        os.utime(OUTPUT, (1, 1))
+        # Nothing changed in the project, the archive is written again.
+        assert archive.update(project.entries()) == (0, 0)
+        assert len(offsets()) == 7
+
+    def test_keeps_its_dependencies(self, dependencies, project):
+        # pylint: disable=no-self-use
+        with IncrementalArchive(OUTPUT, dependencies) as archive:
+            os.remove(dependencies)
+            archive.update(project.entries())
+            assert read('config.json') == b'{"from": "dependencies"}'
+            private = archive.dependencies
+        assert not os.path.exists(private)
+
+
+class TestWatcher(object):
+    def test_lazy_only(self, dependencies):
+        # pylint: disable=no-self-use
+        with pytest.raises(ValueError):
+            Watcher([FileSet(PROJECT, includes=['**'])],
+                    IncrementalArchive(OUTPUT, dependencies))
+
+    def test_skips_archive(self, dependencies, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        output = PROJECT + '/out.zip'
+        watcher = Watcher([FileSet(PROJECT, includes=['*'], lazy=True)],
+                          IncrementalArchive(output, dependencies))
+        assert watcher.update() == (2, 0)
+        assert watcher.update() == (0, 0)
+
+    @patch.object(Watcher, '_monitor')
+    def test_run(self, monitor, dependencies, project):
+        # pylint: disable=no-self-use
+        monitor.return_value.wait.side_effect = [True, False,
+                                                 KeyboardInterrupt]
+        watcher = Watcher([project], IncrementalArchive(OUTPUT, dependencies),
+                          delay=0)
+        watcher.update = Mock(return_value=(0, 0))
+        with pytest.raises(KeyboardInterrupt):
+            watcher.run()
+        assert watcher.update.call_count == 2
+        monitor.return_value.close.assert_called_with()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='inotify is Linux only')
+class TestInotify(object):
+    def test_notices_changes(self, tmpdir):
+        # pylint: disable=no-self-use
+        root = str(tmpdir)
+        monitor = Inotify()
+        try:
+            monitor.watch_tree(root)
+            assert not monitor.wait(0)
+
+            tmpdir.join('new.txt').write('new')
+            assert monitor.wait(1)
+            while monitor.wait(0):
+                pass
+
+            # New directories are watched too.
+            tmpdir.mkdir('sub')
+            assert monitor.wait(1)
+            while monitor.wait(0):
+                pass
+            tmpdir.join('sub', 'new.txt').write('new')
+            assert monitor.wait(1)
+        finally:
+            monitor.close()
+
+
+def test_poller():
+    poller = Poller(0)
+    assert not poller.wait(0)
+    assert poller.wait()
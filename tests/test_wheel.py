@@ -0,0 +1,84 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import stat
+from zipfile import ZipFile, ZipInfo
+
+import pytest
+
+from plpacker.wheel import install_wheel, install_wheels
+
+
+def make_wheel(path, name, files):
+    record = []
+    with ZipFile(path, 'w') as archive:
+        for (filename, content) in files:
+            zinfo = ZipInfo(filename)
+            zinfo.external_attr = (stat.S_IFREG | 0o644) << 16
+            archive.writestr(zinfo, content)
+            record.append('{},sha256=abc,{}'.format(filename, len(content)))
+        record.append('{}-1.0.dist-info/RECORD,,'.format(name))
+        archive.writestr('{}-1.0.dist-info/RECORD'.format(name),
+                         '\n'.join(record) + '\n')
+
+
+class TestInstallWheel(object):
+    def test_layout(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        make_wheel('/home/foo/tmp/foo-1.0-py3-none-any.whl', 'foo', (
+            ('foo/__init__.py', 'x = 1'),
+            ('foo-1.0.dist-info/METADATA', 'Name: foo'),
+            ('foo-1.0.data/platlib/_foo.so', 'ELF'),
+            ('foo-1.0.data/purelib/foo_extra.py', 'y = 2'),
+            ('foo-1.0.data/scripts/foo-cli', '#!python'),
+        ))
+        install_wheel('/home/foo/tmp/foo-1.0-py3-none-any.whl',
+                      '/home/foo/tmp/site')
+
+        found = []
+        for (dirpath, _, filenames) in os.walk('/home/foo/tmp/site'):
+            found.extend(os.path.relpath(os.path.join(dirpath, filename),
+                                         '/home/foo/tmp/site')
+                         for filename in filenames)
+        assert sorted(found) == [
+            '_foo.so',
+            'foo-1.0.dist-info/INSTALLER',
+            'foo-1.0.dist-info/METADATA',
+            'foo-1.0.dist-info/RECORD',
+            'foo/__init__.py',
+            'foo_extra.py']
+
+        with open('/home/foo/tmp/site/foo-1.0.dist-info/RECORD') as handle:
+            assert handle.read().splitlines() == [
+                'foo/__init__.py,sha256=abc,5',
+                'foo-1.0.dist-info/METADATA,sha256=abc,9',
+                '_foo.so,sha256=abc,3',
+                'foo_extra.py,sha256=abc,5',
+                'foo-1.0.dist-info/RECORD,,',
+                'foo-1.0.dist-info/INSTALLER,,']
+        assert os.stat('/home/foo/tmp/site/foo/__init__.py').st_mode \
+            & 0o777 == 0o644
+
+    def test_rejects_escaping_paths(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        make_wheel('/home/foo/tmp/bad-1.0-py3-none-any.whl', 'bad', (
+            ('../../evil.py', 'x = 1'),
+        ))
+        with pytest.raises(ValueError):
+            install_wheel('/home/foo/tmp/bad-1.0-py3-none-any.whl',
+                          '/home/foo/tmp/site')
+
+    @pytest.mark.parametrize("jobs", [1, 4])
+    def test_install_wheels(self, source_fs, jobs):
+        # pylint: disable=unused-argument,no-self-use
+        wheels = []
+        for name in ('aaa', 'bbb', 'ccc'):
+            path = '/home/foo/tmp/{}-1.0-py3-none-any.whl'.format(name)
+            make_wheel(path, name, (('{}/__init__.py'.format(name), ''),))
+            wheels.append(path)
+        install_wheels(wheels, '/home/foo/tmp/site', jobs)
+
+        assert sorted(os.listdir('/home/foo/tmp/site')) == [
+            'aaa', 'aaa-1.0.dist-info', 'bbb', 'bbb-1.0.dist-info',
+            'ccc', 'ccc-1.0.dist-info']
@@ -0,0 +1,125 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import pytest
+
+from plpacker.wheelhouse import Wheelhouse, WHEEL_FILE_RE
+
+
+class TestWheelFileRe(object):
+    wheel_files = (
+        ('Flask-0.12.2-py2.py3-none-any.whl', 'Flask', '0.12.2'),
+        ('numpy-1.13.1-cp36-cp36m-manylinux1_x86_64.whl', 'numpy', '1.13.1'),
+        ('six-1.10.0-1-py2.py3-none-any.whl', 'six', '1.10.0'),
+    )
+
+    @pytest.mark.parametrize("filename,name,version", wheel_files)
+    def test_matches(self, filename, name, version):
+        # pylint: disable=no-self-use
+        match = WHEEL_FILE_RE.match(filename)
+        assert match.group('name') == name
+        assert match.group('version') == version
+
+
+class TestWheelhouseFill(object):
+    @staticmethod
+    def fake_pip_wheel(source_fs, *wheels):
+        def run(args, cwd=None):
+            # pylint: disable=unused-argument
+            wheel_dir = args[args.index('--wheel-dir') + 1]
+            for wheel in wheels:
+                source_fs.create_file(os.path.join(wheel_dir, wheel))
+        return run
+
+    def test_needs_something(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with pytest.raises(RuntimeError):
+            Wheelhouse('/home/foo/tmp/wheels').fill()
+
+    @patch('plpacker.wheelhouse.run_command')
+    def test_fill_writes_lock(self, run_command, source_fs):
+        run_command.side_effect = self.fake_pip_wheel(
+            source_fs,
+            'Flask-0.12.2-py2.py3-none-any.whl',
+            'click-6.7-py2.py3-none-any.whl')
+        wheelhouse = Wheelhouse('/home/foo/tmp/wheels', python='python3.6')
+        wheelhouse.fill(packages=['Flask'], requirements=['reqs.txt'])
+
+        args = run_command.call_args[0][0]
+        assert args[0:4] == ['python3.6', '-m', 'pip', 'wheel']
+        assert args[-3:] == ['-r', 'reqs.txt', 'Flask']
+        with open(wheelhouse.lock_path) as handle:
+            assert handle.read() == (
+                'Flask==0.12.2  # Flask-0.12.2-py2.py3-none-any.whl\n'
+                'click==6.7  # click-6.7-py2.py3-none-any.whl\n')
+        assert sorted(os.listdir('/home/foo/tmp/wheels')) == [
+            'Flask-0.12.2-py2.py3-none-any.whl',
+            'click-6.7-py2.py3-none-any.whl',
+            'requirements.lock']
+
+    @patch('plpacker.wheelhouse.run_command')
+    def test_lock_only_has_latest_fill(self, run_command, source_fs):
+        wheelhouse = Wheelhouse('/home/foo/tmp/wheels')
+        run_command.side_effect = self.fake_pip_wheel(
+            source_fs, 'six-1.10.0-py2.py3-none-any.whl')
+        wheelhouse.fill(packages=['six==1.10.0'])
+        run_command.side_effect = self.fake_pip_wheel(
+            source_fs, 'six-1.11.0-py2.py3-none-any.whl')
+        wheelhouse.fill(packages=['six==1.11.0'])
+
+        with open(wheelhouse.lock_path) as handle:
+            assert handle.read() == \
+                'six==1.11.0  # six-1.11.0-py2.py3-none-any.whl\n'
+
+
+class TestWheelhouseInstall(object):
+    def test_unfilled(self, source_fs):
+        # pylint: disable=unused-argument,no-self-use
+        with pytest.raises(RuntimeError) as info:
+            Wheelhouse('/home/foo/tmp').install_args()
+        assert 'Wheelhouse has not been filled' in str(info.value)
+        with pytest.raises(RuntimeError) as info:
+            Wheelhouse('/home/foo/tmp').fingerprint()
+        assert 'Wheelhouse has not been filled' in str(info.value)
+
+    def test_offline_args(self, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file('/home/foo/tmp/requirements.lock')
+        assert Wheelhouse('/home/foo/tmp').install_args() == [
+            '--no-index', '--find-links', '/home/foo/tmp', '--no-deps',
+            '-r', '/home/foo/tmp/requirements.lock']
+
+    def test_locked_wheels(self, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file(
+            '/home/foo/tmp/requirements.lock',
+            contents=('Flask==0.12.2  # Flask-0.12.2-py2.py3-none-any.whl\n'
+                      'zope.interface==4.4.2\n'))
+        source_fs.create_file(
+            '/home/foo/tmp/zope.interface-4.4.2-cp36-cp36m-linux_x86_64.whl')
+        source_fs.create_file(
+            '/home/foo/tmp/zope.interface-4.4.1-cp36-cp36m-linux_x86_64.whl')
+
+        assert Wheelhouse('/home/foo/tmp').locked_wheels() == [
+            '/home/foo/tmp/Flask-0.12.2-py2.py3-none-any.whl',
+            '/home/foo/tmp/zope.interface-4.4.2-cp36-cp36m-linux_x86_64.whl']
+
+    def test_fingerprint(self, source_fs):
+        # pylint: disable=no-self-use
+        source_fs.create_file('/home/foo/tmp/requirements.lock',
+                              contents='six==1.10.0\n')
+        source_fs.create_file('/home/foo/tmp/six-1.10.0-py2.py3-none-any.whl',
+                              contents='a')
+        wheelhouse = Wheelhouse('/home/foo/tmp')
+        before = wheelhouse.fingerprint()
+        with open('/home/foo/tmp/six-1.10.0-py2.py3-none-any.whl', 'w') \
+                as handle:
+            handle.write('ab')
+        assert wheelhouse.fingerprint() != before